@@ -0,0 +1,311 @@
+import contextlib
+import functools
+import time
+from urllib.parse import quote
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from metrics import REGISTRY
+from services import cache, corrector, facets, fallback, suggester
+from services.aio import (
+    AsyncGenreRepository,
+    AsyncMovieRepository,
+    AsyncPersonRepository,
+)
+from services.export import astream
+from services.singleflight import AsyncSingleFlight
+from services.telemetry import observe_request, route, tracer
+from settings import (
+    BATCH_MAX_IDS,
+    COALESCE_ENABLED,
+    ES_GENRES_INDEX_NAME,
+    ES_INDEX_NAME,
+    ES_MAX_CONCURRENCY,
+    ES_MAX_CONNECTIONS,
+    ES_PERSONS_INDEX_NAME,
+    ES_TIMEOUT,
+    ES_URL,
+    EXPORT_BATCH_SIZE,
+    MSEARCH_MAX_QUERIES,
+    SERVER_HOST,
+    SERVER_PORT,
+    SUGGEST_MAX_LIMIT,
+)
+from validation import (
+    ValidationError,
+    is_cursor_request,
+    movies_batch_params,
+    movies_cursor_params,
+    movies_export_params,
+    movies_list_params,
+    movies_msearch_params,
+    page_params,
+    person_films_params,
+    persons_list_params,
+    suggest_params,
+)
+
+
+flights = AsyncSingleFlight() if COALESCE_ENABLED else None
+movie_service = AsyncMovieRepository(
+    url=ES_URL,
+    index=ES_INDEX_NAME,
+    cache=cache,
+    flights=flights,
+    corrector=corrector,
+    max_connections=ES_MAX_CONNECTIONS,
+    max_concurrency=ES_MAX_CONCURRENCY,
+    timeout=ES_TIMEOUT,
+    fallback=fallback,
+)
+person_service = AsyncPersonRepository(
+    url=ES_URL,
+    index=ES_PERSONS_INDEX_NAME,
+    cache=cache,
+    flights=flights,
+    max_connections=ES_MAX_CONNECTIONS,
+    max_concurrency=ES_MAX_CONCURRENCY,
+    timeout=ES_TIMEOUT,
+)
+genre_service = AsyncGenreRepository(
+    url=ES_URL,
+    index=ES_GENRES_INDEX_NAME,
+    cache=cache,
+    flights=flights,
+    max_connections=ES_MAX_CONNECTIONS,
+    max_concurrency=ES_MAX_CONCURRENCY,
+    timeout=ES_TIMEOUT,
+)
+
+
+async def movies_list(request: Request) -> Response:
+    try:
+        if is_cursor_request(request.query_params):
+            params = movies_cursor_params(request.query_params)
+        else:
+            params = movies_list_params(request.query_params)
+    except ValidationError as error:
+        return Response(error.body, status_code=422, media_type="text/html")
+    did_you_mean = None
+    if "cursor" in params:
+        result = await movie_service.get_page(**params)
+    else:
+        result, did_you_mean = await movie_service.search(**params)
+    if result is None:
+        raise HTTPException(404)
+    headers = {"X-Did-You-Mean": quote(did_you_mean)} if did_you_mean else None
+    return JSONResponse(result, headers=headers)
+
+
+async def movies_batch(request: Request) -> Response:
+    try:
+        params = movies_batch_params(request.query_params, max_ids=BATCH_MAX_IDS)
+    except ValidationError as error:
+        return Response(error.body, status_code=422, media_type="text/html")
+    result = await movie_service.get_many(**params)
+    if result is None:
+        raise HTTPException(404)
+    return JSONResponse(result)
+
+
+async def movies_msearch(request: Request) -> Response:
+    try:
+        body = await request.json()
+    except ValueError:
+        body = None
+    try:
+        params = movies_msearch_params(body, max_queries=MSEARCH_MAX_QUERIES)
+    except ValidationError as error:
+        return Response(error.body, status_code=422, media_type="text/html")
+    result = await movie_service.msearch(**params)
+    if result is None:
+        raise HTTPException(404)
+    return JSONResponse(result)
+
+
+async def movies_export(request: Request) -> Response:
+    try:
+        params = movies_export_params(request.query_params)
+    except ValidationError as error:
+        return Response(error.body, status_code=422, media_type="text/html")
+    pages = await movie_service.export(
+        fields=params["fields"], batch_size=EXPORT_BATCH_SIZE
+    )
+    if pages is None:
+        raise HTTPException(404)
+    return StreamingResponse(
+        astream(pages, compress=params["compress"]),
+        media_type="application/x-ndjson",
+        headers={"Content-Encoding": "gzip"} if params["compress"] else None,
+    )
+
+
+async def movies_facets(request: Request) -> Response:
+    if facets is None:
+        raise HTTPException(404)
+    await movie_service.refresh_generation(facets.generation)
+    result = facets.get(fetch=False)
+    if result is None:
+        raise HTTPException(404)
+    return JSONResponse(result)
+
+
+async def movies_detail(request: Request) -> Response:
+    result = await movie_service.get(id=request.path_params["movie_id"])
+    if result is None:
+        raise HTTPException(404)
+    return JSONResponse(result)
+
+
+async def persons_list(request: Request) -> Response:
+    try:
+        params = persons_list_params(request.query_params)
+    except ValidationError as error:
+        return Response(error.body, status_code=422, media_type="text/html")
+    result = await person_service.search(**params)
+    if result is None:
+        raise HTTPException(404)
+    return JSONResponse(result)
+
+
+async def persons_detail(request: Request) -> Response:
+    result = await person_service.get(id=request.path_params["person_id"])
+    if result is None:
+        raise HTTPException(404)
+    return JSONResponse(result)
+
+
+async def persons_films(request: Request) -> Response:
+    try:
+        params = person_films_params(request.query_params)
+    except ValidationError as error:
+        return Response(error.body, status_code=422, media_type="text/html")
+    result = await person_service.films(id=request.path_params["person_id"], **params)
+    if result is None:
+        raise HTTPException(404)
+    return JSONResponse(result)
+
+
+async def genres_list(request: Request) -> Response:
+    try:
+        params = page_params(request.query_params, limit=100)
+    except ValidationError as error:
+        return Response(error.body, status_code=422, media_type="text/html")
+    result = await genre_service.get_multi(**params)
+    if result is None:
+        raise HTTPException(404)
+    return JSONResponse(result)
+
+
+async def genres_detail(request: Request) -> Response:
+    try:
+        params = page_params(request.query_params)
+    except ValidationError as error:
+        return Response(error.body, status_code=422, media_type="text/html")
+    result = await genre_service.get(id=request.path_params["genre_id"], **params)
+    if result is None:
+        raise HTTPException(404)
+    return JSONResponse(result)
+
+
+async def suggest(request: Request) -> Response:
+    try:
+        params = suggest_params(request.query_params, max_limit=SUGGEST_MAX_LIMIT)
+    except ValidationError as error:
+        return Response(error.body, status_code=422, media_type="text/html")
+    if suggester is None:
+        raise HTTPException(404)
+    await movie_service.refresh_generation(suggester.generation)
+    result = suggester.suggest(**params, fetch=False)
+    if result is None:
+        raise HTTPException(404)
+    return JSONResponse(result)
+
+
+async def cache_stats(request: Request) -> Response:
+    if cache is None:
+        raise HTTPException(404)
+    return JSONResponse(cache.stats(fetch=False))
+
+
+async def coalescing_stats(request: Request) -> Response:
+    if flights is None:
+        raise HTTPException(404)
+    return JSONResponse(flights.stats())
+
+
+async def metrics(request: Request) -> Response:
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+def instrumented(endpoint):
+    """Records latency, status and response size of the endpoint, sampled traces"""
+    name = endpoint.__name__
+
+    @functools.wraps(endpoint)
+    async def wrapper(request: Request) -> Response:
+        token = route.set(name)
+        start = time.perf_counter()
+        status, size = 500, None
+        try:
+            with tracer.trace(name, path=request.url.path):
+                response = await endpoint(request)
+            status = response.status_code
+            if not isinstance(response, StreamingResponse):
+                size = len(response.body)
+            return response
+        except HTTPException as error:
+            status = error.status_code
+            raise
+        finally:
+            observe_request(name, status, time.perf_counter() - start, size)
+            route.reset(token)
+
+    return wrapper
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: Starlette):
+    yield
+    for service in (movie_service, person_service, genre_service):
+        await service.aclose()
+
+
+def routes(path: str, endpoint, methods: tuple[str, ...] = ("GET",)) -> list[Route]:
+    """Same as strict_slashes=False in Flask: served with and without a trailing slash"""
+    endpoint = instrumented(endpoint)
+    return [
+        Route(path, endpoint, methods=list(methods)),
+        Route(f"{path}/", endpoint, methods=list(methods)),
+    ]
+
+
+app = Starlette(
+    routes=[
+        *routes("/api/v1/movies", movies_list),
+        *routes("/api/v1/movies/batch", movies_batch),
+        *routes("/api/v1/movies/msearch", movies_msearch, methods=("POST",)),
+        *routes("/api/v1/movies/export", movies_export),
+        *routes("/api/v1/movies/facets", movies_facets),
+        *routes("/api/v1/movies/{movie_id}", movies_detail),
+        *routes("/api/v1/persons", persons_list),
+        *routes("/api/v1/persons/{person_id}", persons_detail),
+        *routes("/api/v1/persons/{person_id}/films", persons_films),
+        *routes("/api/v1/genres", genres_list),
+        *routes("/api/v1/genres/{genre_id}", genres_detail),
+        *routes("/api/v1/suggest", suggest),
+        *routes("/api/v1/cache/stats", cache_stats),
+        *routes("/api/v1/coalescing/stats", coalescing_stats),
+        Route("/metrics", metrics),
+    ],
+    lifespan=lifespan,
+)
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host=SERVER_HOST, port=SERVER_PORT)
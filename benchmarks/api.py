@@ -0,0 +1,217 @@
+"""
+API latency under concurrent load: p50/p90/p99 latency and requests per
+second of the /api/v1/movies routes. The catalog is loaded into a fake
+Elasticsearch process, the API server runs in another process and
+`--concurrency` client threads send requests for `--duration` seconds
+per scenario.
+
+    python -m benchmarks.catalog bench.sqlite --films 20000
+    python -m benchmarks.api bench.sqlite --server flask --concurrency 16
+"""
+
+import argparse
+import contextlib
+import multiprocessing
+import os
+import random
+import socket
+import sqlite3
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator
+
+import requests
+
+from etl_script import ESLoader, SQLite2ESTransformer, SQLiteExtractor
+
+from .catalog import WORDS
+from .fake_es import spawn
+from .report import save
+
+# Scenario -> request path made from a random generator and the film ids
+SCENARIOS: dict[str, Callable[[random.Random, list[str]], str]] = {
+    "list": lambda rng, ids: f"/api/v1/movies?page={rng.randint(1, 20)}&limit=50",
+    "list_sorted": lambda rng, ids: (
+        f"/api/v1/movies?page={rng.randint(1, 20)}&limit=50"
+        "&sort=imdb_rating&sort_order=desc"
+    ),
+    "search": lambda rng, ids: f"/api/v1/movies?search={rng.choice(WORDS)}&limit=20",
+    "detail": lambda rng, ids: f"/api/v1/movies/{rng.choice(ids)}",
+    "batch": lambda rng, ids: "/api/v1/movies/batch?ids="
+    + ",".join(rng.sample(ids, 10)),
+}
+
+
+def load_catalog(db_path: str, url: str) -> list[str]:
+    """Load all films into Elasticsearch at `url`, returns their ids"""
+    ids = []
+    loader = ESLoader(url=url, index="movies")
+    transformer = SQLite2ESTransformer()
+    with contextlib.closing(sqlite3.connect(db_path)) as connection:
+        for bulk in SQLiteExtractor(connection=connection).bulk_generator(1000):
+            records = transformer.transform(bulk)
+            loader.bulk_load(records)
+            ids.extend(record.id for record in records)
+    return ids
+
+
+def _serve(server: str, env: dict[str, str], ports: multiprocessing.Queue) -> None:
+    # Settings are read on import
+    os.environ.update(env)
+    sys.stdout = open(os.devnull, "w")
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    ports.put(sock.getsockname()[1])
+    if server == "asgi":
+        import uvicorn
+
+        from asgi_server import app
+
+        config = uvicorn.Config(app, log_level="warning", access_log=False)
+        uvicorn.Server(config).run(sockets=[sock])
+    else:
+        import logging
+
+        from werkzeug.serving import make_server
+
+        from server import app
+
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        port = sock.getsockname()[1]
+        sock.close()
+        make_server("127.0.0.1", port, app, threaded=True).serve_forever()
+
+
+@contextlib.contextmanager
+def api_server(server: str, env: dict[str, str]) -> Iterator[str]:
+    """API server in a child process, yields its url once it answers"""
+    ports = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=_serve, args=(server, env, ports), daemon=True
+    )
+    process.start()
+    try:
+        url = f"http://127.0.0.1:{ports.get(timeout=30)}"
+        for _ in range(100):
+            with contextlib.suppress(requests.ConnectionError):
+                requests.get(f"{url}/api/v1/movies?limit=1", timeout=5)
+                break
+            time.sleep(0.1)
+        yield url
+    finally:
+        process.terminate()
+        process.join()
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    return sorted_values[
+        min(len(sorted_values) - 1, int(len(sorted_values) * fraction))
+    ]
+
+
+def measure(
+    url: str,
+    make_path: Callable[[random.Random, list[str]], str],
+    ids: list[str],
+    concurrency: int,
+    duration: float,
+    seed: int,
+) -> dict:
+    latencies, errors = [], 0
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(number: int) -> None:
+        nonlocal errors
+        rng = random.Random(seed + number)
+        session = requests.Session()
+        own, failed = [], 0
+        while time.perf_counter() < deadline:
+            path = make_path(rng, ids)
+            start = time.perf_counter()
+            try:
+                response = session.get(url + path, timeout=30)
+                ok = response.status_code == 200
+            except requests.RequestException:
+                ok = False
+            own.append(time.perf_counter() - start)
+            failed += not ok
+        with lock:
+            latencies.extend(own)
+            errors += failed
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(client, range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p90_ms": percentile(latencies, 0.9) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("db_path")
+    parser.add_argument("--server", choices=("flask", "asgi"), default="flask")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--cache", action="store_true", help="enable response cache")
+    parser.add_argument(
+        "--scenarios", default=",".join(SCENARIOS), help="comma separated"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--output", help="JSON file, a new one in benchmark-results/ by default"
+    )
+    args = parser.parse_args()
+    scenarios = args.scenarios.split(",")
+
+    results = {}
+    with spawn() as es_url:
+        ids = load_catalog(args.db_path, es_url)
+        env = {
+            "ES_URL": es_url,
+            "ES_INDEX_NAME": "movies",
+            "CACHE_ENABLED": str(args.cache).lower(),
+            "SUGGEST_FILE": "",
+        }
+        with api_server(args.server, env) as url:
+            for name in scenarios:
+                results[name] = result = measure(
+                    url,
+                    SCENARIOS[name],
+                    ids,
+                    args.concurrency,
+                    args.duration,
+                    args.seed,
+                )
+                print(
+                    f"{name:>12}: {result['rps']:>8.0f} rps  "
+                    f"p50 {result['p50_ms']:>7.2f} ms  "
+                    f"p99 {result['p99_ms']:>7.2f} ms  "
+                    f"errors {result['errors']}"
+                )
+    params = {
+        "db_path": args.db_path,
+        "films": len(ids),
+        "server": args.server,
+        "concurrency": args.concurrency,
+        "duration": args.duration,
+        "cache": args.cache,
+        "seed": args.seed,
+    }
+    print(f"saved to {save('api', params, results, args.output)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Autocomplete benchmark: build time, memory and top-k completion latency
+of prefix_tree.Trie on synthetic titles and person names, against a
+dict-per-character trie like the one it replaced.
+
+    python -m benchmarks.autocomplete --keys 500000 --k 10
+"""
+
+import argparse
+import random
+import time
+import tracemalloc
+
+from prefix_tree import Trie
+
+WORDS = (
+    "star night house black last dark love blood city dead king girl man "
+    "world life story time lost secret road war game home day river moon "
+    "fire summer winter ghost dream heart shadow island return legend"
+).split()
+NAMES = (
+    "john mary james anna robert olga michael elena david irina thomas "
+    "peter sofia george maria alex nina paul kate ivan lena mark"
+).split()
+
+
+def make_keys(count: int, rng: random.Random) -> dict[str, float]:
+    """Key -> rating, like the titles and person names of the ETL output"""
+    keys = {}
+    while len(keys) < count:
+        if rng.random() < 0.5:
+            words = rng.choices(WORDS, k=rng.randint(1, 4))
+            key = " ".join(words) + (
+                f" {rng.randint(2, 9)}" if rng.random() < 0.3 else ""
+            )
+        else:
+            key = f"{rng.choice(NAMES)} {rng.choice(NAMES)}{rng.randint(0, 99999)}"
+        keys[key] = round(rng.uniform(1, 10), 1)
+    return keys
+
+
+class ReferenceTrie:
+    """Node object plus dict per character, top-k by a full subtree walk"""
+
+    def __init__(self) -> None:
+        self.prefixes = {}
+        self.score = None
+
+    def insert(self, word: str, score: float) -> None:
+        node = self
+        for char in word:
+            node = node.prefixes.setdefault(char, ReferenceTrie())
+        node.score = score
+
+    def complete(self, prefix: str, k: int) -> list[tuple[str, float]]:
+        node = self
+        for char in prefix:
+            if (node := node.prefixes.get(char)) is None:
+                return []
+        found, stack = [], [(node, prefix)]
+        while stack:
+            node, word = stack.pop()
+            if node.score is not None:
+                found.append((word, node.score))
+            stack.extend((child, word + char) for char, child in node.prefixes.items())
+        return sorted(found, key=lambda item: (-item[1], item[0]))[:k]
+
+
+def latency(trie, prefixes: list[str], k: int) -> float:
+    start = time.perf_counter()
+    for prefix in prefixes:
+        trie.complete(prefix, k)
+    return (time.perf_counter() - start) / len(prefixes) * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--keys", type=int, default=500000)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--reference-keys", type=int, default=50000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    scores = make_keys(args.keys, rng)
+    keys = sorted(scores)
+    start = time.perf_counter()
+    trie = Trie.from_sorted(keys, [scores[key] for key in keys])
+    build = time.perf_counter() - start
+    print(
+        f"trie: {len(trie)} keys, built in {build:.2f}s, {trie.nbytes / 2**20:.1f} MB"
+    )
+    for length in (1, 2, 3, 5, 8):
+        prefixes = [rng.choice(keys)[:length] for _ in range(args.queries)]
+        print(f"  prefix {length}: {latency(trie, prefixes, args.k):>8.1f} us")
+
+    sample = keys[: args.reference_keys]
+    prefixes = [rng.choice(sample)[:3] for _ in range(args.queries // 10)]
+    tracemalloc.start()
+    reference = ReferenceTrie()
+    for key in sample:
+        reference.insert(key, scores[key])
+    reference_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    compact = Trie.from_sorted(sample, [scores[key] for key in sample])
+    for prefix in prefixes:
+        # Keys with equal scores may come in a different order
+        assert [score for _, score in compact.complete(prefix, args.k)] == [
+            score for _, score in reference.complete(prefix, args.k)
+        ], "tries return different completions"
+    print(
+        f"{len(sample)} keys: reference {reference_bytes / 2**20:.1f} MB, "
+        f"{latency(reference, prefixes, args.k):.1f} us; "
+        f"compact {compact.nbytes / 2**20:.1f} MB, "
+        f"{latency(compact, prefixes, args.k):.1f} us"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Synthetic SQLite catalog with the schema the ETL reads: film_work, genre,
+person and the genre_film_work/person_film_work links. The same seed
+gives the same catalog.
+
+    python -m benchmarks.catalog bench.sqlite --films 100000
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import uuid
+
+SCHEMA = """
+CREATE TABLE film_work (
+    id TEXT PRIMARY KEY, title TEXT, description TEXT, creation_date DATE,
+    file_path TEXT, rating FLOAT, type TEXT,
+    created_at timestamp, updated_at timestamp
+);
+CREATE TABLE genre (
+    id TEXT PRIMARY KEY, name TEXT, description TEXT,
+    created_at timestamp, updated_at timestamp
+);
+CREATE TABLE person (
+    id TEXT PRIMARY KEY, full_name TEXT, birth_date DATE,
+    created_at timestamp, updated_at timestamp
+);
+CREATE TABLE genre_film_work (
+    id TEXT PRIMARY KEY, film_work_id TEXT, genre_id TEXT, created_at timestamp
+);
+CREATE TABLE person_film_work (
+    id TEXT PRIMARY KEY, film_work_id TEXT, person_id TEXT, role TEXT,
+    created_at timestamp
+);
+"""
+
+GENRES = (
+    "Action Adventure Animation Biography Comedy Crime Documentary Drama "
+    "Family Fantasy History Horror Music Mystery Romance Sci-Fi Sport "
+    "Thriller War Western"
+).split()
+WORDS = (
+    "star night house black last dark love blood city dead king girl man "
+    "world life story time lost secret road war game home day river moon "
+    "fire summer winter ghost dream heart shadow island return legend "
+    "galaxy robot empire journey hunter storm ocean garden silver iron"
+).split()
+FIRST_NAMES = (
+    "John Mary James Anna Robert Olga Michael Elena David Irina Thomas "
+    "Peter Sofia George Maria Alex Nina Paul Kate Ivan Lena Mark"
+).split()
+LAST_NAMES = (
+    "Smith Ivanov Brown Petrova Wilson Sokolov Taylor Kuznetsova Moore "
+    "Popov Clark Volkova Lewis Novikov Walker Morozova Hall Lebedev"
+).split()
+# Participants of every film: role -> (min, max)
+CREW = {"actor": (2, 8), "director": (1, 2), "writer": (1, 3)}
+TIMESTAMP = "2021-06-16 20:14:09.221838+00:00"
+
+
+def make_catalog(
+    path: str, films: int, persons: int | None = None, seed: int = 0
+) -> None:
+    """Replace `path` with a catalog of `films` films and `persons` persons"""
+    rng = random.Random(seed)
+    persons = persons or max(10, films // 2)
+
+    def new_id() -> str:
+        return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+    if os.path.exists(path):
+        os.remove(path)
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.executescript(SCHEMA)
+        genres = [(new_id(), name) for name in GENRES]
+        connection.executemany(
+            "INSERT INTO genre VALUES (?, ?, NULL, ?, ?);",
+            [(id, name, TIMESTAMP, TIMESTAMP) for id, name in genres],
+        )
+        person_ids = [new_id() for _ in range(persons)]
+        connection.executemany(
+            "INSERT INTO person VALUES (?, ?, NULL, ?, ?);",
+            (
+                (
+                    id,
+                    f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                    TIMESTAMP,
+                    TIMESTAMP,
+                )
+                for id in person_ids
+            ),
+        )
+        for start in range(0, films, 10000):
+            film_rows, genre_rows, person_rows = [], [], []
+            for _ in range(start, min(films, start + 10000)):
+                id = new_id()
+                title = " ".join(rng.sample(WORDS, rng.randint(1, 4))).title()
+                description = " ".join(rng.choices(WORDS, k=rng.randint(10, 40)))
+                # Some films have no rating like in the real catalog
+                rating = round(rng.uniform(1, 10), 1) if rng.random() > 0.1 else None
+                film_rows.append(
+                    (id, title, description, rating, "movie", TIMESTAMP, TIMESTAMP)
+                )
+                for genre_id, _ in rng.sample(genres, rng.randint(1, 3)):
+                    genre_rows.append((new_id(), id, genre_id, TIMESTAMP))
+                for role, (low, high) in CREW.items():
+                    for person_id in rng.sample(person_ids, rng.randint(low, high)):
+                        person_rows.append((new_id(), id, person_id, role, TIMESTAMP))
+            connection.executemany(
+                "INSERT INTO film_work VALUES (?, ?, ?, NULL, NULL, ?, ?, ?, ?);",
+                film_rows,
+            )
+            connection.executemany(
+                "INSERT INTO genre_film_work VALUES (?, ?, ?, ?);", genre_rows
+            )
+            connection.executemany(
+                "INSERT INTO person_film_work VALUES (?, ?, ?, ?, ?);", person_rows
+            )
+    connection.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("path")
+    parser.add_argument("--films", type=int, default=100000)
+    parser.add_argument("--persons", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    make_catalog(args.path, args.films, args.persons, args.seed)
+    print(f"{args.films} films are written to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Spelling corrector benchmark: Norvig's edits1/edits2 `correction` against
+the SymSpell index through the `spelltest` harness of type_corrector.
+Runs from the directory holding big.txt and the spell-testset files.
+
+    python -m benchmarks.corrector spell-testset1.txt spell-testset2.txt
+"""
+
+import argparse
+import time
+
+import type_corrector
+from type_corrector import SymSpell, Testset, correction, spelltest
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("testsets", nargs="+")
+    parser.add_argument("--max-distance", type=int, default=2)
+    parser.add_argument("--prefix-length", type=int, default=7)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = SymSpell(
+        type_corrector.WORDS,
+        max_distance=args.max_distance,
+        prefix_length=args.prefix_length,
+    )
+    print(
+        f"index: {len(index.index)} deletes of {len(type_corrector.WORDS)} words "
+        f"built in {time.perf_counter() - start:.2f}s"
+    )
+    for path in args.testsets:
+        with open(path) as file:
+            tests = Testset(file)
+        differ = sum(correction(wrong) != index.correction(wrong) for _, wrong in tests)
+        print(f"{path}: {differ} of {len(tests)} corrections differ")
+        for name, correct in (("edits", correction), ("symspell", index.correction)):
+            print(f"  {name:>8}: ", end="")
+            spelltest(tests, correction=correct)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+ETL throughput: SQLiteExtractor, SQLite2ESTransformer and ESLoader are
+measured separately in docs/s, then the whole PipelinedETL run. The loader
+sends bulks to a fake Elasticsearch process, so its number is the
+cost of serialization, compression and HTTP on our side. The pipeline
+reads bulks of BULK_SIZE films like the ETL.
+
+    python -m benchmarks.catalog bench.sqlite --films 100000
+    python -m benchmarks.etl bench.sqlite --bulk-size 1000
+"""
+
+import argparse
+import contextlib
+import sqlite3
+import time
+
+import requests
+
+from etl_script import ESLoader, PipelinedETL, SQLite2ESTransformer, SQLiteExtractor
+
+from .fake_es import spawn
+from .report import save
+
+
+def rate(docs: int, elapsed: float) -> dict:
+    return {"docs": docs, "seconds": round(elapsed, 3), "docs_per_s": docs / elapsed}
+
+
+def run(
+    db_path: str, bulk_size: int, compress: bool, loaders: int, repeat: int
+) -> dict:
+    results = {}
+    with contextlib.closing(sqlite3.connect(db_path)) as connection:
+        extractor = SQLiteExtractor(connection=connection)
+        # The best of the repeats, the first one also warms the page cache
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            bulks = list(extractor.bulk_generator(bulk_size))
+            best = min(best, time.perf_counter() - start)
+        films = sum(len(bulk["films"]) for bulk in bulks)
+        results["extract"] = rate(films, best)
+
+        best = float("inf")
+        for _ in range(repeat):
+            transformer = SQLite2ESTransformer()
+            start = time.perf_counter()
+            records = [transformer.transform(bulk) for bulk in bulks]
+            best = min(best, time.perf_counter() - start)
+        results["transform"] = rate(films, best)
+        del bulks
+
+        with spawn() as url:
+            loader = ESLoader(url=url, index="movies", compress=compress)
+            best = float("inf")
+            for _ in range(repeat):
+                start = time.perf_counter()
+                for batch in records:
+                    loader.bulk_load(batch)
+                best = min(best, time.perf_counter() - start)
+            count = requests.get(f"{url}/movies/_count").json()["count"]
+            assert count == films, "fake Elasticsearch lost documents"
+            results["load"] = rate(films, best)
+
+            loader = ESLoader(
+                url=url, index="movies", compress=compress, pool_size=loaders
+            )
+            etl = PipelinedETL(
+                extractor, SQLite2ESTransformer(), loader, loaders=loaders
+            )
+            start = time.perf_counter()
+            etl.do()
+            results["pipeline"] = rate(films, time.perf_counter() - start)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("db_path")
+    parser.add_argument("--bulk-size", type=int, default=1000)
+    parser.add_argument("--loaders", type=int, default=4)
+    parser.add_argument("--no-compress", action="store_true")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--output", help="JSON file, a new one in benchmark-results/ by default"
+    )
+    args = parser.parse_args()
+
+    params = {
+        "db_path": args.db_path,
+        "bulk_size": args.bulk_size,
+        "loaders": args.loaders,
+        "compress": not args.no_compress,
+        "repeat": args.repeat,
+    }
+    results = run(
+        args.db_path, args.bulk_size, not args.no_compress, args.loaders, args.repeat
+    )
+    for stage, result in results.items():
+        print(
+            f"{stage:>9}: {result['docs_per_s']:>9.0f} docs/s "
+            f"({result['docs']} docs, {result['seconds']:.3f}s)"
+        )
+    print(f"saved to {save('etl', params, results, args.output)}")
+
+
+if __name__ == "__main__":
+    main()
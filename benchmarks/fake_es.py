@@ -0,0 +1,352 @@
+"""
+In-memory stand-in for the Elasticsearch endpoints the ETL and the API
+call: _bulk (index and delete), _search (from/size, sort, search_after,
+point in time, multi_match, match, bool filters with term and range),
+_doc, _mget, _msearch, _mapping, _pit, and the index management of
+--rebuild: index create, delete and HEAD, _alias, _aliases and
+_cat/indices. Documents are kept per index, aliases resolve to their
+index. It is as fast as a local HTTP server gets, so benchmarks measure
+our side of the calls. `spawn` runs it in a child process, off the GIL
+of the measured code.
+
+    python -m benchmarks.fake_es --port 9200
+"""
+
+import argparse
+import contextlib
+import fnmatch
+import gzip
+import json
+import multiprocessing
+import operator
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Iterator
+from urllib.parse import parse_qs, urlsplit
+
+
+RANGE_OPERATORS = {
+    "gte": operator.ge,
+    "gt": operator.gt,
+    "lte": operator.le,
+    "lt": operator.lt,
+}
+
+
+class FakeES:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        # index -> id -> document
+        self.indexes: dict[str, dict[str, dict]] = {}
+        # alias -> index
+        self.aliases: dict[str, str] = {}
+        self.meta: dict[str, Any] = {"generation": "1"}
+        self._sorted: dict[tuple[str, str, str], list[dict]] = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def serve_forever(self) -> None:
+        self._server.serve_forever()
+
+    def start(self) -> "FakeES":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeES":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def docs(self, index: str) -> dict[str, dict]:
+        return self.indexes.get(self.aliases.get(index, index), {})
+
+    def add(self, index: str, docs: list[dict]) -> None:
+        with self._lock:
+            stored = self.indexes.setdefault(self.aliases.get(index, index), {})
+            for doc in docs:
+                stored[doc["id"]] = doc
+            self._sorted.clear()
+
+    def bulk(self, payload: bytes, index: str = "") -> dict:
+        lines = iter(payload.splitlines())
+        items = []
+        for line in lines:
+            ((kind, action),) = json.loads(line).items()
+            name = action.get("_index", index)
+            if kind == "delete":
+                with self._lock:
+                    found = self.docs(name).pop(action["_id"], None) is not None
+                    self._sorted.clear()
+                status = 200 if found else 404
+            else:
+                self.add(name, [json.loads(next(lines))])
+                status = 201
+            items.append({kind: {"_id": action["_id"], "status": status}})
+        return {"errors": False, "items": items}
+
+    def exists(self, name: str) -> bool:
+        return name in self.indexes or name in self.aliases
+
+    def create(self, index: str) -> None:
+        with self._lock:
+            self.indexes.setdefault(index, {})
+
+    def delete(self, index: str) -> None:
+        with self._lock:
+            self.indexes.pop(self.aliases.get(index, index), None)
+            self.aliases = {
+                alias: name for alias, name in self.aliases.items() if name != index
+            }
+            self._sorted.clear()
+
+    def update_aliases(self, actions: list[dict]) -> None:
+        with self._lock:
+            for action in actions:
+                ((kind, options),) = action.items()
+                if kind == "add":
+                    self.aliases[options["alias"]] = options["index"]
+                elif kind == "remove":
+                    if self.aliases.get(options["alias"]) == options["index"]:
+                        del self.aliases[options["alias"]]
+                elif kind == "remove_index":
+                    self.indexes.pop(options["index"], None)
+            self._sorted.clear()
+
+    def _ordered(self, index: str, field: str, order: str) -> list[dict]:
+        if (docs := self._sorted.get((index, field, order))) is None:
+            with self._lock:
+                docs = sorted(
+                    self.docs(index).values(),
+                    key=lambda doc: (doc.get(field) is None, doc.get(field) or 0),
+                )
+                if order == "desc":
+                    docs.reverse()
+                self._sorted[(index, field, order)] = docs
+        return docs
+
+    @classmethod
+    def _matches(cls, doc: dict, query: dict) -> bool:
+        if "bool" in query:
+            clauses = [query["bool"].get("must", {}), *query["bool"]["filter"]]
+            return all(cls._matches(doc, clause) for clause in clauses if clause)
+        if "match_all" in query:
+            return True
+        if "term" in query:
+            # genres.list: lowercase items of the comma-joined field
+            ((field, value),) = query["term"].items()
+            items = str(doc.get(field.partition(".")[0]) or "").split(",")
+            return value in (item.strip().lower() for item in items)
+        if "range" in query:
+            ((field, bounds),) = query["range"].items()
+            if (value := doc.get(field)) is None:
+                return False
+            return all(
+                RANGE_OPERATORS[name](value, bound) for name, bound in bounds.items()
+            )
+        if "match" in query:
+            ((field, match),) = query["match"].items()
+            query = {
+                "multi_match": {
+                    "query": match["query"] if isinstance(match, dict) else match,
+                    "fields": [field],
+                }
+            }
+        match = query["multi_match"]
+        words = match["query"].lower().split()
+        fields = [field.partition("^")[0] for field in match["fields"]]
+        text = " ".join(str(doc.get(field) or "") for field in fields).lower()
+        return any(word in text for word in words)
+
+    @staticmethod
+    def _source(doc: dict, fields: list[str] | None) -> dict:
+        return {key: doc[key] for key in fields if key in doc} if fields else doc
+
+    def search(self, index: str, body: dict, fields: list[str] | None = None) -> dict:
+        if pit := body.get("pit"):
+            # Point in time ids are fake-pit:<index>
+            index = pit["id"].partition(":")[2]
+        fields = body.get("_source", fields)
+        sort = [next(iter(item.items())) for item in body.get("sort", [])]
+        field, options = sort[0] if sort else ("id", {"order": "asc"})
+        docs = self._ordered(index, field, options["order"])
+        if query := body.get("query"):
+            docs = [doc for doc in docs if self._matches(doc, query)]
+        start = body.get("from", 0)
+        if after := body.get("search_after"):
+            keys = [[doc.get(name) for name, _ in sort] for doc in docs]
+            start = next((i + 1 for i, key in enumerate(keys) if key == after), 0)
+        hits = [
+            {
+                "_id": doc["id"],
+                "_source": self._source(doc, fields),
+                "sort": [doc.get(name) for name, _ in sort],
+            }
+            for doc in docs[start : start + body.get("size", 10)]
+        ]
+        response = {"hits": {"total": {"value": len(docs)}, "hits": hits}}
+        if pit:
+            response["pit_id"] = pit["id"]
+        return response
+
+    def _handler(self) -> type[BaseHTTPRequestHandler]:
+        es = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args) -> None:
+                pass
+
+            def _reply(self, data: Any, status: int = 200) -> None:
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _body(self) -> bytes:
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                if self.headers.get("Content-Encoding") == "gzip":
+                    body = gzip.decompress(body)
+                return body
+
+            def handle_any(self) -> None:
+                body = self._body()
+                url = urlsplit(self.path)
+                parts = url.path.strip("/").split("/")
+                params = parse_qs(url.query)
+                fields = (
+                    params["_source"][0].split(",") if "_source" in params else None
+                )
+                endpoint = next(
+                    (part for part in reversed(parts) if part.startswith("_")), ""
+                )
+                index = "" if parts[0].startswith("_") else parts[0]
+                docs = es.docs(index)
+                if endpoint == "_bulk":
+                    return self._reply(es.bulk(body, index))
+                if endpoint == "_search":
+                    body = json.loads(body or b"{}")
+                    return self._reply(es.search(index, body, fields))
+                if endpoint == "_count":
+                    return self._reply({"count": len(docs)})
+                if endpoint == "_msearch":
+                    lines = body.splitlines()
+                    responses = [
+                        es.search(
+                            json.loads(header).get("index", index), json.loads(line)
+                        )
+                        for header, line in zip(lines[::2], lines[1::2])
+                    ]
+                    return self._reply({"responses": responses})
+                if endpoint == "_doc":
+                    if (doc := docs.get(parts[-1])) is None:
+                        return self._reply({"_id": parts[-1], "found": False}, 404)
+                    source = es._source(doc, fields)
+                    return self._reply(
+                        {"_id": parts[-1], "found": True, "_source": source}
+                    )
+                if endpoint == "_mget":
+                    docs = [
+                        (
+                            {
+                                "_id": id,
+                                "found": True,
+                                "_source": es._source(doc, fields),
+                            }
+                            if (doc := docs.get(id))
+                            else {"_id": id, "found": False}
+                        )
+                        for id in json.loads(body)["ids"]
+                    ]
+                    return self._reply({"docs": docs})
+                if endpoint == "_mapping":
+                    if self.command == "PUT":
+                        es.meta.update(json.loads(body).get("_meta", {}))
+                        return self._reply({"acknowledged": True})
+                    return self._reply({parts[0]: {"mappings": {"_meta": es.meta}}})
+                if endpoint == "_alias":
+                    if (name := es.aliases.get(parts[-1])) is None:
+                        return self._reply(
+                            {"error": "alias missing", "status": 404}, 404
+                        )
+                    return self._reply({name: {"aliases": {parts[-1]: {}}}})
+                if endpoint == "_aliases":
+                    es.update_aliases(json.loads(body)["actions"])
+                    return self._reply({"acknowledged": True})
+                if endpoint == "_cat":
+                    pattern = parts[2] if len(parts) > 2 else "*"
+                    names = sorted(fnmatch.filter(es.indexes, pattern))
+                    return self._reply([{"index": name} for name in names])
+                if not endpoint and self.command == "PUT":
+                    es.create(index)
+                    return self._reply({"acknowledged": True, "index": index})
+                if not endpoint and self.command == "DELETE":
+                    es.delete(index)
+                    return self._reply({"acknowledged": True})
+                if endpoint == "_pit":
+                    if self.command == "DELETE":
+                        return self._reply({"succeeded": True})
+                    return self._reply({"id": f"fake-pit:{index}"})
+                return self._reply({"acknowledged": True})
+
+            do_GET = do_POST = do_PUT = do_DELETE = handle_any
+
+            def do_HEAD(self) -> None:
+                name = urlsplit(self.path).path.strip("/")
+                self.send_response(200 if es.exists(name) else 404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+        return Handler
+
+
+def _serve(host: str, port: int, urls: multiprocessing.Queue) -> None:
+    es = FakeES(host, port)
+    urls.put(es.url)
+    es.serve_forever()
+
+
+@contextlib.contextmanager
+def spawn(host: str = "127.0.0.1", port: int = 0) -> Iterator[str]:
+    """Fake Elasticsearch in a child process, yields its url"""
+    urls = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=_serve, args=(host, port, urls), daemon=True
+    )
+    process.start()
+    try:
+        yield urls.get(timeout=10)
+    finally:
+        process.terminate()
+        process.join()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9200)
+    args = parser.parse_args()
+    with FakeES(args.host, args.port) as es:
+        print(f"Fake Elasticsearch on {es.url}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
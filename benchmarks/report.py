@@ -0,0 +1,97 @@
+"""
+Benchmark results as JSON files with the environment of the run, so runs
+of different commits can be compared.
+
+    python -m benchmarks.report old.json new.json
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+from typing import Any
+
+RESULTS_DIR = "benchmark-results"
+
+
+def environment() -> dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def save(benchmark: str, params: dict, results: dict, path: str | None = None) -> str:
+    """Write a run to `path`, by default a new file in RESULTS_DIR. Returns the path"""
+    now = datetime.datetime.now(datetime.timezone.utc)
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(
+            RESULTS_DIR, f"{benchmark}-{now.strftime('%Y%m%dT%H%M%SZ')}.json"
+        )
+    with open(path, "w") as file:
+        json.dump(
+            {
+                "benchmark": benchmark,
+                "time": now.isoformat(timespec="seconds"),
+                "environment": environment(),
+                "params": params,
+                "results": results,
+            },
+            file,
+            indent=2,
+        )
+    return path
+
+
+def _metrics(results: dict, prefix: str = "") -> dict[str, float]:
+    """Flat scenario.metric -> value of the numeric results"""
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(_metrics(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(old: dict, new: dict) -> list[tuple[str, float, float, float]]:
+    """(metric, old, new, new / old) of the metrics both runs have"""
+    old_metrics, new_metrics = _metrics(old["results"]), _metrics(new["results"])
+    return [
+        (name, old_metrics[name], value, value / old_metrics[name])
+        for name, value in new_metrics.items()
+        if old_metrics.get(name)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("old")
+    parser.add_argument("new")
+    args = parser.parse_args()
+    with open(args.old) as old_file, open(args.new) as new_file:
+        old, new = json.load(old_file), json.load(new_file)
+    print(
+        f"{old['benchmark']}: {old['environment']['commit']} -> "
+        f"{new['environment']['commit']}"
+    )
+    for name, old_value, new_value, ratio in compare(old, new):
+        print(f"{name:<40} {old_value:>12.3f} {new_value:>12.3f} {ratio:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
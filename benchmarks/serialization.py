@@ -0,0 +1,133 @@
+"""
+Transform + bulk serialization benchmark: the original asdict/json.dumps
+path against SQLite2ESTransformer and BulkSerializer.
+
+    python -m benchmarks.serialization --films 20000 --batches 5
+"""
+
+import argparse
+import json
+import random
+import time
+import uuid
+from dataclasses import asdict, dataclass
+
+from etl_script import (
+    BulkSerializer,
+    FilmES,
+    FilmWorkSQL,
+    PersonSQL,
+    SQLite2ESTransformer,
+)
+
+
+@dataclass
+class ReferencePersonES:
+    id: str
+    name: str
+
+
+def reference_transform(data: dict) -> list[FilmES]:
+    """Transformation as it was done before slotted records and person cache"""
+    transformed = []
+    for film in data["films"]:
+        persons = data["persons"]
+        actors, directors, writers = (
+            [
+                ReferencePersonES(id=id_, name=persons[id_].full_name)
+                for id_ in data[key].get(film.id, [])
+            ]
+            for key in ("film_actors", "film_directors", "film_writers")
+        )
+        transformed.append(
+            FilmES(
+                id=film.id,
+                title=film.title,
+                description=film.description,
+                imdb_rating=film.rating,
+                genres=",".join(genre for genre in data["genres"][film.id]),
+                actors_names=",".join(actor.name for actor in actors),
+                directors_names=",".join(director.name for director in directors),
+                writers_names=",".join(writer.name for writer in writers),
+                actors=[asdict(actor) for actor in actors],
+                directors=[asdict(director) for director in directors],
+                writers=[asdict(writer) for writer in writers],
+            )
+        )
+    return transformed
+
+
+def reference_serialize(index: str, record: FilmES) -> bytes:
+    return (
+        json.dumps({"index": {"_index": index, "_id": record.id}})
+        + "\n"
+        + json.dumps(asdict(record))
+        + "\n"
+    ).encode()
+
+
+def make_batch(films: int, persons: int, rng: random.Random) -> dict:
+    """Extracted batch in the shape SQLiteExtractor yields"""
+    person_ids = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(persons)]
+    batch = {
+        "films": [],
+        "persons": {id_: PersonSQL(id_, f"Person {id_[:8]}") for id_ in person_ids},
+        "genres": {},
+        "film_actors": {},
+        "film_directors": {},
+        "film_writers": {},
+    }
+    for number in range(films):
+        id_ = str(uuid.UUID(int=rng.getrandbits(128)))
+        batch["films"].append(
+            FilmWorkSQL(id_, f"Film {number}", "Description " * 20, rng.uniform(1, 10))
+        )
+        batch["genres"][id_] = rng.sample(["Action", "Drama", "Comedy", "Sci-Fi"], 2)
+        batch["film_actors"][id_] = rng.sample(person_ids, 5)
+        batch["film_directors"][id_] = rng.sample(person_ids, 1)
+        batch["film_writers"][id_] = rng.sample(person_ids, 2)
+    return batch
+
+
+def measure(batches: list[dict], run) -> tuple[float, list[bytes]]:
+    start = time.perf_counter()
+    output = [run(batch) for batch in batches]
+    return time.perf_counter() - start, output
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--films", type=int, default=20000)
+    parser.add_argument("--persons", type=int, default=5000)
+    parser.add_argument("--batches", type=int, default=5)
+    parser.add_argument("--index", default="movies")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    batches = [
+        make_batch(args.films // args.batches, args.persons, rng)
+        for _ in range(args.batches)
+    ]
+    transformer = SQLite2ESTransformer()
+    serializer = BulkSerializer(args.index)
+    reference_time, reference = measure(
+        batches,
+        lambda batch: b"".join(
+            reference_serialize(args.index, record)
+            for record in reference_transform(batch)
+        ),
+    )
+    fast_time, fast = measure(
+        batches,
+        lambda batch: b"".join(
+            serializer.serialize(record) for record in transformer.transform(batch)
+        ),
+    )
+    assert fast == reference, "serializers produce different bulk bodies"
+    for name, elapsed in (("reference", reference_time), ("fast", fast_time)):
+        print(f"{name:>9}: {args.films / elapsed:>9.0f} docs/s ({elapsed:.3f}s)")
+    print(f"  speedup: {reference_time / fast_time:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,111 @@
+import argparse
 import contextlib
+import gzip
+import itertools
 import json
 import logging
+import math
+import multiprocessing
 import os
+import queue
+import random
+import re
+import secrets
 import sqlite3
+import threading
 import time
-from dataclasses import dataclass, asdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, fields
+from datetime import datetime
 from functools import wraps
-from typing import Any, Callable, Generator
+from json.encoder import encode_basestring_ascii
+from typing import Any, Callable, Generator, Iterable, Iterator
 from dotenv import load_dotenv
 
 import requests
+from requests.adapters import HTTPAdapter
+
+from facets import FacetCounts
+from metrics import REGISTRY, SIZE_BUCKETS
+from search_index import write_index
+from suggestions import SuggestDictionary, Suggestion
+from type_corrector import catalog_words, compile_dictionary
 
 load_dotenv()
 
+# Schema files are found next to this script, whatever the working directory
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 DB_NAME = os.environ.get("DB_NAME", "db.sqlite")
-BULK_SIZE = int(os.environ.get("BULK_SIZE", "1"))
+BULK_SIZE = int(os.environ.get("BULK_SIZE", "1000"))
+ETL_STATE_FILE = os.environ.get("ETL_STATE_FILE", "etl_state.json")
+ETL_INCREMENTAL = os.environ.get("ETL_INCREMENTAL", "false").lower() == "true"
+ETL_LOADERS = int(os.environ.get("ETL_LOADERS", "4"))
+ETL_QUEUE_SIZE = int(os.environ.get("ETL_QUEUE_SIZE", "8"))
+ETL_WORKERS = int(os.environ.get("ETL_WORKERS", "1"))
 
 ES_URL = os.environ.get("ES_URL", "http://localhost:9200")
 ES_INDEX_NAME = os.environ.get("ES_INDEX_NAME", "movies")
+ES_BULK_MAX_BYTES = int(os.environ.get("ES_BULK_MAX_BYTES", str(10 * 1024 * 1024)))
+ES_BULK_COMPRESS = os.environ.get("ES_BULK_COMPRESS", "true").lower() == "true"
+ES_BULK_RETRIES = int(os.environ.get("ES_BULK_RETRIES", "5"))
+ES_BULK_BACKOFF = float(os.environ.get("ES_BULK_BACKOFF", "0.5"))
+ES_BULK_MAX_BACKOFF = float(os.environ.get("ES_BULK_MAX_BACKOFF", "30"))
+ES_DEAD_LETTER_FILE = os.environ.get("ES_DEAD_LETTER_FILE", "dead_letters.ndjson")
+ES_SCHEMA_FILE = os.path.join(
+    BASE_DIR, os.environ.get("ES_SCHEMA_FILE", "es_schema.txt")
+)
+ES_INDEX_RETENTION = int(os.environ.get("ES_INDEX_RETENTION", "2"))
+PERSON_CACHE_SIZE = int(os.environ.get("PERSON_CACHE_SIZE", "100000"))
+# Off by default: the dictionary is rebuilt from the whole catalog on every run
+SUGGEST_FILE = os.environ.get("SUGGEST_FILE", "")
+# Off by default: the vocabulary is counted over the whole catalog on every run
+CATALOG_WORDS_FILE = os.environ.get("CATALOG_WORDS_FILE", "")
+# Off by default: it is a pass over the whole catalog, also on incremental runs
+SEARCH_INDEX_FILE = os.environ.get("SEARCH_INDEX_FILE", "")
+# Indexes of persons and genres with their films, empty to skip
+ES_PERSONS_INDEX_NAME = os.environ.get("ES_PERSONS_INDEX_NAME", "persons")
+ES_GENRES_INDEX_NAME = os.environ.get("ES_GENRES_INDEX_NAME", "genres")
+ES_PERSONS_SCHEMA_FILE = os.path.join(
+    BASE_DIR, os.environ.get("ES_PERSONS_SCHEMA_FILE", "es_schema_persons.txt")
+)
+ES_GENRES_SCHEMA_FILE = os.path.join(
+    BASE_DIR, os.environ.get("ES_GENRES_SCHEMA_FILE", "es_schema_genres.txt")
+)
+ETL_METRICS_FILE = os.environ.get("ETL_METRICS_FILE", "etl_metrics.json")
+# Genre counts and the imdb_rating histogram served by the API. Off by default:
+# incremental and resumed runs count them over the whole catalog
+FACETS_FILE = os.environ.get("FACETS_FILE", "")
 
 
 logger = logging.getLogger(__name__)
 
+STAGES = ("extract", "transform", "load")
+BATCH_SECONDS = REGISTRY.histogram(
+    "etl_batch_seconds", "Time a stage spends on one batch", ("stage",)
+)
+STAGE_DOCS = REGISTRY.counter(
+    "etl_docs_total", "Documents passed through a stage", ("stage",)
+)
+BULK_BYTES = REGISTRY.histogram(
+    "etl_bulk_request_bytes",
+    "Bulk request body size before compression",
+    (),
+    SIZE_BUCKETS,
+)
+BULK_SENT_BYTES = REGISTRY.counter(
+    "etl_bulk_sent_bytes_total", "Bulk bytes sent to ES including retries"
+)
+BULK_SECONDS = REGISTRY.histogram("etl_bulk_request_seconds", "Bulk request latency")
+ERRORS = REGISTRY.counter(
+    "etl_errors_total",
+    "Failed bulk requests (connection, throttled, failed) and documents "
+    "(retried, rejected, dead_letter)",
+    ("kind",),
+)
+
 
-@dataclass
+@dataclass(slots=True)
 class FilmWorkSQL:
     id: str
     title: str
@@ -32,34 +113,50 @@ class FilmWorkSQL:
     rating: float
 
 
-@dataclass
+@dataclass(slots=True)
 class PersonSQL:
     id: str
     full_name: str
 
 
-@dataclass
+@dataclass(slots=True)
 class PersonES:
     id: str
     name: str
 
 
-@dataclass
-class ActorES(PersonES):
-    ...
+@dataclass(slots=True)
+class FilmRefES:
+    id: str
+    title: str
+    imdb_rating: float
 
 
-@dataclass
-class DirectorES(PersonES):
-    ...
+@dataclass(slots=True)
+class PersonFilmES:
+    id: str
+    title: str
+    imdb_rating: float
+    roles: list[str]
 
 
-@dataclass
-class WriterES(PersonES):
-    ...
+@dataclass(slots=True)
+class PersonDetailES:
+    id: str
+    name: str
+    roles: list[str]
+    films: list[PersonFilmES]
 
 
-@dataclass
+@dataclass(slots=True)
+class GenreES:
+    id: str
+    name: str
+    films_count: int
+    films: list[FilmRefES]
+
+
+@dataclass(slots=True)
 class FilmES:
     id: str
     title: str
@@ -69,80 +166,339 @@ class FilmES:
     actors_names: str
     directors_names: str
     writers_names: str
-    actors: list[dict]
-    directors: list[dict]
-    writers: list[dict]
+    actors: list[PersonES]
+    directors: list[PersonES]
+    writers: list[PersonES]
+
+
+@dataclass(slots=True)
+class DeletedES:
+    """Document to remove from an index"""
+
+    id: str
+
+
+class JsonFileStorage:
+    """Durable key-value state kept in a JSON file."""
+
+    def __init__(self, file_path: str) -> None:
+        self.file_path = file_path
+
+    def save_state(self, state: dict) -> None:
+        # Write to a temporary file and swap it in, so a crash mid-write
+        # never leaves a truncated state file behind
+        tmp_path = f"{self.file_path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(state, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.file_path)
+
+    def retrieve_state(self) -> dict:
+        try:
+            with open(self.file_path) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+
+
+class State:
+    def __init__(self, storage: JsonFileStorage) -> None:
+        self.storage = storage
+        self._state = storage.retrieve_state()
+
+    def set_state(self, key: str, value: Any) -> None:
+        self._state[key] = value
+        self.storage.save_state(self._state)
+
+    def get_state(self, key: str, default: Any = None) -> Any:
+        return self._state.get(key, default)
 
 
 class SQLiteExtractor:
+    # Tables whose changes make a film stale, in the order they are checked
+    TRACKED_TABLES = (
+        "film_work",
+        "person_film_work",
+        "genre_film_work",
+        "person",
+        "genre",
+    )
+    # Columns usable as a high-water mark, best first; rowid is the fallback
+    MARK_COLUMNS = ("modified", "updated_at", "created_at")
+    # Deleted rows leave no mark, triggers record them in this table:
+    # deleted films, persons and genres, and links removed from films
+    TOMBSTONES = "etl_deleted"
+    TOMBSTONE_TRIGGERS = {
+        "film_work": """DELETE ON film_work BEGIN
+            INSERT INTO etl_deleted (tbl, id) VALUES ('film_work', old.id);
+            INSERT INTO etl_deleted (tbl, id)
+            SELECT 'person', person_id FROM person_film_work
+            WHERE film_work_id == old.id;
+            INSERT INTO etl_deleted (tbl, id)
+            SELECT 'genre', genre_id FROM genre_film_work
+            WHERE film_work_id == old.id;
+        END""",
+        "person": """DELETE ON person BEGIN
+            INSERT INTO etl_deleted (tbl, id) VALUES ('person', old.id);
+            INSERT INTO etl_deleted (tbl, id, film_work_id)
+            SELECT 'person', old.id, film_work_id FROM person_film_work
+            WHERE person_id == old.id;
+        END""",
+        "genre": """DELETE ON genre BEGIN
+            INSERT INTO etl_deleted (tbl, id) VALUES ('genre', old.id);
+            INSERT INTO etl_deleted (tbl, id, film_work_id)
+            SELECT 'genre', old.id, film_work_id FROM genre_film_work
+            WHERE genre_id == old.id;
+        END""",
+        "person_film_work": """DELETE ON person_film_work BEGIN
+            INSERT INTO etl_deleted (tbl, id, film_work_id)
+            VALUES ('person', old.person_id, old.film_work_id);
+        END""",
+        "person_film_work_moved": """UPDATE OF film_work_id, person_id
+            ON person_film_work BEGIN
+            INSERT INTO etl_deleted (tbl, id, film_work_id)
+            VALUES ('person', old.person_id, old.film_work_id);
+        END""",
+        "genre_film_work": """DELETE ON genre_film_work BEGIN
+            INSERT INTO etl_deleted (tbl, id, film_work_id)
+            VALUES ('genre', old.genre_id, old.film_work_id);
+        END""",
+        "genre_film_work_moved": """UPDATE OF film_work_id, genre_id
+            ON genre_film_work BEGIN
+            INSERT INTO etl_deleted (tbl, id, film_work_id)
+            VALUES ('genre', old.genre_id, old.film_work_id);
+        END""",
+    }
+
     def __init__(self, connection: sqlite3.Connection) -> None:
         self.connection = connection
+        self._mark_columns: dict[str, str] = {}
+
+    def _mark_column(self, table: str) -> str:
+        if table not in self._mark_columns:
+            columns = {
+                row[1]
+                for row in self.connection.execute(f"PRAGMA table_info({table});")
+            }
+            self._mark_columns[table] = next(
+                (column for column in self.MARK_COLUMNS if column in columns), "rowid"
+            )
+        return self._mark_columns[table]
+
+    def high_water_marks(self) -> dict[str, Any]:
+        """
+        Current maximum of the mark column of every tracked table
+        and the last tombstone when they are recorded
+        """
+        marks = {
+            table: self.connection.execute(
+                f"SELECT MAX({self._mark_column(table)}) FROM {table};"
+            ).fetchone()[0]
+            for table in self.TRACKED_TABLES
+        }
+        if self.ensure_tombstones():
+            marks[self.TOMBSTONES] = self.connection.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM etl_deleted;"
+            ).fetchone()[0]
+        return marks
+
+    def ensure_tombstones(self) -> bool:
+        """Create the tombstone table and its triggers, False if impossible"""
+        try:
+            self.connection.execute(
+                """CREATE TABLE IF NOT EXISTS etl_deleted (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    tbl TEXT NOT NULL,
+                    id TEXT NOT NULL,
+                    film_work_id TEXT
+                );"""
+            )
+            for name, trigger in self.TOMBSTONE_TRIGGERS.items():
+                self.connection.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS etl_deleted_{name} AFTER {trigger};"
+                )
+        except sqlite3.OperationalError as error:
+            # Read-only databases are still extracted, without deletions
+            logger.warning("Deletions are not tracked: %s", error)
+            return False
+        return True
+
+    def deleted_films(self, after: int) -> Iterator[str]:
+        """Ids of films deleted after the `after` tombstone"""
+        for (id_,) in self.connection.execute(
+            """SELECT DISTINCT d.id FROM etl_deleted d
+            WHERE d.tbl == 'film_work' AND d.seq > ?
+            AND d.id NOT IN (SELECT id FROM film_work);""",
+            (after,),
+        ):
+            yield id_
+
+    def forget_deleted(self, upto: int) -> None:
+        """Drop tombstones up to `upto`, their deletions are applied"""
+        with self.connection:
+            self.connection.execute("DELETE FROM etl_deleted WHERE seq <= ?;", (upto,))
+
+    def _changed_films_filter(self, since: dict[str, Any]) -> tuple[str, list]:
+        """
+        WHERE-clause selecting films changed after `since` marks either
+        directly or through their persons, genres and links to them,
+        including the films that lost a person or a genre
+        """
+        subqueries = {
+            "film_work": "SELECT id FROM film_work WHERE {mark} > ?",
+            "person_film_work": (
+                "SELECT film_work_id FROM person_film_work WHERE {mark} > ?"
+            ),
+            "genre_film_work": (
+                "SELECT film_work_id FROM genre_film_work WHERE {mark} > ?"
+            ),
+            "person": """SELECT pfw.film_work_id
+                FROM person_film_work pfw
+                JOIN person p on pfw.person_id == p.id
+                WHERE p.{mark} > ?""",
+            "genre": """SELECT gfw.film_work_id
+                FROM genre_film_work gfw
+                JOIN genre g on gfw.genre_id == g.id
+                WHERE g.{mark} > ?""",
+        }
+        clauses, params = [], []
+        for table in self.TRACKED_TABLES:
+            if since.get(table) is None:
+                # Nothing was seen in this table before: every film may be stale
+                return "", []
+            clauses.append(
+                "fw.id in ("
+                + subqueries[table].format(mark=self._mark_column(table))
+                + ")"
+            )
+            params.append(since[table])
+        if since.get(self.TOMBSTONES) is not None:
+            clauses.append(
+                "fw.id in (SELECT film_work_id FROM etl_deleted WHERE seq > ?)"
+            )
+            params.append(since[self.TOMBSTONES])
+        return " and (" + " or ".join(clauses) + ")", params
+
+    # Indexes the batch extraction relies on, created on first use
+    INDEXES = {
+        "person_film_work_film_work_id_role_idx": "person_film_work(film_work_id, role)",
+        "genre_film_work_film_work_id_idx": "genre_film_work(film_work_id)",
+        "person_film_work_person_id_idx": "person_film_work(person_id)",
+        "genre_film_work_genre_id_idx": "genre_film_work(genre_id)",
+    }
+    ROLES = {
+        "actor": "film_actors",
+        "director": "film_directors",
+        "writer": "film_writers",
+    }
+
+    def shards(self, count: int, after: int = 0) -> list[dict]:
+        """Split films after `after` rowid into `count` ranges of equal size"""
+        total = self.connection.execute(
+            "SELECT COUNT(*) FROM film_work WHERE rowid > ?;", (after,)
+        ).fetchone()[0]
+        bounds = [after]
+        for number in range(1, count):
+            offset = total * number // count - 1
+            if offset < 0:
+                continue
+            (rowid,) = self.connection.execute(
+                "SELECT rowid FROM film_work WHERE rowid > ? ORDER BY rowid LIMIT 1 OFFSET ?;",
+                (after, offset),
+            ).fetchone()
+            if rowid > bounds[-1]:
+                bounds.append(rowid)
+        return [
+            {"after": start, "upto": end}
+            for start, end in zip(bounds, [*bounds[1:], None])
+        ]
+
+    def ensure_indexes(self) -> None:
+        for name, target in self.INDEXES.items():
+            try:
+                self.connection.execute(
+                    f"CREATE INDEX IF NOT EXISTS {name} ON {target};"
+                )
+            except sqlite3.OperationalError as error:
+                # Read-only databases are still extracted, only slower
+                logger.warning("Index %s is not created: %s", name, error)
 
-    def _extract_film_genres(self, films: list[str]) -> dict[str, list[str]]:
-        data = self.connection.execute(
-            """SELECT fw.id, GROUP_CONCAT(g.name, ',')
-            FROM genre g
-            JOIN genre_film_work gfw on g.id == gfw.genre_id
-            JOIN film_work fw on gfw.film_work_id == fw.id
-            WHERE fw.id in ("""
-            + ", ".join("?" for _ in films)
-            + """)
-            GROUP BY fw.id;""",
-            films,
-        ).fetchall()
-        return {id_: genres.split(",") for id_, genres in data}
-
-    def _extract_film_persons(self, films: list[str]) -> dict[str, str]:
-        data = self.connection.execute(
-            """SELECT p.id, p.full_name
-            FROM person p
-            JOIN person_film_work pfw on p.id == pfw.person_id
-            JOIN film_work fw on pfw.film_work_id == fw.id
-            WHERE fw.id in ("""
-            + ", ".join("?" for _ in films)
-            + """);""",
-            films,
-        ).fetchall()
-        return {id_: PersonSQL(id_, *record) for id_, *record in data}
-
-    def _extract_film_persons_by_role(
-        self, films: list[str], role: str
-    ) -> dict[str, list[str]]:
-        data = self.connection.execute(
-            """SELECT fw.id, GROUP_CONCAT(p.id, ',')
-            FROM person p
-            JOIN person_film_work pfw on p.id == pfw.person_id
-            JOIN film_work fw on pfw.film_work_id == fw.id
-            WHERE fw.id in ("""
-            + ", ".join("?" for _ in films)
-            + """) and pfw.role == ?
-            GROUP BY fw.id;""",
-            (*films, role),
-        ).fetchall()
-        return {id_: person_ids.split(",") for id_, person_ids in data}
-
-    # @retry_block()
     def _extract_film_data(self, film_ids: list[str]) -> dict:
+        """
+        Genres and role-tagged persons of all films in one query.
+        Film ids go through a temporary table instead of an IN-list,
+        so a batch is not limited by the number of SQL parameters
+        """
+        self.connection.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS batch_film_work (id TEXT PRIMARY KEY);"
+        )
+        self.connection.execute("DELETE FROM batch_film_work;")
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO batch_film_work (id) VALUES (?);",
+            ((id_,) for id_ in film_ids),
+        )
+        data = self.connection.execute(
+            """SELECT pfw.film_work_id, pfw.role, p.id, p.full_name
+            FROM batch_film_work b
+            JOIN person_film_work pfw on b.id == pfw.film_work_id
+            JOIN person p on pfw.person_id == p.id
+            UNION ALL
+            SELECT gfw.film_work_id, NULL, g.id, g.name
+            FROM batch_film_work b
+            JOIN genre_film_work gfw on b.id == gfw.film_work_id
+            JOIN genre g on gfw.genre_id == g.id;"""
+        )
         result = {
-            "genres": self._extract_film_genres(film_ids),
-            "persons": self._extract_film_persons(film_ids),
-            "film_actors": self._extract_film_persons_by_role(film_ids, "actor"),
-            "film_directors": self._extract_film_persons_by_role(film_ids, "director"),
-            "film_writers": self._extract_film_persons_by_role(film_ids, "writer"),
+            "genres": {},
+            "persons": {},
+            **{key: {} for key in self.ROLES.values()},
         }
+        for film_id, role, id_, name in data:
+            if role is None:
+                result["genres"].setdefault(film_id, []).append(name)
+                continue
+            result["persons"][id_] = PersonSQL(id_, name)
+            if key := self.ROLES.get(role):
+                result[key].setdefault(film_id, []).append(id_)
         return result
 
-    def bulk_generator(self, bulk_size: int | None = None) -> Generator[dict, None, None]:
+    def bulk_generator(
+        self,
+        bulk_size: int | None = None,
+        since: dict[str, Any] | None = None,
+        after: int = 0,
+        upto: int | None = None,
+    ) -> Generator[dict, None, None]:
+        """
+        since - high-water marks of the previous run, only films changed
+            after them are emitted; all films are emitted if not set
+        after - film_work rowid of the last acknowledged film, used to resume
+        upto - film_work rowid of the last film to emit
+        Every bulk carries "cursor" - the rowid of its last film
+        """
+        self.ensure_indexes()
+        changed_filter, params = self._changed_films_filter(since or {})
+        if upto is not None:
+            changed_filter += " and fw.rowid <= ?"
+            params.append(upto)
         with self.connection as cursor:
             film_cursor = cursor.execute(
-                "SELECT id, title, description, rating FROM film_work;"
+                """SELECT fw.rowid, fw.id, fw.title, fw.description, fw.rating
+                FROM film_work fw
+                WHERE fw.rowid > ?"""
+                + changed_filter
+                + """
+                ORDER BY fw.rowid;""",
+                (after, *params),
             )
             while True:
                 bulk = film_cursor.fetchmany(size=bulk_size or cursor.arraysize)
                 if bulk:
-                    films = [FilmWorkSQL(*record) for record in bulk]
+                    films = [FilmWorkSQL(*record) for _, *record in bulk]
                     result = {
                         "films": films,
+                        "cursor": bulk[-1][0],
                         **self._extract_film_data([film.id for film in films]),
                     }
                     logger.debug("DATA FETCHED: %s", result)
@@ -150,112 +506,677 @@ class SQLiteExtractor:
                 else:
                     break
 
+    def related_films(
+        self,
+        table: str,
+        since: dict[str, Any] | None = None,
+        deleted_after: int | None = None,
+    ) -> Iterator[tuple]:
+        """
+        (id, name, role or None for a genre, film id, title, rating) of the
+        persons (`table` "person") or genres of the films changed after
+        `since` marks, of all of them without marks, and of those deleted
+        or unlinked after the `deleted_after` tombstone. A person or genre
+        left without films comes as one row of its id and Nones.
+        Rows come ordered by person or genre id, so that their documents
+        are built one at a time
+        """
+        link = f"{table}_film_work"
+        changed_filter, params = self._changed_films_filter(since or {})
+        self.connection.execute(
+            f"CREATE TEMP TABLE IF NOT EXISTS stale_{table} (id TEXT PRIMARY KEY);"
+        )
+        self.connection.execute(f"DELETE FROM stale_{table};")
+        self.connection.execute(
+            f"""INSERT OR IGNORE INTO stale_{table} (id)
+            SELECT l.{table}_id
+            FROM film_work fw
+            JOIN {link} l on l.film_work_id == fw.id
+            WHERE 1"""
+            + changed_filter
+            + ";",
+            params,
+        )
+        if deleted_after is not None:
+            self.connection.execute(
+                f"""INSERT OR IGNORE INTO stale_{table} (id)
+                SELECT id FROM etl_deleted WHERE tbl == ? AND seq > ?;""",
+                (table, deleted_after),
+            )
+        role = "l.role" if table == "person" else "NULL"
+        name = "full_name" if table == "person" else "name"
+        roles = ", ".join(f"'{role}'" for role in self.ROLES)
+        yield from self.connection.execute(
+            f"""SELECT s.id, r.{name}, {role}, fw.id, fw.title, fw.rating
+            FROM stale_{table} s
+            LEFT JOIN (
+                {link} l
+                JOIN film_work fw on l.film_work_id == fw.id
+                JOIN {table} r on r.id == l.{table}_id
+            ) on l.{table}_id == s.id"""
+            + (f" and l.role in ({roles})" if table == "person" else "")
+            + """
+            ORDER BY s.id;"""
+        )
+
+    def film_facets(self) -> Iterator[tuple[float | None, list[str]]]:
+        """(rating, genre names) of every film"""
+        rows = self.connection.execute(
+            """SELECT fw.id, fw.rating, g.name
+            FROM film_work fw
+            LEFT JOIN genre_film_work gfw on gfw.film_work_id == fw.id
+            LEFT JOIN genre g on gfw.genre_id == g.id
+            ORDER BY fw.id;"""
+        )
+        for _, film_rows in itertools.groupby(rows, key=lambda row: row[0]):
+            film_rows = list(film_rows)
+            yield film_rows[0][1], [name for _, _, name in film_rows if name]
+
+    def suggestions(self) -> Iterator[Suggestion]:
+        """
+        Search-as-you-type entries: titles weighted by rating, persons by
+        the average rating of their films plus log2 of the films number
+        """
+        films = self.connection.execute(
+            "SELECT id, title, rating FROM film_work WHERE title IS NOT NULL;"
+        )
+        for id, title, rating in films:
+            yield Suggestion(title, "film", id, rating or 0.0)
+        persons = self.connection.execute(
+            """SELECT p.id, p.full_name, group_concat(DISTINCT pfw.role),
+                COUNT(DISTINCT pfw.film_work_id), AVG(fw.rating)
+            FROM person p
+            JOIN person_film_work pfw on pfw.person_id == p.id
+            JOIN film_work fw on pfw.film_work_id == fw.id
+            WHERE p.full_name IS NOT NULL
+            GROUP BY p.id;"""
+        )
+        for id, name, roles, films_count, rating in persons:
+            yield Suggestion(
+                name,
+                ",".join(sorted(roles.split(","))),
+                id,
+                round((rating or 0.0) + math.log2(films_count), 3),
+            )
+
+
+class RelatedDocs:
+    """
+    Documents of the persons and genres indexes built from the rows of
+    SQLiteExtractor.related_films. Only the films of one person or genre
+    are held at a time, whatever the size of the catalog. Persons and
+    genres left without films come as DeletedES
+    """
+
+    ROLE_BITS = {"actor": 1, "director": 2, "writer": 4}
+
+    @staticmethod
+    def _by_rating(film: FilmRefES) -> tuple:
+        return -(film.imdb_rating or 0.0), film.id
+
+    def _roles(self, mask: int) -> list[str]:
+        return [role for role, bit in self.ROLE_BITS.items() if mask & bit]
+
+    def person_docs(
+        self, rows: Iterable[tuple]
+    ) -> Iterator[PersonDetailES | DeletedES]:
+        for id_, person_rows in itertools.groupby(rows, key=lambda row: row[0]):
+            films: dict[str, FilmRefES] = {}
+            # A person may have several roles in a film
+            masks: dict[str, int] = {}
+            for _, name, role, film_id, title, rating in person_rows:
+                if film_id is None:
+                    break
+                films[film_id] = FilmRefES(film_id, title, rating)
+                masks[film_id] = masks.get(film_id, 0) | self.ROLE_BITS[role]
+            docs = [
+                PersonFilmES(
+                    film.id, film.title, film.imdb_rating, self._roles(masks[film.id])
+                )
+                for film in sorted(films.values(), key=self._by_rating)
+            ]
+            if not docs:
+                yield DeletedES(id_)
+                continue
+            all_roles = 0
+            for mask in masks.values():
+                all_roles |= mask
+            yield PersonDetailES(id_, name, self._roles(all_roles), docs)
+
+    def genre_docs(self, rows: Iterable[tuple]) -> Iterator[GenreES | DeletedES]:
+        for id_, genre_rows in itertools.groupby(rows, key=lambda row: row[0]):
+            films = {}
+            for _, name, _, film_id, title, rating in genre_rows:
+                if film_id is None:
+                    break
+                films[film_id] = FilmRefES(film_id, title, rating)
+            if not films:
+                yield DeletedES(id_)
+                continue
+            films = sorted(films.values(), key=self._by_rating)
+            yield GenreES(id_, name, len(films), films)
+
 
 class SQLite2ESTransformer:
+    def __init__(
+        self,
+        cache_size: int = PERSON_CACHE_SIZE,
+        facets: FacetCounts | None = None,
+    ) -> None:
+        """facets - counts genres and ratings of the transformed films"""
+        # Persons are shared by films of all batches instead of being
+        # created for every film they took part in
+        self.cache_size = cache_size
+        self._persons: dict[str, PersonES] = {}
+        self.facets = facets
+
+    def _person(self, id_: str, persons: dict[str, PersonSQL]) -> PersonES:
+        name = persons[id_].full_name
+        person = self._persons.get(id_)
+        if person is None or person.name != name:
+            if len(self._persons) >= self.cache_size:
+                self._persons.clear()
+            person = self._persons[id_] = PersonES(id=id_, name=name)
+        return person
+
     def transform(self, data: dict[str, Any]) -> list:
         transformed = []
+        persons = data["persons"]
         for film in data["films"]:
-            persons = data["persons"]
-            actors = [
-                ActorES(id=id_, name=persons[id_].full_name)
-                for id_ in data["film_actors"].get(film.id, [])
-            ]
-            directors = [
-                DirectorES(id=id_, name=persons[id_].full_name)
-                for id_ in data["film_directors"].get(film.id, [])
-            ]
-            writers = [
-                WriterES(id=id_, name=persons[id_].full_name)
-                for id_ in data["film_writers"].get(film.id, [])
-            ]
+            actors, directors, writers = (
+                [self._person(id_, persons) for id_ in data[key].get(film.id, ())]
+                for key in ("film_actors", "film_directors", "film_writers")
+            )
             transformed.append(
                 FilmES(
                     id=film.id,
                     title=film.title,
                     description=film.description,
                     imdb_rating=film.rating,
-                    genres=",".join(genre for genre in data["genres"][film.id]),
-                    actors_names=",".join(actor.name for actor in actors),
-                    directors_names=",".join(director.name for director in directors),
-                    writers_names=",".join(writer.name for writer in writers),
-                    actors=[asdict(actor) for actor in actors],
-                    directors=[asdict(director) for director in directors],
-                    writers=[asdict(writer) for writer in writers],
+                    genres=",".join(data["genres"][film.id]),
+                    actors_names=",".join([actor.name for actor in actors]),
+                    directors_names=",".join([director.name for director in directors]),
+                    writers_names=",".join([writer.name for writer in writers]),
+                    actors=actors,
+                    directors=directors,
+                    writers=writers,
                 )
             )
+        if self.facets is not None:
+            for film in data["films"]:
+                self.facets.add(data["genres"].get(film.id, ()), film.rating)
         logger.debug("DATA TRANSFORMED: %s", transformed)
         return transformed
 
 
+class BulkSerializer:
+    """
+    Encodes FilmES records to bulk lines equal byte for byte to
+    json.dumps of the action and of asdict(record), but without asdict
+    deep copies. Encoded persons are cached across batches
+    """
+
+    def __init__(self, index: str, cache_size: int = PERSON_CACHE_SIZE) -> None:
+        self.cache_size = cache_size
+        self._action = '{"index": {"_index": ' + self._encode(index) + ', "_id": '
+        self._keys = [(field.name, f'"{field.name}": ') for field in fields(FilmES)]
+        self._persons: dict[tuple[str, str], str] = {}
+
+    @staticmethod
+    def _encode(value: Any) -> str:
+        if value.__class__ is str:
+            return encode_basestring_ascii(value)
+        return json.dumps(value)
+
+    def _encode_person(self, person: PersonES) -> str:
+        key = (person.id, person.name)
+        if (fragment := self._persons.get(key)) is None:
+            if len(self._persons) >= self.cache_size:
+                self._persons.clear()
+            fragment = self._persons[key] = (
+                '{"id": '
+                + self._encode(person.id)
+                + ', "name": '
+                + self._encode(person.name)
+                + "}"
+            )
+        return fragment
+
+    def serialize(self, record: FilmES) -> bytes:
+        parts = [self._action, self._encode(record.id), "}}\n{"]
+        for number, (name, key) in enumerate(self._keys):
+            if number:
+                parts.append(", ")
+            parts.append(key)
+            value = getattr(record, name)
+            if value.__class__ is list:
+                parts.append("[" + ", ".join(map(self._encode_person, value)) + "]")
+            else:
+                parts.append(self._encode(value))
+        parts.append("}\n")
+        return "".join(parts).encode()
+
+
+class Throttle:
+    """
+    Pause before every bulk request shared by all loader threads.
+    It grows while ES rejects requests and decays while ES accepts them
+    """
+
+    def __init__(self, max_delay: float = ES_BULK_MAX_BACKOFF) -> None:
+        self.max_delay = max_delay
+        self.delay = 0.0
+        self._lock = threading.Lock()
+
+    def slow_down(self) -> None:
+        with self._lock:
+            self.delay = min(self.max_delay, max(self.delay * 1.5, 0.05))
+            logger.warning("ES rejects requests, bulk delay is %.2fs", self.delay)
+
+    def speed_up(self) -> None:
+        with self._lock:
+            self.delay = self.delay / 2 if self.delay > 0.01 else 0.0
+
+    def wait(self) -> None:
+        if delay := self.delay:
+            time.sleep(delay)
+
+
 class ESLoader:
-    def __init__(self, url: str = "", index: str = "") -> None:
+    # Successful items are dropped from bulk responses, ids are kept
+    # so that failed items can be matched with their documents
+    FILTER_PATH = "errors,items.*._id,items.*.error"
+    # Item errors caused by cluster pressure rather than by the document
+    RETRYABLE_ERRORS = {
+        "es_rejected_execution_exception",
+        "circuit_breaking_exception",
+        "unavailable_shards_exception",
+        "process_cluster_event_timeout_exception",
+    }
+    RETRYABLE_STATUSES = {429, 502, 503, 504}
+
+    def __init__(
+        self,
+        url: str = "",
+        index: str = "",
+        max_bytes: int = ES_BULK_MAX_BYTES,
+        compress: bool = ES_BULK_COMPRESS,
+        pool_size: int = ETL_LOADERS,
+        retries: int = ES_BULK_RETRIES,
+        backoff: float = ES_BULK_BACKOFF,
+        dead_letter_file: str = ES_DEAD_LETTER_FILE,
+    ) -> None:
         self.url = url
         self.index = index
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.retries = retries
+        self.backoff = backoff
+        self.dead_letter_file = dead_letter_file
+        self.serializer = BulkSerializer(index)
+        self.throttle = Throttle()
+        self._dead_letter_lock = threading.Lock()
+        # Keep-alive connections are shared by all loader threads
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["Content-Type"] = "application/x-ndjson"
+        if compress:
+            self.session.headers["Content-Encoding"] = "gzip"
 
-    def _prepare_bulk_query(self, data: list[FilmES]) -> str:
+    def set_index(self, index: str) -> None:
+        self.index = index
+        self.serializer = BulkSerializer(index)
+
+    def _prepare_bulk_query(
+        self, data: Iterable, serialize: Callable[[Any], bytes] | None = None
+    ) -> Generator[dict[str, bytes], None, None]:
         """
         {"index": {"_index": "movies", "_id": "my_id"}}
         {"field1": "1", "field2": "2"}
         {"index": {"_index": "movies", "_id": "my_id2"}}
         {"field1": "3", "field2": "4"}
+
+        Yields bulk lines by document id, at most `max_bytes` at once
+        (a single document exceeding it is sent alone)
         """
-        return (
-            "\n".join(
-                json.dumps({"index": {"_index": self.index, "_id": record.id}})
-                + "\n"
-                + json.dumps(asdict(record))
-                for record in data
-            )
-            + "\n"
+        serialize = serialize or self.serializer.serialize
+        lines, size = {}, 0
+        for record in data:
+            line = serialize(record)
+            if lines and size + len(line) > self.max_bytes:
+                yield lines
+                lines, size = {}, 0
+            lines[record.id] = line
+            size += len(line)
+        if lines:
+            yield lines
+
+    def _sleep(self, attempt: int) -> None:
+        """Exponential backoff with full jitter"""
+        time.sleep(
+            random.uniform(0, min(ES_BULK_MAX_BACKOFF, self.backoff * 2**attempt))
         )
 
-    def bulk_load(self, data: list[FilmES]) -> None:
-        payload = self._prepare_bulk_query(data)
+    def _send(self, payload: bytes) -> dict:
         logger.debug("DATA BEFORE LOADING: %s", payload)
-        try:
-            response = requests.post(
-                f"{self.url}/_bulk",
-                data=payload,
-                headers={"Content-Type": "application/x-ndjson"},
+        BULK_BYTES.observe(len(payload))
+        if self.compress:
+            payload = gzip.compress(payload, compresslevel=1)
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self._sleep(attempt)
+            self.throttle.wait()
+            BULK_SENT_BYTES.inc(len(payload))
+            try:
+                with BULK_SECONDS.time():
+                    response = self.session.post(
+                        f"{self.url}/_bulk",
+                        data=payload,
+                        params={"filter_path": self.FILTER_PATH},
+                    )
+            except requests.ConnectionError as error:
+                ERRORS.inc(kind="connection")
+                logger.warning(
+                    "Connection with ES failed, attempt %d: %s", attempt, error
+                )
+                last_error = error
+                continue
+            if response.status_code in self.RETRYABLE_STATUSES:
+                ERRORS.inc(kind="throttled")
+                self.throttle.slow_down()
+                last_error = requests.HTTPError(response=response)
+                continue
+            try:
+                response.raise_for_status()
+            except requests.RequestException as error:
+                ERRORS.inc(kind="failed")
+                logger.error("Bulk request failed: %s", response.text)
+                raise RuntimeError(error)
+            return response.json()
+        logger.error("Connection with ES failed")
+        raise RuntimeError(last_error)
+
+    def _dead_letter(self, lines: dict[str, bytes], reason: Any) -> None:
+        """Keep documents ES did not take in a file replayable with _bulk"""
+        logger.error("DATA NOT LOADED (%s): %s", reason, list(lines))
+        ERRORS.inc(len(lines), kind="dead_letter")
+        with self._dead_letter_lock, open(self.dead_letter_file, "ab") as file:
+            file.writelines(lines.values())
+
+    def _load(self, lines: dict[str, bytes]) -> None:
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self._sleep(attempt)
+            json_response = self._send(b"".join(lines.values()))
+            retry, rejected = {}, {}
+            if json_response["errors"]:
+                for item in json_response["items"]:
+                    (result,) = item.values()
+                    if not (error_message := result.get("error")):
+                        continue
+                    if error_message.get("type") in self.RETRYABLE_ERRORS:
+                        retry[result["_id"]] = lines[result["_id"]]
+                    else:
+                        logger.error(error_message)
+                        rejected[result["_id"]] = lines[result["_id"]]
+            if rejected:
+                ERRORS.inc(len(rejected), kind="rejected")
+                self._dead_letter(rejected, "rejected")
+            if retry:
+                ERRORS.inc(len(retry), kind="retried")
+                self.throttle.slow_down()
+            else:
+                self.throttle.speed_up()
+
+            logger.debug(
+                "DATA LOADED: %s",
+                [id_ for id_ in lines if id_ not in retry and id_ not in rejected],
             )
+            if not retry:
+                return
+            lines = retry
+        self._dead_letter(lines, "retries exhausted")
+
+    def bulk_load(self, data: list[FilmES]) -> None:
+        for lines in self._prepare_bulk_query(data):
+            self._load(lines)
+
+    def load_documents(self, index: str, data: Iterable) -> int:
+        """
+        Dataclass records with an `id` into `index`, DeletedES records are
+        removed from it. Returns the number of records
+        """
+        action = '{"index": {"_index": ' + json.dumps(index) + ', "_id": '
+        delete = '{"delete": {"_index": ' + json.dumps(index) + ', "_id": '
+
+        def serialize(record: Any) -> bytes:
+            if record.__class__ is DeletedES:
+                return (delete + json.dumps(record.id) + "}}\n").encode()
+            return (
+                action
+                + json.dumps(record.id)
+                + "}}\n"
+                + json.dumps(asdict(record))
+                + "\n"
+            ).encode()
+
+        count = 0
+        for lines in self._prepare_bulk_query(data, serialize):
+            self._load(lines)
+            count += len(lines)
+        return count
+
+
+class ESIndexManager:
+    """
+    Versions of the index `alias` is switched between. A version is filled
+    with refresh and replicas off, then optimized and published atomically
+    """
+
+    # <alias>_<timestamp with microseconds>_<random suffix>: versions sort by
+    # creation time and two rebuilds never collide. Versions created before
+    # the suffix have a timestamp of seconds only
+    VERSION = r"_\d{14}(?:\d{6}_[0-9a-f]{8})?"
+
+    def __init__(
+        self,
+        url: str = "",
+        alias: str = "",
+        schema_file: str = ES_SCHEMA_FILE,
+        retention: int = ES_INDEX_RETENTION,
+    ) -> None:
+        self.url = url
+        self.alias = alias
+        self.schema_file = schema_file
+        self.retention = retention
+        self.session = requests.Session()
+
+    def _request(self, method: str, path: str, **kwargs) -> requests.Response:
+        try:
+            response = self.session.request(method, f"{self.url}/{path}", **kwargs)
+            response.raise_for_status()
         except requests.RequestException as error:
-            logger.error("Connection with ES failed")
+            logger.error("ES request %s /%s failed", method, path)
             raise RuntimeError(error)
+        return response
+
+    def schema(self) -> dict:
+        """Index body from the curl command in the schema file, without comments"""
+        with open(self.schema_file) as file:
+            command = file.read()
+        body = command[
+            command.index("'", command.index("-d")) + 1 : command.rindex("'")
+        ]
+        return json.loads(re.sub(r"^\s*//.*$", "", body, flags=re.MULTILINE))
+
+    def create(self) -> str:
+        stamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
+        name = f"{self.alias}_{stamp}_{secrets.token_hex(4)}"
+        body = self.schema()
+        body.setdefault("settings", {}).update(
+            {"refresh_interval": "-1", "number_of_replicas": 0}
+        )
+        self._request("PUT", name, json=body)
+        logger.info("Index %s is created", name)
+        return name
+
+    def publish(self, name: str) -> None:
+        settings = self.schema().get("settings", {})
+        # Unset values fall back to ES defaults
+        self._request(
+            "PUT",
+            f"{name}/_settings",
+            json={
+                "index": {
+                    "refresh_interval": settings.get("refresh_interval"),
+                    "number_of_replicas": settings.get("number_of_replicas"),
+                }
+            },
+        )
+        self._request("POST", f"{name}/_refresh")
+        self._request("POST", f"{name}/_forcemerge", params={"max_num_segments": 1})
+        self.switch_alias(name)
+        self.cleanup()
+
+    def switch_alias(self, name: str) -> None:
+        actions = [{"add": {"index": name, "alias": self.alias}}]
+        response = self.session.get(f"{self.url}/_alias/{self.alias}")
+        if response.status_code == 200:
+            actions += [
+                {"remove": {"index": index, "alias": self.alias}}
+                for index in response.json()
+                if index != name
+            ]
+        elif self.session.head(f"{self.url}/{self.alias}").status_code == 200:
+            # Index loaded before versioning, it is replaced by the alias
+            actions.append({"remove_index": {"index": self.alias}})
+        self._request("POST", "_aliases", json={"actions": actions})
+        logger.info("Alias %s is switched to %s", self.alias, name)
+
+    def ensure(self) -> str:
+        """The alias, an empty first version is published if there is none"""
+        if self.session.head(f"{self.url}/{self.alias}").status_code == 404:
+            self.publish(self.create())
+        return self.alias
+
+    def bump_generation(self, generation: str | None = None) -> str:
+        """
+        Mark the index data as changed, the API drops responses
+        cached for previous generations
+        """
+        generation = generation or str(time.time_ns())
+        self._request(
+            "PUT", f"{self.alias}/_mapping", json={"_meta": {"generation": generation}}
+        )
+        logger.info("Index %s generation is %s", self.alias, generation)
+        return generation
 
-        json_response = json.loads(response.content.decode())
-        for item in json_response["items"]:
-            if error_message := item["index"].get("error"):
-                logger.error(error_message)
-
-        logger.debug(
-            "DATA LOADED: %s",
-            [
-                item["index"]["_id"]
-                for item in json_response["items"]
-                if item["index"]["status"] in (200, 201)
-            ],
+    def cleanup(self) -> None:
+        """Delete all but `retention` latest versions, never the published one"""
+        response = self._request(
+            "GET",
+            f"_cat/indices/{self.alias}_*",
+            params={"format": "json", "h": "index"},
         )
+        published = set(self._request("GET", f"_alias/{self.alias}").json())
+        versions = sorted(
+            index["index"]
+            for index in response.json()
+            if re.fullmatch(re.escape(self.alias) + self.VERSION, index["index"])
+        )
+        stale = versions[: -self.retention] if self.retention > 0 else versions
+        for index in stale:
+            if index not in published:
+                self._request("DELETE", index)
+                logger.info("Index %s is deleted", index)
+
+
+def summary(elapsed: float) -> dict[str, Any]:
+    """Totals of the run from the metrics registry"""
+    stages = {}
+    for stage in STAGES:
+        batches = BATCH_SECONDS.summary(stage=stage)
+        docs = STAGE_DOCS.value(stage=stage)
+        stages[stage] = {
+            "docs": docs,
+            "batches": batches["count"],
+            "busy_seconds": round(batches["sum"], 3),
+            "docs_per_s": round(docs / batches["sum"]) if batches["sum"] else 0,
+            "batch_p50_seconds": batches["p50"],
+            "batch_p99_seconds": batches["p99"],
+        }
+    requests_ = BULK_SECONDS.summary()
+    return {
+        "elapsed_seconds": round(elapsed, 3),
+        "docs": stages["load"]["docs"],
+        "docs_per_s": round(stages["load"]["docs"] / elapsed) if elapsed else 0,
+        "stages": stages,
+        "bulk": {
+            "requests": requests_["count"],
+            "request_p50_seconds": requests_["p50"],
+            "request_p99_seconds": requests_["p99"],
+            "bytes": BULK_BYTES.summary()["sum"],
+            "sent_bytes": BULK_SENT_BYTES.value(),
+        },
+        "errors": {kind: count for (kind,), count in ERRORS.snapshot().items()},
+    }
+
+
+def write_summary(run: dict[str, Any], file_path: str) -> None:
+    logger.info(
+        "ETL run: %d docs in %.2fs (%d docs/s), %d bulk requests, "
+        "%d bytes sent, errors: %s",
+        run["docs"],
+        run["elapsed_seconds"],
+        run["docs_per_s"],
+        run["bulk"]["requests"],
+        run["bulk"]["sent_bytes"],
+        run["errors"] or "none",
+    )
+    if file_path:
+        with open(file_path, "w") as file:
+            json.dump(run, file, indent=2)
 
 
 class ETL:
-    def __init__(self, extractor, transformer, loader) -> None:
+    def __init__(
+        self,
+        extractor,
+        transformer,
+        loader,
+        state: State | None = None,
+        persons: "ESIndexManager | None" = None,
+        genres: "ESIndexManager | None" = None,
+    ) -> None:
+        """
+        persons, genres - indexes filled at the end of a run with the persons
+        and genres of the films it loaded
+        """
         self.extractor = extractor
         self.transformer = transformer
         self.loader = loader
+        self.state = state
+        self.persons = persons
+        self.genres = genres
 
     @staticmethod
     def timeit(func: Callable) -> Callable:
         @wraps(func)
         def inner(self, *args, **kwargs) -> Any:
+            REGISTRY.reset()
             start = time.time()
             result = func(self, *args, **kwargs)
-            logger.info(f"Elapsed in: {time.time()-start} seconds")
+            elapsed = time.time() - start
+            logger.info(f"Elapsed in: {elapsed} seconds")
+            write_summary(summary(elapsed), ETL_METRICS_FILE)
             return result
 
         return inner
 
-    def bulk_generator(self, bulk_size) -> Generator[dict, None, None]:
-        yield from self.extractor.bulk_generator(bulk_size=bulk_size)
+    def bulk_generator(self, bulk_size, **kwargs) -> Generator[dict, None, None]:
+        yield from self.extractor.bulk_generator(bulk_size=bulk_size, **kwargs)
 
     def transform(self, data) -> list:
         return self.transformer.transform(data=data)
@@ -263,10 +1184,418 @@ class ETL:
     def bulk_load(self, data) -> None:
         return self.loader.bulk_load(data=data)
 
+    def _start_run(self, incremental: bool, rebuild: bool = False) -> dict:
+        """
+        Resume the unfinished run if there is one, start a new one otherwise.
+        A run remembers the marks it started from ("since"), the marks to
+        commit when it finishes ("until"), the last applied tombstone
+        ("deleted_after") and the last acknowledged film ("after").
+        A rebuild run also remembers the index it fills ("index")
+        """
+        if self.state is None:
+            return {"since": None, "until": None, "deleted_after": None, "after": 0}
+        if run := self.state.get_state("run"):
+            if bool(run.get("index")) == rebuild:
+                logger.info("Resuming ETL run after film_work rowid %s", run["after"])
+                return run
+            logger.warning("Discarding unfinished ETL run: %s", run)
+        marks = self.state.get_state("marks") or {}
+        run = {
+            "since": marks if incremental and marks else None,
+            "until": self.extractor.high_water_marks(),
+            # A rebuild fills new indexes, there is nothing to delete
+            "deleted_after": None if rebuild else marks.get(SQLiteExtractor.TOMBSTONES),
+            "after": 0,
+        }
+        self.state.set_state("run", run)
+        return run
+
+    def _acknowledge(self, run: dict, cursor: int) -> None:
+        """Remember that every film up to `cursor` is loaded"""
+        run["after"] = cursor
+        if self.state is not None:
+            self.state.set_state("run", run)
+
+    @staticmethod
+    def _partial(run: dict) -> bool:
+        """The run will not see every film: it is incremental or resumed"""
+        return run["since"] is not None or bool(run["after"] or run.get("shards"))
+
+    def _load_related(self, run: dict, rebuild: bool = False) -> None:
+        """
+        Fill the persons and genres indexes with those of the films of the
+        run, streamed from SQLite and loaded as they are built
+        """
+        related = RelatedDocs()
+        for table, indices, docs in (
+            ("person", self.persons, related.person_docs),
+            ("genre", self.genres, related.genre_docs),
+        ):
+            if indices is None:
+                continue
+            index = indices.create() if rebuild else indices.ensure()
+            rows = self.extractor.related_films(
+                table, run["since"], run.get("deleted_after")
+            )
+            count = self.loader.load_documents(index, docs(rows))
+            if rebuild:
+                indices.publish(index)
+            logger.info("%s documents are loaded into %s", count, index)
+
+    def _delete_films(self, run: dict) -> None:
+        """Remove films deleted since the previous run from the index"""
+        if (after := run.get("deleted_after")) is None:
+            return
+        deleted = (DeletedES(id_) for id_ in self.extractor.deleted_films(after))
+        if count := self.loader.load_documents(self.loader.index, deleted):
+            logger.info("%s films are deleted from %s", count, self.loader.index)
+
+    def _count_facets(self, partial: bool) -> None:
+        """Facets must cover the catalog, a partial run counts them anew"""
+        if (facets := self.transformer.facets) is None or not partial:
+            return
+        facets.clear()
+        for rating, genres in self.extractor.film_facets():
+            facets.add(genres, rating)
+
+    def _finish_run(self, run: dict) -> None:
+        if self.state is not None:
+            self.state.set_state("marks", run["until"])
+            self.state.set_state("run", None)
+            if (upto := run["until"].get(SQLiteExtractor.TOMBSTONES)) is not None:
+                self.extractor.forget_deleted(upto)
+
+    def _process(self, bulks: Iterator[dict], acknowledge: Callable) -> int:
+        """Returns the number of loaded films"""
+        stats = {name: StageStats(name) for name in STAGES}
+        start = time.perf_counter()
+        while True:
+            fetch_start = time.perf_counter()
+            if (bulk := next(bulks, None)) is None:
+                break
+            stats["extract"].add(len(bulk["films"]), time.perf_counter() - fetch_start)
+            with stats["transform"].measure(len(bulk["films"])):
+                data = self.transform(bulk)
+            with stats["load"].measure(len(data)):
+                self.bulk_load(data)
+            acknowledge(bulk["cursor"])
+        elapsed = time.perf_counter() - start
+        for stage_stats in stats.values():
+            stage_stats.report(elapsed)
+        return stats["load"].docs
+
+    def _run(self, run: dict) -> None:
+        self._process(
+            self.bulk_generator(
+                bulk_size=BULK_SIZE, since=run["since"], after=run["after"]
+            ),
+            acknowledge=lambda cursor: self._acknowledge(run, cursor),
+        )
+
     @timeit
-    def do(self) -> None:
-        for bulk in self.bulk_generator(bulk_size=BULK_SIZE):
-            self.bulk_load(self.transform(bulk))
+    def do(self, incremental: bool = False) -> None:
+        run = self._start_run(incremental)
+        partial = self._partial(run)
+        self._run(run)
+        self._delete_films(run)
+        self._load_related(run)
+        self._count_facets(partial)
+        self._finish_run(run)
+
+    @timeit
+    def rebuild(self, indices: "ESIndexManager") -> None:
+        """
+        Full reload into a new version of the index, which replaces
+        the served one only after it is completely loaded
+        """
+        run = self._start_run(incremental=False, rebuild=True)
+        if not run.get("index"):
+            run["index"] = indices.create()
+            if self.state is not None:
+                self.state.set_state("run", run)
+        self.loader.set_index(run["index"])
+        partial = self._partial(run)
+        self._run(run)
+        indices.publish(run["index"])
+        self._load_related(run, rebuild=True)
+        self._count_facets(partial)
+        self._finish_run(run)
+
+
+class PipelineAborted(Exception):
+    """Another stage of the pipeline failed"""
+
+
+class StageStats:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.bulks = 0
+        self.docs = 0
+        self.busy = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, docs: int, busy: float) -> None:
+        with self._lock:
+            self.bulks += 1
+            self.docs += docs
+            self.busy += busy
+        BATCH_SECONDS.observe(busy, stage=self.name)
+        STAGE_DOCS.inc(docs, stage=self.name)
+
+    @contextlib.contextmanager
+    def measure(self, docs: int) -> Generator[None, None, None]:
+        start = time.perf_counter()
+        yield
+        self.add(docs, time.perf_counter() - start)
+
+    def report(self, elapsed: float) -> None:
+        logger.info(
+            "Stage %s: %d docs in %d bulks, busy %.2fs (%.0f docs/s), %.0f docs/s overall",
+            self.name,
+            self.docs,
+            self.bulks,
+            self.busy,
+            self.docs / self.busy if self.busy else 0,
+            self.docs / elapsed if elapsed else 0,
+        )
+
+
+class Acknowledger:
+    """
+    Bulks are loaded out of order by concurrent loaders, but a run may only
+    move its cursor past a bulk once all the bulks before it are loaded too
+    """
+
+    def __init__(self, callback: Callable) -> None:
+        self.callback = callback
+        self._next = 0
+        self._done: dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def done(self, sequence: int, cursor: int) -> None:
+        with self._lock:
+            self._done[sequence] = cursor
+            if self._next not in self._done:
+                return
+            while self._next in self._done:
+                cursor = self._done.pop(self._next)
+                self._next += 1
+            self.callback(cursor)
+
+
+class PipelinedETL(ETL):
+    """
+    Extractor, transformer and `loaders` loader workers run at the same time
+    and pass bulks through bounded queues, so a slow stage holds the others
+    back instead of piling bulks up in memory
+    """
+
+    _STOP = object()
+
+    def __init__(
+        self,
+        *args,
+        loaders: int = ETL_LOADERS,
+        queue_size: int = ETL_QUEUE_SIZE,
+        **kwargs,
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.loaders = loaders
+        self.queue_size = queue_size
+
+    def _put(self, queue_: queue.Queue, item: Any, failed: threading.Event) -> None:
+        while not failed.is_set():
+            try:
+                return queue_.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+        raise PipelineAborted
+
+    def _get(self, queue_: queue.Queue, failed: threading.Event) -> Any:
+        while not failed.is_set():
+            try:
+                return queue_.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        raise PipelineAborted
+
+    def _process(self, bulks: Iterator[dict], acknowledge: Callable) -> int:
+        stats = {name: StageStats(name) for name in STAGES}
+        to_transform = queue.Queue(maxsize=self.queue_size)
+        to_load = queue.Queue(maxsize=self.queue_size)
+        acknowledger = Acknowledger(acknowledge)
+        failed = threading.Event()
+        errors = []
+
+        def stage(func: Callable) -> Callable:
+            @wraps(func)
+            def inner() -> None:
+                try:
+                    func()
+                except PipelineAborted:
+                    pass
+                except Exception as error:
+                    logger.exception("ETL stage %s failed", func.__name__)
+                    errors.append(error)
+                    failed.set()
+
+            return inner
+
+        @stage
+        def transform() -> None:
+            while (item := self._get(to_transform, failed)) is not self._STOP:
+                sequence, bulk = item
+                with stats["transform"].measure(len(bulk["films"])):
+                    data = self.transform(bulk)
+                self._put(to_load, (sequence, bulk["cursor"], data), failed)
+            for _ in range(self.loaders):
+                self._put(to_load, self._STOP, failed)
+
+        @stage
+        def load() -> None:
+            while (item := self._get(to_load, failed)) is not self._STOP:
+                sequence, cursor, data = item
+                with stats["load"].measure(len(data)):
+                    self.bulk_load(data)
+                acknowledger.done(sequence, cursor)
+
+        @stage
+        def extract() -> None:
+            # SQLite connections are bound to the thread that created them,
+            # so extraction stays in the calling thread
+            for sequence in itertools.count():
+                fetch_start = time.perf_counter()
+                bulk = next(bulks, None)
+                if bulk is None:
+                    break
+                stats["extract"].add(
+                    len(bulk["films"]), time.perf_counter() - fetch_start
+                )
+                self._put(to_transform, (sequence, bulk), failed)
+            self._put(to_transform, self._STOP, failed)
+
+        start = time.perf_counter()
+        workers = [threading.Thread(target=transform, name="etl-transform")] + [
+            threading.Thread(target=load, name=f"etl-load-{number}")
+            for number in range(self.loaders)
+        ]
+        for worker in workers:
+            worker.start()
+        extract()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+        for stage_stats in stats.values():
+            stage_stats.report(elapsed)
+        if errors:
+            raise errors[0]
+        return stats["load"].docs
+
+
+def run_shard(
+    db_name: str,
+    loader_options: dict,
+    number: int,
+    shard: dict,
+    since: dict[str, Any] | None,
+    progress: queue.Queue,
+    count_facets: bool = False,
+) -> tuple[int, dict, FacetCounts | None]:
+    """
+    Extract, transform and load films of one shard in a worker process.
+    Acknowledged cursors are reported to the parent through `progress`.
+    Returns the number of loaded films, the metrics of the shard and
+    with `count_facets` its facets
+    """
+    REGISTRY.reset()
+    with contextlib.closing(
+        sqlite3.connect(f"file:{db_name}?mode=ro", uri=True)
+    ) as connection:
+        etl = PipelinedETL(
+            SQLiteExtractor(connection=connection),
+            SQLite2ESTransformer(facets=FacetCounts() if count_facets else None),
+            ESLoader(**loader_options),
+        )
+        docs = etl._process(
+            etl.bulk_generator(
+                bulk_size=BULK_SIZE,
+                since=since,
+                after=shard["after"],
+                upto=shard["upto"],
+            ),
+            acknowledge=lambda cursor: progress.put((number, cursor)),
+        )
+    return docs, REGISTRY.snapshot(), etl.transformer.facets
+
+
+class ShardedETL(ETL):
+    """
+    Films are split into `workers` rowid ranges, every range is processed
+    by its own process with a read-only SQLite connection. The parent
+    process keeps the run state and merges progress of the shards
+    """
+
+    def __init__(
+        self, *args, workers: int = ETL_WORKERS, db_name: str = DB_NAME, **kwargs
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.workers = workers
+        self.db_name = db_name
+
+    def _acknowledge_shard(self, run: dict, number: int, cursor: int) -> None:
+        run["shards"][number]["after"] = cursor
+        if self.state is not None:
+            self.state.set_state("run", run)
+
+    def _run(self, run: dict) -> None:
+        if not run.get("shards"):
+            run["shards"] = self.extractor.shards(self.workers, after=run["after"])
+            if self.state is not None:
+                self.state.set_state("run", run)
+        # Workers open the database read-only and can not create indexes
+        self.extractor.ensure_indexes()
+
+        loader_options = {"url": self.loader.url, "index": self.loader.index}
+        docs, errors = 0, []
+        with multiprocessing.Manager() as manager, ProcessPoolExecutor(
+            max_workers=len(run["shards"])
+        ) as pool:
+            progress = manager.Queue()
+            futures = [
+                pool.submit(
+                    run_shard,
+                    self.db_name,
+                    loader_options,
+                    number,
+                    shard,
+                    run["since"],
+                    progress,
+                    self.transformer.facets is not None,
+                )
+                for number, shard in enumerate(run["shards"])
+            ]
+            pending = set(futures)
+            while pending or not progress.empty():
+                try:
+                    number, cursor = progress.get(timeout=0.1)
+                except queue.Empty:
+                    pending = {future for future in pending if not future.done()}
+                    continue
+                self._acknowledge_shard(run, number, cursor)
+            for number, future in enumerate(futures):
+                if error := future.exception():
+                    logger.error("ETL shard %d failed: %s", number, error)
+                    errors.append(error)
+                else:
+                    shard_docs, shard_metrics, shard_facets = future.result()
+                    logger.info("ETL shard %d loaded %d films", number, shard_docs)
+                    docs += shard_docs
+                    REGISTRY.merge(shard_metrics)
+                    if shard_facets is not None:
+                        self.transformer.facets.merge(shard_facets)
+        logger.info("ETL loaded %d films with %d workers", docs, len(run["shards"]))
+        if errors:
+            raise errors[0]
 
 
 if __name__ == "__main__":
@@ -275,9 +1604,79 @@ if __name__ == "__main__":
         level=logging.INFO,
         datefmt="%H:%M:%S",
     )
+    parser = argparse.ArgumentParser(description="SQLite -> Elasticsearch ETL")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=ETL_WORKERS,
+        help="number of processes loading film_work shards in parallel",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        default=ETL_INCREMENTAL,
+        help="load only films changed or deleted since the previous run",
+    )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="load all films into a new index version and switch the alias to it",
+    )
+    args = parser.parse_args()
     with contextlib.closing(sqlite3.connect(DB_NAME)) as connection:
-        ETL(
-            SQLiteExtractor(connection=connection),
-            SQLite2ESTransformer(),
+        extractor = SQLiteExtractor(connection=connection)
+        related = {
+            name: ESIndexManager(url=ES_URL, alias=alias, schema_file=schema_file)
+            for name, alias, schema_file in (
+                ("persons", ES_PERSONS_INDEX_NAME, ES_PERSONS_SCHEMA_FILE),
+                ("genres", ES_GENRES_INDEX_NAME, ES_GENRES_SCHEMA_FILE),
+            )
+            if alias
+        }
+        components = (
+            extractor,
+            SQLite2ESTransformer(facets=FacetCounts() if FACETS_FILE else None),
             ESLoader(url=ES_URL, index=ES_INDEX_NAME),
-        ).do()
+            State(JsonFileStorage(ETL_STATE_FILE)),
+        )
+        if args.workers > 1:
+            etl = ShardedETL(*components, workers=args.workers, **related)
+        else:
+            etl = PipelinedETL(*components, **related)
+        indices = ESIndexManager(url=ES_URL, alias=ES_INDEX_NAME)
+        if args.rebuild:
+            etl.rebuild(indices)
+        else:
+            etl.do(incremental=args.incremental)
+        generation = str(time.time_ns())
+        if SUGGEST_FILE:
+            # Written before the bump, the API reloads it on the new generation
+            count = SuggestDictionary.write(
+                SUGGEST_FILE, extractor.suggestions(), generation
+            )
+            logger.info("%s suggestions are written to %s", count, SUGGEST_FILE)
+        if FACETS_FILE:
+            # Also before the bump, the API reloads it on the new generation
+            etl.transformer.facets.write(FACETS_FILE, generation)
+            logger.info("Facets are written to %s", FACETS_FILE)
+        if CATALOG_WORDS_FILE:
+            # Vocabulary of the API query corrector
+            vocabulary = catalog_words(DB_NAME)
+            compile_dictionary(vocabulary, CATALOG_WORDS_FILE)
+            logger.info(
+                "%s words are written to %s", len(vocabulary), CATALOG_WORDS_FILE
+            )
+        if SEARCH_INDEX_FILE:
+            # Index of the embedded search backend, always of the whole catalog
+            transformer = SQLite2ESTransformer()
+            count = write_index(
+                SEARCH_INDEX_FILE,
+                (
+                    asdict(film)
+                    for data in extractor.bulk_generator(BULK_SIZE)
+                    for film in transformer.transform(data)
+                ),
+                generation,
+            )
+            logger.info("%s documents are written to %s", count, SEARCH_INDEX_FILE)
+        indices.bump_generation(generation)
@@ -0,0 +1,86 @@
+# Фасеты каталога для фильтров: число фильмов каждого жанра и гистограмма
+# imdb_rating с корзинами шириной RATING_INTERVAL (как histogram-агрегация ES:
+# корзина [from, to) называется нижней границей). ETL считает их во время
+# трансформации и пишет JSON-файл вместе с поколением индекса, API отдаёт
+# их из памяти, не выполняя агрегаций в Elasticsearch.
+
+import collections
+import json
+import math
+import os
+from typing import Any, Iterable
+
+RATING_INTERVAL = 1.0
+
+
+def rating_bucket(rating: float) -> float:
+    """Lower bound of the histogram bucket of a rating"""
+    return math.floor(rating / RATING_INTERVAL) * RATING_INTERVAL
+
+
+class FacetCounts:
+    """Genre and rating bucket counts of films, mergeable across processes"""
+
+    def __init__(self) -> None:
+        self.films = 0
+        self.genres: collections.Counter[str] = collections.Counter()
+        self.ratings: collections.Counter[float] = collections.Counter()
+        # Films without a rating
+        self.missing = 0
+
+    def add(self, genres: Iterable[str], rating: float | None) -> None:
+        """One film: names of its genres and its rating"""
+        self.films += 1
+        self.genres.update(set(genres))
+        if rating is None:
+            self.missing += 1
+        else:
+            self.ratings[rating_bucket(rating)] += 1
+
+    def merge(self, other: "FacetCounts") -> None:
+        self.films += other.films
+        self.genres.update(other.genres)
+        self.ratings.update(other.ratings)
+        self.missing += other.missing
+
+    def clear(self) -> None:
+        self.__init__()
+
+    def table(self, generation: str) -> dict[str, Any]:
+        """
+        Facets as served by the API: genres by descending count, rating
+        buckets in ascending order, empty buckets are left out
+        """
+        return {
+            "generation": generation,
+            "films": self.films,
+            "genres": [
+                {"name": name, "count": count}
+                for name, count in sorted(
+                    self.genres.items(), key=lambda item: (-item[1], item[0])
+                )
+            ],
+            "imdb_rating": {
+                "interval": RATING_INTERVAL,
+                "buckets": [
+                    {"from": bound, "to": bound + RATING_INTERVAL, "count": count}
+                    for bound, count in sorted(self.ratings.items())
+                ],
+                "missing": self.missing,
+            },
+        }
+
+    def write(self, file_path: str, generation: str) -> None:
+        """Facet table file, replaced atomically"""
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(self.table(generation), file, ensure_ascii=False)
+        os.replace(tmp_path, file_path)
+
+
+def load_table(file_path: str) -> dict[str, Any]:
+    with open(file_path, encoding="utf-8") as file:
+        table = json.load(file)
+    if not isinstance(table, dict) or "generation" not in table:
+        raise ValueError(f"{file_path} is not a facet table")
+    return table
@@ -0,0 +1,234 @@
+# Метрики и трассировка с малыми накладными расходами для API и ETL.
+# Счётчики и гистограммы хранятся в памяти процесса и отдаются в текстовом
+# формате Prometheus; ETL в конце запуска пишет их сводку.
+# Трассы (дерево интервалов одного запроса) пишутся в лог только для
+# доли запросов, поэтому трассировку можно не выключать в продакшене.
+
+import bisect
+import contextlib
+import contextvars
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from typing import Any, Iterator
+
+# Границы корзин по умолчанию: от 1 мс до 10 с
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 10)
+SIZE_BUCKETS = tuple(2**power for power in range(8, 27, 2))  # 256 B .. 64 MB
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return "+Inf" if value == float("inf") else repr(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(tuple(str(labels[name]) for name in self.labels), 0)
+
+    def snapshot(self) -> dict[tuple, Any]:
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, values: dict[tuple, Any]) -> None:
+        with self._lock:
+            for key, value in values.items():
+                self._values[key] = self._values.get(key, 0) + value
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for key, value in sorted(self.snapshot().items()):
+            yield f"{self.name}{_labels(self.labels, key)} {_number(value)}"
+
+
+class Histogram:
+    """Counts of observations per bucket, their sum and number"""
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = (*buckets, float("inf"))
+        # labels -> [count per bucket..., sum]
+        self._values: dict[tuple, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = tuple(str(labels[name]) for name in self.labels)
+        bucket = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            if (counts := self._values.get(key)) is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 1)
+            counts[bucket] += 1
+            counts[-1] += value
+
+    @contextlib.contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> dict[tuple, Any]:
+        with self._lock:
+            return {key: list(counts) for key, counts in self._values.items()}
+
+    def merge(self, values: dict[tuple, Any]) -> None:
+        with self._lock:
+            for key, counts in values.items():
+                own = self._values.setdefault(key, [0] * (len(self.buckets) + 1))
+                for position, count in enumerate(counts):
+                    own[position] += count
+
+    def summary(self, **labels: Any) -> dict[str, float]:
+        """Count, sum and approximate median and 99th percentile (bucket bounds)"""
+        key = tuple(str(labels[name]) for name in self.labels)
+        counts = self.snapshot().get(key, [0] * (len(self.buckets) + 1))
+        total = sum(counts[:-1])
+        result = {"count": total, "sum": counts[-1]}
+        for name, fraction in (("p50", 0.5), ("p99", 0.99)):
+            seen, bound = 0, 0.0
+            for bound, count in zip(self.buckets, counts):
+                seen += count
+                if total and seen >= total * fraction:
+                    break
+            result[name] = bound if total else 0.0
+        return result
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for key, counts in sorted(self.snapshot().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _labels(self.labels, key, f'le="{_number(bound)}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _labels(self.labels, key)
+            yield f"{self.name}_sum{labels} {_number(counts[-1])}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, Counter | Histogram] = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric: Counter | Histogram) -> Any:
+        # Modules defining the same metric share one
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labels: tuple[str, ...] = ()) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict[str, dict[tuple, Any]]:
+        """Picklable values of all metrics, e.g. to merge them in another process"""
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def merge(self, snapshot: dict[str, dict[tuple, Any]]) -> None:
+        for name, values in snapshot.items():
+            if (metric := self._metrics.get(name)) is not None:
+                metric.merge(values)
+
+    def reset(self) -> None:
+        for metric in self._metrics.values():
+            with metric._lock:
+                metric._values.clear()
+
+
+class Tracer:
+    """
+    Sampled traces: a root span is recorded with probability `sample_rate`,
+    spans opened while it is active are recorded into it. Finished traces
+    are logged as one JSON line by the "trace" logger
+    """
+
+    def __init__(self, sample_rate: float = 0.01) -> None:
+        self.sample_rate = sample_rate
+        self._current: contextvars.ContextVar[dict | None] = contextvars.ContextVar(
+            "trace", default=None
+        )
+        self._logger = logging.getLogger("trace")
+
+    @contextlib.contextmanager
+    def trace(self, name: str, **attributes: Any) -> Iterator[dict | None]:
+        """Root span, yields the trace or None when it is not sampled"""
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            yield None
+            return
+        trace = {"trace_id": uuid.uuid4().hex, "name": name, **attributes}
+        trace["spans"] = []
+        token = self._current.set(trace)
+        start = time.perf_counter()
+        try:
+            yield trace
+        finally:
+            trace["duration_ms"] = round((time.perf_counter() - start) * 1000, 3)
+            self._current.reset(token)
+            self._logger.info(json.dumps(trace, default=str))
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[None]:
+        if (trace := self._current.get()) is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            trace["spans"].append(
+                {
+                    "name": name,
+                    "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+                    **attributes,
+                }
+            )
+
+
+REGISTRY = Registry()
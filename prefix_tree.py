@@ -6,45 +6,228 @@
 # помечены разными символами.
 # Основная идея: реализовать структуру данных для хранения ключевых слов такую,
 # чтобы временная сложность поиска слова составляла O(t), где t - длина слова
+#
+# Сжатое (radix) дерево: цепочки узлов с одним сыном склеены в одно ребро,
+# узлы лежат в плоских массивах в порядке обхода в ширину, поэтому сыновья
+# узла n занимают отрезок [first_child[n], first_child[n + 1]).
+# Метка ребра — срез одного из ключей, ключи хранятся одной строкой.
+
+import heapq
+import sys
+from array import array
+from collections import deque
+from typing import Iterable
 
 
 class Trie:
-    def __init__(self):
-        self.prefixes = {}
-        self.is_word = False
-
-    def insert(self, word: str) -> None:
-        if not word:
-            self.is_word = True
-            return
-        if word[0] not in self.prefixes:
-            self.prefixes[word[0]] = Trie()
-        self.prefixes[word[0]].insert(word[1:])
+    # Для узлов с большим поддеревом (короткие префиксы) top-k считается заранее
+    HOT_SUBTREE = 32
+    HOT_K = 16
+
+    def __init__(self, keys: Iterable[str] = (), scores: Iterable[float] = ()):
+        """
+        keys - ключи в любом порядке, scores - их веса для top-k дополнений
+        (по умолчанию 0), у повторяющихся ключей остаётся наибольший вес
+        """
+        keys, scores = list(keys), list(scores)
+        self._pending = {}
+        for key, score in zip(keys, scores or [0.0] * len(keys)):
+            self._add(key, score)
+        self._build()
+
+    @classmethod
+    def from_sorted(cls, keys: list[str], scores: list[float]) -> "Trie":
+        """Bulk build from unique sorted keys without the intermediate dict"""
+        trie = cls.__new__(cls)
+        trie._pending = {}
+        trie._build(keys, scores)
+        return trie
+
+    def _add(self, key: str, score: float) -> None:
+        if key not in self._pending or self._pending[key] < score:
+            self._pending[key] = score
+
+    def insert(self, word: str, score: float = 0.0) -> None:
+        """Keys are buffered and the arrays are rebuilt on the next lookup"""
+        if not self._dirty:
+            self._pending = dict(zip(self._keys_list(), self._scores))
+        self._add(word, score)
+        self._dirty = True
+
+    def _keys_list(self) -> list[str]:
+        return [self.key(i) for i in range(len(self))]
+
+    def _build(self, keys: list[str] | None = None, scores=None) -> None:
+        if keys is None:
+            keys = sorted(self._pending)
+            scores = [self._pending[key] for key in keys]
+        self._pending = {}
+        self._dirty = False
+        self._text = "".join(keys)
+        self._offsets = array("I", [0])
+        for key in keys:
+            self._offsets.append(self._offsets[-1] + len(key))
+        self._scores = array("d", scores)
+        self._label_start = array("I", [0])
+        self._label_end = array("I", [0])
+        self._first_child = array("I")
+        self._key = array("i")
+
+        queue = deque([(0, len(keys), 0)])
+        next_id = 1
+        hot = []
+        while queue:
+            lo, hi, depth = queue.popleft()
+            if hi - lo >= self.HOT_SUBTREE:
+                hot.append(len(self._key))
+            key = -1
+            if lo < hi and len(keys[lo]) == depth:
+                key, lo = lo, lo + 1
+            self._key.append(key)
+            self._first_child.append(next_id)
+            i = lo
+            while i < hi:
+                char, j = keys[i][depth], i + 1
+                while j < hi and keys[j][depth] == char:
+                    j += 1
+                first, last = keys[i], keys[j - 1]
+                if j - i == 1:
+                    end = len(first)
+                else:
+                    # Общий префикс отрезка отсортированных ключей - у крайних
+                    end = depth + 1
+                    while end < len(first) and first[end] == last[end]:
+                        end += 1
+                self._label_start.append(self._offsets[i] + depth)
+                self._label_end.append(self._offsets[i] + end)
+                queue.append((i, j, end))
+                next_id += 1
+                i = j
+        self._first_child.append(next_id)
+
+        # Наибольший вес в поддереве, сыновья идут после родителя
+        self._top = array("d", bytes(8 * len(self._key)))
+        for node in range(len(self._key) - 1, -1, -1):
+            best = self._scores[self._key[node]] if self._key[node] >= 0 else None
+            for child in range(self._first_child[node], self._first_child[node + 1]):
+                if best is None or self._top[child] > best:
+                    best = self._top[child]
+            self._top[node] = best if best is not None else 0.0
+        self._hot = {}
+        self._hot = {node: array("i", self._top_k(node, self.HOT_K)) for node in hot}
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the arrays and the precomputed completions"""
+        arrays = (
+            self._text,
+            self._offsets,
+            self._scores,
+            self._label_start,
+            self._label_end,
+            self._first_child,
+            self._key,
+            self._top,
+        )
+        hot = sum(sys.getsizeof(ids) for ids in self._hot.values())
+        return sum(map(sys.getsizeof, arrays)) + sys.getsizeof(self._hot) + hot
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def key(self, id: int) -> str:
+        return self._text[self._offsets[id] : self._offsets[id + 1]]
+
+    def score(self, id: int) -> float:
+        return self._scores[id]
+
+    def _child(self, node: int, char: str) -> int:
+        """Binary search among the sons ordered by the first char of the label"""
+        lo, hi = self._first_child[node], self._first_child[node + 1]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            first = self._text[self._label_start[mid]]
+            if first < char:
+                lo = mid + 1
+            elif first > char:
+                hi = mid
+            else:
+                return mid
+        return -1
+
+    def _locate(self, prefix: str) -> tuple[int, bool]:
+        """Node whose subtree holds the keys starting with prefix, -1 if none;
+        the flag is set when the prefix ends inside the edge of the node"""
+        if self._dirty:
+            self._build()
+        node, i = 0, 0
+        while i < len(prefix):
+            node = self._child(node, prefix[i])
+            if node < 0:
+                return -1, False
+            start, end = self._label_start[node], self._label_end[node]
+            rest = len(prefix) - i
+            if rest < end - start:
+                inside = self._text.startswith(prefix[i:], start)
+                return (node, True) if inside else (-1, False)
+            if not prefix.startswith(self._text[start:end], i):
+                return -1, False
+            i += end - start
+        return node, False
 
     def search(self, word: str) -> bool:
-        if not word:
-            return self.is_word
-        if word[0] not in self.prefixes:
-            return False
-        return self.prefixes[word[0]].search(word[1:])
+        node, inside = self._locate(word)
+        return node >= 0 and not inside and self._key[node] >= 0
 
     def startsWith(self, prefix: str) -> bool:
-        if not prefix:
-            return True
-        if prefix[0] not in self.prefixes:
-            return False
-        return self.prefixes[prefix[0]].startsWith(prefix[1:])
-
-    def __str__(self, level=0):
-        if not self.prefixes:
-            return ""
-        ret = "\t" * level + repr(self) + "\n"
-        for child in self.prefixes.values():
-            ret += child.__str__(level + 1)
-        return ret
+        return self._locate(prefix)[0] >= 0
+
+    def complete_ids(self, prefix: str, k: int = 10) -> list[int]:
+        """
+        Ids of at most k keys starting with prefix, best scores first.
+        Best-first walk: a subtree is opened only when its top score
+        can still make it into the result
+        """
+        node, _ = self._locate(prefix)
+        if node < 0 or k <= 0:
+            return []
+        if k <= self.HOT_K and node in self._hot:
+            return self._hot[node][:k].tolist()
+        return self._top_k(node, k)
+
+    def _top_k(self, node: int, k: int) -> list[int]:
+        result = []
+        # (-score, 0 - key / 1 - node, id), keys win ties with subtrees
+        heap = [(-self._top[node], 1, node)]
+        while heap and len(result) < k:
+            _, kind, id = heapq.heappop(heap)
+            if kind == 0:
+                result.append(id)
+                continue
+            if (key := self._key[id]) >= 0:
+                heapq.heappush(heap, (-self._scores[key], 0, key))
+            for child in range(self._first_child[id], self._first_child[id + 1]):
+                heapq.heappush(heap, (-self._top[child], 1, child))
+        return result
+
+    def complete(self, prefix: str, k: int = 10) -> list[tuple[str, float]]:
+        return [(self.key(id), self.score(id)) for id in self.complete_ids(prefix, k)]
+
+    def __str__(self):
+        if self._dirty:
+            self._build()
+        lines, stack = [], [(0, 0)]
+        while stack:
+            node, level = stack.pop()
+            label = self._text[self._label_start[node] : self._label_end[node]]
+            mark = "*" if self._key[node] >= 0 else ""
+            lines.append("\t" * level + f"[{label}{mark}]")
+            children = range(self._first_child[node], self._first_child[node + 1])
+            stack.extend((child, level + 1) for child in reversed(children))
+        return "\n".join(lines) + "\n"
 
     def __repr__(self):
-        return "[" + " ".join(self.prefixes.keys()) + "]"
+        return f"Trie({len(self)} keys, {len(self._key)} nodes)"
 
 
 if __name__ == "__main__":
@@ -63,3 +246,8 @@ if __name__ == "__main__":
     print(f"startsWith ca: {obj.startsWith('ca')}")
     print(f"startsWith cat: {obj.startsWith('cat')}")
     print(f"startsWith co: {obj.startsWith('co')}")
+
+    rated = Trie(
+        ["star wars", "star trek", "stardust", "stalker"], [8.6, 7.9, 7.6, 8.1]
+    )
+    print(f"complete sta: {rated.complete('sta', k=3)}")
@@ -0,0 +1,334 @@
+# Встроенный полнотекстовый индекс фильмов: обратный индекс с ранжированием
+# BM25, который ETL пишет в один бинарный файл, а API отображает в память
+# (mmap) и ищет по нему без Elasticsearch.
+# Формат (порядок байт машины): магическое число, длина и JSON заголовка,
+# затем секции, выровненные по 8 байт, их смещения и типы записаны в заголовке:
+# - id документов и их смещения, документы упорядочены по id;
+# - значения каждого поля документов в JSON и их смещения, чтобы читать
+#   только нужные поля;
+# - для полей сортировки - номера документов в порядке asc и desc
+#   и место каждого документа в этих порядках;
+# - для полей поиска - число слов поля в каждом документе;
+# - словарь "номер поля\x1fслово" с хэш-таблицей (номер слова + 1, 0 - пусто);
+# - списки документов каждого слова с частотами слова в документе.
+# Анализатор проще ru_en из es_schema.txt: слова в нижнем регистре без стоп-слов,
+# без стемминга.
+
+import bisect
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import zlib
+from array import array
+from collections import Counter
+from functools import total_ordering
+from typing import Any, Iterable
+
+MAGIC = b"BM25IDX1"
+HEADER = struct.Struct("=8sI")  # magic, length of the JSON header
+
+TEXT_FIELDS = (
+    "title",
+    "description",
+    "genres",
+    "actors_names",
+    "writers_names",
+    "directors_names",
+)
+SORT_FIELDS = ("id", "title", "imdb_rating")
+
+# Параметры BM25 по умолчанию в Elasticsearch
+K1 = 1.2
+B = 0.75
+
+WORD = re.compile(r"\w+")
+_decode = json.JSONDecoder().decode
+STOP_WORDS = frozenset(
+    # _english_
+    "a an and are as at be but by for if in into is it no not of on or such that"
+    " the their then there these they this to was will with"
+    # _russian_ (частые)
+    " а без более бы был была были было быть в вам вас весь во вот все всего всех"
+    " вы где да даже для до его ее если есть еще же за здесь и из или им их к как"
+    " ко когда кто ли либо мне может мы на надо наш не него нее нет ни них но ну"
+    " о об однако он она они оно от очень по под при с со так также такой там те"
+    " тем то того тоже той только том ты у уже хотя чего чей чем что чтобы чье"
+    " чья эта эти это я".split()
+)
+
+
+def analyze(text: Any) -> list[str]:
+    """Terms of a field value or of a query"""
+    if not text:
+        return []
+    return [word for word in WORD.findall(str(text).lower()) if word not in STOP_WORDS]
+
+
+def _term_key(field: int, term: str) -> bytes:
+    return f"{field}\x1f{term}".encode()
+
+
+def _sort_value(doc: dict, field: str) -> tuple:
+    """Missing values go last in both orders like in Elasticsearch"""
+    value = doc.get(field)
+    return (value is None, value if value is not None else 0)
+
+
+@total_ordering
+class _Desc:
+    def __init__(self, value: Any) -> None:
+        self.value = value
+
+    def __eq__(self, other: "_Desc") -> bool:
+        return self.value == other.value
+
+    def __lt__(self, other: "_Desc") -> bool:
+        return self.value > other.value
+
+
+def sort_key(doc: dict, field: str, order: str) -> tuple:
+    """Position of a document in a sorted result, ties are ordered by id"""
+    missing, value = _sort_value(doc, field)
+    if order == "desc":
+        return missing, _Desc(value), _Desc(doc["id"])
+    return missing, value, doc["id"]
+
+
+def write_index(file_path: str, docs: Iterable[dict], generation: str) -> int:
+    """Index file of the documents, replaced atomically. Returns the number of documents"""
+    docs = sorted(docs, key=lambda doc: doc["id"].encode())
+    sections: dict[str, array | bytes] = {}
+    stored = list(dict.fromkeys(field for doc in docs for field in doc))
+    columns = [("ids", [doc["id"].encode() for doc in docs])]
+    for field in stored:
+        values = [
+            json.dumps(doc[field], ensure_ascii=False).encode() if field in doc else b""
+            for doc in docs
+        ]
+        columns.append((f"source.{field}", values))
+    for name, blobs in columns:
+        offsets = array("I", [0])
+        for blob in blobs:
+            offsets.append(offsets[-1] + len(blob))
+        sections[f"{name}_offsets"] = offsets
+        sections[name] = b"".join(blobs)
+
+    for field in SORT_FIELDS:
+        for order in ("asc", "desc"):
+            numbers = sorted(
+                range(len(docs)), key=lambda n: sort_key(docs[n], field, order)
+            )
+            rank = array("I", bytes(4 * len(docs)))
+            for position, number in enumerate(numbers):
+                rank[number] = position
+            sections[f"order.{field}.{order}"] = array("I", numbers)
+            sections[f"rank.{field}.{order}"] = rank
+
+    postings, avgdl, counts = {}, [], []
+    for field_number, field in enumerate(TEXT_FIELDS):
+        lengths = array("I")
+        for number, doc in enumerate(docs):
+            terms = analyze(doc.get(field))
+            lengths.append(len(terms))
+            for term, tf in Counter(terms).items():
+                postings.setdefault(_term_key(field_number, term), []).append(
+                    (number, tf)
+                )
+        sections[f"length.{field}"] = lengths
+        counts.append(sum(1 for length in lengths if length))
+        avgdl.append(sum(lengths) / counts[-1] if counts[-1] else 0.0)
+
+    terms = list(postings)
+    term_offsets, starts = array("I", [0]), array("I", [0])
+    post_docs, post_tfs = array("I"), array("I")
+    for term in terms:
+        term_offsets.append(term_offsets[-1] + len(term))
+        for number, tf in postings[term]:
+            post_docs.append(number)
+            post_tfs.append(tf)
+        starts.append(len(post_docs))
+    slots = array("I", bytes(4 * max(8, 1 << (2 * len(terms)).bit_length())))
+    for number, term in enumerate(terms):
+        slot = zlib.crc32(term) % len(slots)
+        while slots[slot]:
+            slot = (slot + 1) % len(slots)
+        slots[slot] = number + 1
+    sections["term_offsets"] = term_offsets
+    sections["terms"] = b"".join(terms)
+    sections["slots"] = slots
+    sections["postings"] = starts
+    sections["post_docs"] = post_docs
+    sections["post_tfs"] = post_tfs
+
+    layout, position = {}, 0
+    for name, data in sections.items():
+        nbytes = len(data) * data.itemsize if isinstance(data, array) else len(data)
+        typecode = data.typecode if isinstance(data, array) else "B"
+        layout[name] = (position, nbytes, typecode)
+        position += nbytes + -nbytes % 8
+    header = json.dumps(
+        {
+            "generation": generation,
+            "count": len(docs),
+            "stored": stored,
+            "fields": TEXT_FIELDS,
+            "field_counts": counts,
+            "avgdl": avgdl,
+            "sections": layout,
+        }
+    ).encode()
+    header += b" " * (-(HEADER.size + len(header)) % 8)
+
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, len(header)))
+        file.write(header)
+        for data in sections.values():
+            data = data.tobytes() if isinstance(data, array) else data
+            file.write(data)
+            file.write(bytes(-len(data) % 8))
+    os.replace(tmp_path, file_path)
+    return len(docs)
+
+
+class SearchIndex:
+    """Read-only index over a memory-mapped file written by `write_index`"""
+
+    def __init__(self, file_path: str) -> None:
+        with open(file_path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, length = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError(f"{file_path} is not a search index")
+        header = json.loads(self._mmap[HEADER.size : HEADER.size + length])
+        self.generation = header["generation"]
+        self._count = header["count"]
+        self._stored = header["stored"]
+        self._fields = {name: number for number, name in enumerate(header["fields"])}
+        self._field_counts = header["field_counts"]
+        self._avgdl = header["avgdl"]
+        view, start = memoryview(self._mmap), HEADER.size + length
+        self._sections = {
+            name: view[start + offset : start + offset + nbytes].cast(typecode)
+            for name, (offset, nbytes, typecode) in header["sections"].items()
+        }
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _blob(self, name: str, number: int) -> memoryview:
+        offsets = self._sections[f"{name}_offsets"]
+        return self._sections[name][offsets[number] : offsets[number + 1]]
+
+    def doc(self, number: int, fields: Iterable[str] | None = None) -> dict:
+        """Stored `fields` of a document, all by default"""
+        doc = {}
+        for field in fields or self._stored:
+            if f"source.{field}" in self._sections:
+                if value := self._blob(f"source.{field}", number):
+                    doc[field] = _decode(str(value, "utf-8"))
+        return doc
+
+    def find(self, id: str) -> int:
+        """Number of the document with `id`, -1 if there is none"""
+        key = str(id).encode()
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if bytes(self._blob("ids", mid)) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < self._count and self._blob("ids", lo) == key else -1
+
+    def order(self, field: str, order: str = "asc") -> memoryview:
+        """Numbers of all documents sorted by `field`"""
+        return self._sections[f"order.{field}.{order}"]
+
+    def rank(self, field: str, order: str = "asc") -> memoryview:
+        """Position of every document in `order(field, order)`"""
+        return self._sections[f"rank.{field}.{order}"]
+
+    def _postings(self, field: int, term: str) -> tuple[memoryview, memoryview]:
+        key = _term_key(field, term)
+        slots, offsets = self._sections["slots"], self._sections["term_offsets"]
+        terms, starts = self._sections["terms"], self._sections["postings"]
+        slot = zlib.crc32(key) % len(slots)
+        while number := slots[slot]:
+            number -= 1
+            if terms[offsets[number] : offsets[number + 1]] == key:
+                start, end = starts[number], starts[number + 1]
+                return (
+                    self._sections["post_docs"][start:end],
+                    self._sections["post_tfs"][start:end],
+                )
+            slot = (slot + 1) % len(slots)
+        empty = memoryview(array("I"))
+        return empty, empty
+
+    def match(self, text: str, fields: Iterable[str]) -> set[int]:
+        """Documents having any term of `text` in any of `fields`"""
+        matched = set()
+        for term in set(analyze(text)):
+            for field in fields:
+                if (number := self._fields.get(field)) is not None:
+                    matched.update(self._postings(number, term)[0])
+        return matched
+
+    def score(self, text: str, boosts: dict[str, float]) -> dict[int, float]:
+        """
+        BM25 scores of the matching documents. Like a best_fields multi_match
+        the score of a document is the best boosted score of its fields
+        """
+        terms = analyze(text)
+        best = {}
+        for field, boost in boosts.items():
+            if (number := self._fields.get(field)) is None:
+                continue
+            lengths = self._sections[f"length.{field}"]
+            count, avgdl = self._field_counts[number], self._avgdl[number]
+            scores = {}
+            for term in terms:
+                docs, tfs = self._postings(number, term)
+                if not docs:
+                    continue
+                idf = math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+                for doc, tf in zip(docs, tfs):
+                    norm = K1 * (1 - B + B * lengths[doc] / avgdl)
+                    scores[doc] = scores.get(doc, 0.0) + idf * tf / (tf + norm)
+            for doc, score in scores.items():
+                if score * boost > best.get(doc, 0.0):
+                    best[doc] = score * boost
+        return best
+
+    def ordered(
+        self, numbers: set[int], field: str, order: str, start: int = 0
+    ) -> Iterable[int]:
+        """
+        `numbers` in the order of `field` from `start` position of the whole
+        order. A few numbers are sorted, many are picked from the order
+        lazily, so the first pages stop early
+        """
+        if len(numbers) * 8 < self._count:
+            rank = self.rank(field, order)
+            return sorted(
+                (number for number in numbers if rank[number] >= start),
+                key=rank.__getitem__,
+            )
+        return (
+            number for number in self.order(field, order)[start:] if number in numbers
+        )
+
+    def position(self, numbers, field: str, order: str, after: list) -> int:
+        """Index of the first of sorted `numbers` following the `after` sort values"""
+        key = (*_sort_value({field: after[0]}, field), after[-1])
+        if order == "desc":
+            key = (key[0], _Desc(key[1]), _Desc(key[2]))
+        return bisect.bisect_right(
+            numbers,
+            key,
+            key=lambda number: sort_key(self.doc(number, (field, "id")), field, order),
+        )
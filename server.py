@@ -1,36 +1,140 @@
-import json
-from flask import Flask, jsonify, request, abort, Response
+import time
+from urllib.parse import quote
 
-from services import movie_service
-from settings import SERVER_HOST, SERVER_PORT, DEBUG
+from flask import Flask, jsonify, request, abort, g, Response
+
+from metrics import REGISTRY
+from services import (
+    cache,
+    facets,
+    flights,
+    genre_service,
+    movie_service,
+    person_service,
+    suggester,
+)
+from services.export import stream
+from services.telemetry import observe_request, route, tracer
+from settings import (
+    BATCH_MAX_IDS,
+    DEBUG,
+    EXPORT_BATCH_SIZE,
+    MSEARCH_MAX_QUERIES,
+    SERVER_HOST,
+    SERVER_PORT,
+    SUGGEST_MAX_LIMIT,
+)
+from validation import (
+    ValidationError,
+    is_cursor_request,
+    movies_batch_params,
+    movies_cursor_params,
+    movies_export_params,
+    movies_list_params,
+    movies_msearch_params,
+    page_params,
+    person_films_params,
+    persons_list_params,
+    suggest_params,
+)
 
 
 app = Flask(__name__)
 
-ERROR_INVALID_SORT_FIELD = json.dumps({"sort": ["id", "title", "imdb_rating"]})
-ERROR_INVALID_SORT_ORDER = json.dumps({"sort_order": ["asc", "desc"]})
-ERROR_INVALID_FIELD = "Invalid input"
+
+@app.before_request
+def start_request() -> None:
+    g.start = time.perf_counter()
+    g.route = route.set(request.endpoint or "unknown")
+    g.trace = tracer.trace(request.endpoint or "unknown", path=request.path)
+    g.trace.__enter__()
+
+
+@app.after_request
+def observe_response(response: Response) -> Response:
+    observe_request(
+        route.get(),
+        response.status_code,
+        time.perf_counter() - g.start,
+        response.calculate_content_length(),
+    )
+    return response
+
+
+@app.teardown_request
+def finish_request(error: BaseException | None) -> None:
+    if "trace" in g:
+        g.trace.__exit__(None, None, None)
+        route.reset(g.route)
 
 
 @app.route("/api/v1/movies", methods=["GET"], strict_slashes=False)
 def movies_list() -> str:
     try:
-        limit = int(request.args.get("limit", 50))
-        page = int(request.args.get("page", 1))
-    except ValueError:
-        abort(Response(status=422, response=ERROR_INVALID_FIELD))
-    if page < 1 or limit < 0:
-        abort(Response(status=422, response=ERROR_INVALID_FIELD))
-    sort = request.args.get("sort", "id")
-    if sort not in ("id", "title", "imdb_rating"):
-        abort(Response(status=422, response=ERROR_INVALID_SORT_FIELD))
-    sort_order = request.args.get("sort_order", "asc")
-    if sort_order not in ("asc", "desc"):
-        abort(Response(status=422, response=ERROR_INVALID_SORT_ORDER))
-    search = request.args.get("search", "")
-    result = movie_service.get_multi(
-        page=page, limit=limit, sort=sort, sort_order=sort_order, search=search
+        if is_cursor_request(request.args):
+            params = movies_cursor_params(request.args)
+        else:
+            params = movies_list_params(request.args)
+    except ValidationError as error:
+        abort(Response(status=422, response=error.body))
+    did_you_mean = None
+    if "cursor" in params:
+        result = movie_service.get_page(**params)
+    else:
+        result, did_you_mean = movie_service.search(**params)
+    if result is None:
+        abort(404)
+    response = jsonify(result)
+    if did_you_mean:
+        response.headers["X-Did-You-Mean"] = quote(did_you_mean)
+    return response
+
+
+@app.route("/api/v1/movies/batch", methods=["GET"], strict_slashes=False)
+def movies_batch() -> str:
+    try:
+        params = movies_batch_params(request.args, max_ids=BATCH_MAX_IDS)
+    except ValidationError as error:
+        abort(Response(status=422, response=error.body))
+    result = movie_service.get_many(**params)
+    if result is None:
+        abort(404)
+    return jsonify(result)
+
+
+@app.route("/api/v1/movies/msearch", methods=["POST"], strict_slashes=False)
+def movies_msearch() -> str:
+    try:
+        params = movies_msearch_params(
+            request.get_json(silent=True), max_queries=MSEARCH_MAX_QUERIES
+        )
+    except ValidationError as error:
+        abort(Response(status=422, response=error.body))
+    result = movie_service.msearch(**params)
+    if result is None:
+        abort(404)
+    return jsonify(result)
+
+
+@app.route("/api/v1/movies/export", methods=["GET"], strict_slashes=False)
+def movies_export() -> Response:
+    try:
+        params = movies_export_params(request.args)
+    except ValidationError as error:
+        abort(Response(status=422, response=error.body))
+    pages = movie_service.export(fields=params["fields"], batch_size=EXPORT_BATCH_SIZE)
+    if pages is None:
+        abort(404)
+    return Response(
+        stream(pages, compress=params["compress"]),
+        mimetype="application/x-ndjson",
+        headers={"Content-Encoding": "gzip"} if params["compress"] else {},
     )
+
+
+@app.route("/api/v1/movies/facets", methods=["GET"], strict_slashes=False)
+def movies_facets() -> str:
+    result = facets.get() if facets else None
     if result is None:
         abort(404)
     return jsonify(result)
@@ -44,5 +148,92 @@ def movies_detail(movie_id: str) -> str:
     return jsonify(result)
 
 
+@app.route("/api/v1/persons", methods=["GET"], strict_slashes=False)
+def persons_list() -> str:
+    try:
+        params = persons_list_params(request.args)
+    except ValidationError as error:
+        abort(Response(status=422, response=error.body))
+    result = person_service.search(**params)
+    if result is None:
+        abort(404)
+    return jsonify(result)
+
+
+@app.route("/api/v1/persons/<person_id>", methods=["GET"], strict_slashes=False)
+def persons_detail(person_id: str) -> str:
+    result = person_service.get(id=person_id)
+    if result is None:
+        abort(404)
+    return jsonify(result)
+
+
+@app.route("/api/v1/persons/<person_id>/films", methods=["GET"], strict_slashes=False)
+def persons_films(person_id: str) -> str:
+    try:
+        params = person_films_params(request.args)
+    except ValidationError as error:
+        abort(Response(status=422, response=error.body))
+    result = person_service.films(id=person_id, **params)
+    if result is None:
+        abort(404)
+    return jsonify(result)
+
+
+@app.route("/api/v1/genres", methods=["GET"], strict_slashes=False)
+def genres_list() -> str:
+    try:
+        params = page_params(request.args, limit=100)
+    except ValidationError as error:
+        abort(Response(status=422, response=error.body))
+    result = genre_service.get_multi(**params)
+    if result is None:
+        abort(404)
+    return jsonify(result)
+
+
+@app.route("/api/v1/genres/<genre_id>", methods=["GET"], strict_slashes=False)
+def genres_detail(genre_id: str) -> str:
+    try:
+        params = page_params(request.args)
+    except ValidationError as error:
+        abort(Response(status=422, response=error.body))
+    result = genre_service.get(id=genre_id, **params)
+    if result is None:
+        abort(404)
+    return jsonify(result)
+
+
+@app.route("/api/v1/suggest", methods=["GET"], strict_slashes=False)
+def suggest() -> str:
+    try:
+        params = suggest_params(request.args, max_limit=SUGGEST_MAX_LIMIT)
+    except ValidationError as error:
+        abort(Response(status=422, response=error.body))
+    result = suggester.suggest(**params) if suggester else None
+    if result is None:
+        abort(404)
+    return jsonify(result)
+
+
+@app.route("/api/v1/cache/stats", methods=["GET"], strict_slashes=False)
+def cache_stats() -> str:
+    if cache is None:
+        abort(404)
+    return jsonify(cache.stats())
+
+
+@app.route("/api/v1/coalescing/stats", methods=["GET"], strict_slashes=False)
+def coalescing_stats() -> str:
+    if flights is None:
+        abort(404)
+    return jsonify(flights.stats())
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics() -> Response:
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
 if __name__ == "__main__":
     app.run(host=SERVER_HOST, port=SERVER_PORT, debug=DEBUG)
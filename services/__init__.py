@@ -1 +1,5 @@
-from .movie import movie_service
+from .facet import facets
+from .genre import genre_service
+from .movie import cache, corrector, fallback, flights, movie_service
+from .person import person_service
+from .suggest import suggester
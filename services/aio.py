@@ -0,0 +1,286 @@
+import asyncio
+import functools
+import json
+import logging
+import time
+from dataclasses import replace
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+import httpx
+
+from .base import ESRequests, Repository, es_body
+from .cache import IndexGeneration, ResponseCache
+from .cursor import Cursor
+from .movie import MovieRequests, cursor_page
+from .genre import GenreRequests
+from .person import PersonRequests, person_films
+from .singleflight import AsyncSingleFlight
+from .telemetry import observe_es, operation, tracer
+
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRepositoryES(ESRequests):
+    """
+    Non-blocking counterpart of RepositoryES: keep-alive connection pool,
+    request timeouts and a limit on concurrent calls to ES
+    """
+
+    # `_cached` refreshes the generation without blocking the loop
+    _cache_fetch = False
+    # The shared backend client is blocking, only the local LRU is used
+    _cache_shared = False
+
+    def __init__(
+        self,
+        url: str,
+        cache: ResponseCache | None = None,
+        flights: AsyncSingleFlight | None = None,
+        max_connections: int = 100,
+        max_concurrency: int = 64,
+        timeout: float = 10,
+        fallback: Repository | None = None,
+    ) -> None:
+        self._client = httpx.AsyncClient(
+            base_url=url,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+            timeout=timeout,
+        )
+        self._cache = cache
+        self._flights = flights
+        self._upstream = asyncio.Semaphore(max_concurrency)
+        # In-process, its calls do not block for long
+        self._fallback = fallback
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    async def _request(
+        self, method: str, path: str, key: str | None = None, **kwargs
+    ) -> dict | None:
+        """JSON body of the call; with `key` None unless it is a success with `key`"""
+        if "data" in kwargs:
+            # httpx takes a raw body as `content`
+            kwargs["content"] = kwargs.pop("data")
+        name = operation(path)
+        async with self._upstream:
+            start = time.perf_counter()
+            with tracer.span(f"es.{name}"):
+                try:
+                    response = await self._client.request(method, path, **kwargs)
+                except httpx.HTTPError as error:
+                    observe_es(name, time.perf_counter() - start, None, True)
+                    logger.error(error)
+                    return
+            observe_es(
+                name,
+                time.perf_counter() - start,
+                len(response.content),
+                response.status_code >= 500,
+            )
+            try:
+                data = response.json()
+            except ValueError as error:
+                logger.error(error)
+                return
+        return data if key is None else es_body(response.status_code, data, key)
+
+    async def refresh_generation(self, generation: IndexGeneration) -> str:
+        """Re-read a stale generation token without blocking the loop"""
+        if generation.stale():
+            if (data := await self._request("GET", generation.path)) is not None:
+                generation.update(generation.parse(data))
+        return generation.get(fetch=False)
+
+    async def _cached(self, parts: tuple, load: Callable[[], Awaitable[Any]]) -> Any:
+        if self._flights is not None:
+            # Identical concurrent requests wait for one ES call
+            key = json.dumps(parts, sort_keys=True, default=list)
+            load = functools.partial(self._flights.do, key, load)
+        if self._cache is None:
+            return await load()
+        if generation := self._cache.generation:
+            await self.refresh_generation(generation)
+        key = self._cache.key(*parts, fetch=self._cache_fetch)
+        if (result := self._cache.lookup(key, shared=self._cache_shared)) is None:
+            result = await load()
+            self._cache.store(key, result, shared=self._cache_shared)
+        return result
+
+    async def get(
+        self, index: str, id: Any, fields: list[str] | None = None
+    ) -> dict | None:
+        doc = await self._cached(
+            self._get_parts(index, id, fields), lambda: self._get(index, id, fields)
+        )
+        if doc is None and self._fallback is not None:
+            return self._fallback.get(index, id, fields)
+        return doc or None
+
+    async def _get(
+        self, index: str, id: Any, fields: list[str] | None = None
+    ) -> dict | None:
+        data = await self._request(**self._get_request(index, id, fields))
+        return self._get_result(data)
+
+    async def get_many(
+        self, index: str, ids: list[Any], fields: list[str] | None = None
+    ) -> list[dict | None] | None:
+        keys, found = self._cached_docs(index, ids, fields)
+        if missing := [id for id in keys if id not in found]:
+            data = await self._request(**self._mget_request(index, missing, fields))
+            if (fetched := self._mget_result(missing, data)) is None:
+                if self._fallback is not None:
+                    return self._fallback.get_many(index, ids, fields)
+                return
+            self._store_docs(keys, found, fetched)
+        return [found.get(id) or None for id in ids]
+
+    async def get_multi(self, index: str, **kwargs) -> list[dict] | None:
+        docs = await self._cached(
+            self._search_parts(index, kwargs),
+            lambda: self._get_multi(index, **kwargs),
+        )
+        if docs is None and self._fallback is not None:
+            return self._fallback.get_multi(index, **kwargs)
+        return docs
+
+    async def _get_multi(self, index: str, **kwargs) -> list[dict] | None:
+        data = await self._request(**self._search_request(index, **kwargs))
+        return self._hits_result(data)
+
+    async def msearch(self, index: str, queries: list[dict]) -> list[dict] | None:
+        keys, results = self._cached_results(index, queries)
+        if missing := [i for i, result in enumerate(results) if result is None]:
+            data = await self._request(
+                **self._msearch_request(index, [queries[i] for i in missing])
+            )
+            if data is None:
+                if self._fallback is not None:
+                    return self._fallback.msearch(index, queries)
+                return
+            self._store_results(keys, results, missing, data["responses"])
+        return results
+
+    async def search_after(self, index: str, **kwargs) -> dict | None:
+        kwargs = self._search_after_args(**kwargs)
+        load = functools.partial(self._search_after, index, **kwargs)
+        if kwargs["pit"]:
+            return await load()
+        return await self._cached(("search_after", index, kwargs), load)
+
+    async def _search_after(
+        self, index: str, *, pit: str | None, **kwargs
+    ) -> dict | None:
+        request = self._search_after_request(index, pit=pit, **kwargs)
+        return self._page_result(await self._request(**request), pit)
+
+    async def scan(
+        self,
+        index: str,
+        *,
+        fields: list[str] | None = None,
+        batch_size: int = 1000,
+        keep_alive: str = "1m",
+    ) -> AsyncIterator[list[dict]] | None:
+        if not (pit := await self.open_pit(index, keep_alive)):
+            logger.warning("Point in time is not available, scanning %s live", index)
+        kwargs = self._scan_args(fields, batch_size, keep_alive)
+        page = await self._search_after(index, after=None, pit=pit, **kwargs)
+        if page is None:
+            if pit:
+                await self.close_pit(pit)
+            return
+        return self._scan(index, page, kwargs)
+
+    async def _scan(
+        self, index: str, page: dict, kwargs: dict
+    ) -> AsyncIterator[list[dict]]:
+        pit = page["pit"]
+        try:
+            while True:
+                if page["docs"]:
+                    yield page["docs"]
+                if len(page["docs"]) < kwargs["limit"]:
+                    return
+                page = await self._search_after(
+                    index, after=page["sort"], pit=pit, **kwargs
+                )
+                if page is None:
+                    raise RuntimeError(f"Scan of {index} interrupted")
+                pit = page["pit"]
+        finally:
+            if pit:
+                await self.close_pit(pit)
+
+    async def open_pit(self, index: str, keep_alive: str = "1m") -> str | None:
+        data = await self._request(**self._open_pit_request(index, keep_alive))
+        return None if data is None else data["id"]
+
+    async def close_pit(self, pit: str) -> None:
+        await self._request("DELETE", "/_pit", json={"id": pit})
+
+
+class AsyncMovieRepository(MovieRequests, AsyncRepositoryES):
+    async def get(self, id: str) -> dict | None:
+        return await super().get(**self._get_args(id))
+
+    async def get_many(self, ids: list[str]) -> dict | None:
+        docs = await super().get_many(**self._get_many_args(ids))
+        return self._get_many_result(ids, docs)
+
+    async def get_multi(self, **kwargs) -> list[dict] | None:
+        return await super().get_multi(**self._list_args(**kwargs))
+
+    async def search(self, **kwargs) -> tuple[list[dict] | None, str | None]:
+        params, did_you_mean = self._search_args(**kwargs)
+        return await super().get_multi(**params), did_you_mean
+
+    async def msearch(self, queries: list[dict]) -> list[dict] | None:
+        return await super().msearch(**self._msearch_args(queries))
+
+    async def export(
+        self, fields: list[str] | None = None, batch_size: int = 1000
+    ) -> AsyncIterator[list[dict]] | None:
+        return await self.scan(**self._export_args(fields, batch_size))
+
+    async def get_page(
+        self, cursor: Cursor, limit: int = 50, pit: bool = False
+    ) -> dict | None:
+        if pit and not cursor.pit:
+            if not (pit_id := await self.open_pit(self._index)):
+                return
+            cursor = replace(cursor, pit=pit_id)
+        page = await self.search_after(**self._page_args(cursor, limit))
+        if page is None:
+            return
+        result = cursor_page(cursor, limit, page)
+        if result["next"] is None and page["pit"]:
+            await self.close_pit(page["pit"])
+        return result
+
+
+class AsyncPersonRepository(PersonRequests, AsyncRepositoryES):
+    async def get(self, id: str) -> dict | None:
+        return await super().get(**self._get_args(id))
+
+    async def films(self, id: str, role: str | None = None) -> list[dict] | None:
+        if (person := await self.get(id)) is None:
+            return
+        return person_films(person, role)
+
+    async def search(self, **kwargs) -> list[dict] | None:
+        return await super().get_multi(**self._search_args(**kwargs))
+
+
+class AsyncGenreRepository(GenreRequests, AsyncRepositoryES):
+    async def get(self, id: str, page: int = 1, limit: int = 50) -> dict | None:
+        genre = await super().get(**self._get_args(id))
+        return self._genre_result(genre, page, limit)
+
+    async def get_multi(self, **kwargs) -> list[dict] | None:
+        return await super().get_multi(**self._list_args(**kwargs))
@@ -1,12 +1,31 @@
+import functools
+import json
 import logging
 import requests
 from abc import ABC, abstractmethod
-from typing import Any
+from typing import Any, Callable, Iterator
+
+from .cache import ResponseCache
+from .singleflight import SingleFlight
+from .telemetry import es_request
 
 
 logger = logging.getLogger(__name__)
 
 
+def es_body(status: int, data: Any, key: str) -> dict | None:
+    """
+    Body of a successful ES response carrying `key`, None for an error
+    body (non-2xx status, failed shards, an unexpected shape), so that
+    callers fall back. A missing document is a 404 with "found": false
+    """
+    if isinstance(data, dict) and key in data:
+        if status < 300 or (status == 404 and key == "found"):
+            return data
+    error = data.get("error", data) if isinstance(data, dict) else data
+    logger.error("Elasticsearch responded %s: %s", status, error)
+
+
 class Repository(ABC):
     @abstractmethod
     def get(self, *args, **kwargs):
@@ -17,49 +36,450 @@ class Repository(ABC):
         pass
 
 
-class RepositoryES(Repository):
-    def __init__(self, url: str) -> None:
-        self._url = url
+class ESRequests:
+    """
+    Requests to ES, their results and the use of the cache, shared by
+    RepositoryES and AsyncRepositoryES, which only make the calls.
+    `*_request` methods return the keyword arguments of `_request`
+    """
 
-    def get(self, index: str, id: Any, fields: list[str] | None = None) -> dict | None:
-        params = {"_source": ",".join(fields)} if fields else {}
-        try:
-            response = requests.get(f"{self._url}/{index}/_doc/{id}", params=params)
-            data = response.json()
-        except requests.RequestException as error:
-            logger.error(error)
+    _cache: ResponseCache | None
+    # The async repository refreshes the generation itself
+    # and does not call the blocking shared cache backend
+    _cache_fetch = True
+    _cache_shared = True
+
+    @staticmethod
+    def _source(fields: list[str] | None) -> dict:
+        return {"_source": ",".join(fields)} if fields else {}
+
+    @staticmethod
+    def _get_parts(index: str, id: Any, fields: list[str] | None) -> tuple:
+        """Cache key parts of a document, shared by `get` and `get_many`"""
+        return ("get", index, str(id), sorted(fields or ()))
+
+    @classmethod
+    def _get_request(cls, index: str, id: Any, fields: list[str] | None) -> dict:
+        return {
+            "method": "GET",
+            "path": f"/{index}/_doc/{id}",
+            "key": "found",
+            "params": cls._source(fields),
+        }
+
+    @staticmethod
+    def _get_result(data: dict | None) -> dict | None:
+        """
+        The document, {} when ES answered that it is missing, None when
+        the call failed. Only failures fall back, {} is cached like a document
+        """
+        if data is None:
             return
         if not data["found"]:
-            return
+            return {}
         return {"id": data["_id"], **data["_source"]}
 
-    def get_multi(
-        self,
-        index: str,
+    def _cached_docs(
+        self, index: str, ids: list[Any], fields: list[str] | None
+    ) -> tuple[dict, dict]:
+        """Cache keys of the distinct ids and the documents found in the cache"""
+        keys, found = dict.fromkeys(ids), {}
+        if self._cache is not None:
+            for id in keys:
+                parts = self._get_parts(index, id, fields)
+                keys[id] = self._cache.key(*parts, fetch=self._cache_fetch)
+                doc = self._cache.lookup(keys[id], shared=self._cache_shared)
+                if doc is not None:
+                    found[id] = doc
+        return keys, found
+
+    @classmethod
+    def _mget_request(
+        cls, index: str, ids: list[Any], fields: list[str] | None
+    ) -> dict:
+        return {
+            "method": "POST",
+            "path": f"/{index}/_mget",
+            "key": "docs",
+            "params": cls._source(fields),
+            "json": {"ids": ids},
+        }
+
+    @staticmethod
+    def _mget_result(ids: list[Any], data: dict | None) -> dict | None:
+        if data is None:
+            return
+        # Missing documents are {} like in `_get_result`
+        return {
+            id: {"id": doc["_id"], **doc["_source"]} if doc.get("found") else {}
+            for id, doc in zip(ids, data["docs"])
+        }
+
+    def _store_docs(self, keys: dict, found: dict, fetched: dict) -> None:
+        for id, doc in fetched.items():
+            found[id] = doc
+            if self._cache is not None:
+                self._cache.store(keys[id], doc, shared=self._cache_shared)
+
+    @staticmethod
+    def _search_parts(index: str, kwargs: dict) -> tuple:
+        """Cache key parts of a search, shared by `get_multi` and `msearch`"""
+        parts = {
+            key: sorted(value) if key == "fields" and value else value
+            for key, value in kwargs.items()
+        }
+        return ("search", index, parts)
+
+    @staticmethod
+    def _search_body(
         *,
         fields: list[str] | None = None,
-        filter: dict[str, Any] | None = None,
         skip: int = 0,
         limit: int = 100,
         sort_field: str = "id",
         sort_order: str = "asc",
         query: dict[str, Any] | None = None,
-    ) -> list[dict] | None:
-        params = {"_source": ",".join(fields)} if fields else {}
-        data = {"from": skip, "size": limit}
+    ) -> dict:
+        body = {"from": skip, "size": limit}
         if sort_field and sort_order:
-            data["sort"] = [{sort_field: {"order": sort_order}}]
+            body["sort"] = [{sort_field: {"order": sort_order}}]
+        if query:
+            body["query"] = query
+        return body
+
+    @classmethod
+    def _search_request(cls, index: str, **kwargs) -> dict:
+        """`kwargs` - see `_search_body`"""
+        params = cls._source(kwargs.get("fields"))
+        body = cls._search_body(**kwargs)
+        logger.debug("search %s params: %s body: %s", index, params, body)
+        return {
+            "method": "POST",
+            "path": f"/{index}/_search",
+            "key": "hits",
+            "params": params,
+            "json": body,
+        }
+
+    @staticmethod
+    def _hits_result(data: dict | None) -> list[dict] | None:
+        if data is None:
+            return
+        return [doc["_source"] for doc in data["hits"]["hits"]]
+
+    def _cached_results(self, index: str, queries: list[dict]) -> tuple[list, list]:
+        """Cache keys of the searches and the results found in the cache"""
+        keys, results = [None] * len(queries), [None] * len(queries)
+        if self._cache is not None:
+            for position, kwargs in enumerate(queries):
+                parts = self._search_parts(index, kwargs)
+                keys[position] = self._cache.key(*parts, fetch=self._cache_fetch)
+                docs = self._cache.lookup(keys[position], shared=self._cache_shared)
+                if docs is not None:
+                    results[position] = {"results": docs}
+        return keys, results
+
+    @classmethod
+    def _msearch_body(cls, index: str, queries: list[dict]) -> str:
+        """NDJSON of header/body pairs, `_source` goes to the body of each search"""
+        lines = []
+        for kwargs in queries:
+            body = cls._search_body(**kwargs)
+            if fields := kwargs.get("fields"):
+                body["_source"] = list(fields)
+            lines.append(json.dumps({"index": index}))
+            lines.append(json.dumps(body))
+        return "\n".join(lines) + "\n"
+
+    @classmethod
+    def _msearch_request(cls, index: str, queries: list[dict]) -> dict:
+        return {
+            "method": "POST",
+            "path": "/_msearch",
+            "key": "responses",
+            "data": cls._msearch_body(index, queries),
+            "headers": {"Content-Type": "application/x-ndjson"},
+        }
+
+    @staticmethod
+    def _msearch_result(response: dict) -> dict:
+        if "error" not in response:
+            return {"results": [doc["_source"] for doc in response["hits"]["hits"]]}
+        error = response["error"]
+        if isinstance(error, dict):
+            error = {"type": error.get("type"), "reason": error.get("reason")}
+        return {"error": error, "status": response.get("status")}
+
+    def _store_results(
+        self, keys: list, results: list, missing: list[int], responses: list[dict]
+    ) -> None:
+        """Results of the `missing` positions, only successful ones are cached"""
+        for position, response in zip(missing, responses):
+            results[position] = self._msearch_result(response)
+            if self._cache is not None and "results" in results[position]:
+                self._cache.store(
+                    keys[position],
+                    results[position]["results"],
+                    shared=self._cache_shared,
+                )
+
+    @staticmethod
+    def _search_after_args(
+        *,
+        fields: list[str] | None = None,
+        limit: int = 100,
+        sort_field: str = "id",
+        sort_order: str = "asc",
+        query: dict[str, Any] | None = None,
+        after: list | None = None,
+        pit: str | None = None,
+        keep_alive: str = "1m",
+    ) -> dict:
+        """Arguments of `search_after` with their defaults, its cache key part"""
+        return {
+            "fields": fields,
+            "limit": limit,
+            "sort_field": sort_field,
+            "sort_order": sort_order,
+            "query": query,
+            "after": after,
+            "pit": pit,
+            "keep_alive": keep_alive,
+        }
+
+    @staticmethod
+    def _scan_args(fields: list[str] | None, batch_size: int, keep_alive: str) -> dict:
+        """`_search_after` arguments of the pages of `scan` but `after` and `pit`"""
+        return {
+            "fields": fields,
+            "limit": batch_size,
+            "sort_field": "id",
+            "sort_order": "asc",
+            "query": None,
+            "keep_alive": keep_alive,
+        }
+
+    @staticmethod
+    def _search_after_body(
+        *,
+        limit: int,
+        sort_field: str,
+        sort_order: str,
+        query: dict[str, Any] | None,
+        after: list | None,
+        pit: str | None,
+        keep_alive: str,
+    ) -> dict:
+        body = {"size": limit, "sort": [{sort_field: {"order": sort_order}}]}
+        if sort_field != "id":
+            # Documents with equal sort values are ordered by id,
+            # otherwise search_after could skip or repeat them
+            body["sort"].append({"id": {"order": sort_order}})
         if query:
-            data["query"] = query
-        filter = filter or {}
-        print(f"params: {params}")
-        print(f"data: {data}")
+            body["query"] = query
+        if after:
+            body["search_after"] = after
+        if pit:
+            body["pit"] = {"id": pit, "keep_alive": keep_alive}
+        return body
+
+    @classmethod
+    def _search_after_request(
+        cls, index: str, *, fields: list[str] | None, pit: str | None, **kwargs
+    ) -> dict:
+        return {
+            "method": "POST",
+            # A point in time already knows its index
+            "path": "/_search" if pit else f"/{index}/_search",
+            "key": "hits",
+            "params": cls._source(fields),
+            "json": cls._search_after_body(pit=pit, **kwargs),
+        }
+
+    @staticmethod
+    def _page_result(data: dict | None, pit: str | None) -> dict | None:
+        if data is None:
+            return
+        hits = data["hits"]["hits"]
+        return {
+            "docs": [doc["_source"] for doc in hits],
+            "sort": hits[-1]["sort"] if hits else None,
+            "pit": data.get("pit_id", pit),
+        }
+
+    @staticmethod
+    def _open_pit_request(index: str, keep_alive: str) -> dict:
+        return {
+            "method": "POST",
+            "path": f"/{index}/_pit",
+            "key": "id",
+            "params": {"keep_alive": keep_alive},
+        }
+
+
+class RepositoryES(ESRequests, Repository):
+    def __init__(
+        self,
+        url: str,
+        cache: ResponseCache | None = None,
+        flights: SingleFlight | None = None,
+        fallback: Repository | None = None,
+    ) -> None:
+        """fallback - read-only repository answering reads that fail in ES"""
+        self._url = url
+        self._cache = cache
+        self._flights = flights
+        self._fallback = fallback
+
+    def _cached(self, parts: tuple, load: Callable[[], Any]) -> Any:
+        if self._flights is not None:
+            # Identical concurrent requests wait for one ES call
+            key = json.dumps(parts, sort_keys=True, default=list)
+            load = functools.partial(self._flights.do, key, load)
+        if self._cache is None:
+            return load()
+        return self._cache.get_or_set(parts, load)
+
+    def _request(self, method: str, path: str, key: str, **kwargs) -> dict | None:
+        """JSON body of the call, None if it failed or is not a success with `key`"""
         try:
-            response = requests.get(
-                f"{self._url}/{index}/_search", params=params, json=data
-            )
+            response = es_request(method, f"{self._url}{path}", **kwargs)
             data = response.json()
-        except requests.RequestException as error:
+        except (requests.RequestException, ValueError) as error:
             logger.error(error)
             return
-        return [doc["_source"] for doc in data["hits"]["hits"]]
+        return es_body(response.status_code, data, key)
+
+    def get(self, index: str, id: Any, fields: list[str] | None = None) -> dict | None:
+        doc = self._cached(
+            self._get_parts(index, id, fields), lambda: self._get(index, id, fields)
+        )
+        if doc is None and self._fallback is not None:
+            return self._fallback.get(index, id, fields)
+        return doc or None
+
+    def _get(self, index: str, id: Any, fields: list[str] | None = None) -> dict | None:
+        return self._get_result(self._request(**self._get_request(index, id, fields)))
+
+    def get_many(
+        self, index: str, ids: list[Any], fields: list[str] | None = None
+    ) -> list[dict | None] | None:
+        """
+        Documents by ids in the requested order, None for missing ones.
+        Shares cache entries with `get`, only uncached ids are fetched
+        """
+        keys, found = self._cached_docs(index, ids, fields)
+        if missing := [id for id in keys if id not in found]:
+            if (fetched := self._mget(index, missing, fields)) is None:
+                if self._fallback is not None:
+                    return self._fallback.get_many(index, ids, fields)
+                return
+            self._store_docs(keys, found, fetched)
+        return [found.get(id) or None for id in ids]
+
+    def _mget(
+        self, index: str, ids: list[Any], fields: list[str] | None = None
+    ) -> dict[Any, dict | None] | None:
+        data = self._request(**self._mget_request(index, ids, fields))
+        return self._mget_result(ids, data)
+
+    def get_multi(self, index: str, **kwargs) -> list[dict] | None:
+        docs = self._cached(
+            self._search_parts(index, kwargs),
+            lambda: self._get_multi(index, **kwargs),
+        )
+        if docs is None and self._fallback is not None:
+            return self._fallback.get_multi(index, **kwargs)
+        return docs
+
+    def _get_multi(self, index: str, **kwargs) -> list[dict] | None:
+        return self._hits_result(self._request(**self._search_request(index, **kwargs)))
+
+    def msearch(self, index: str, queries: list[dict]) -> list[dict] | None:
+        """
+        Several searches in one `_msearch` request, `queries` are `get_multi`
+        keyword arguments. Per query result: {"results": [...]} or
+        {"error": ..., "status": ...}, a failed search does not fail the others.
+        Cached searches are answered without ES, only successful ones are stored
+        """
+        keys, results = self._cached_results(index, queries)
+        if missing := [i for i, result in enumerate(results) if result is None]:
+            responses = self._msearch(index, [queries[i] for i in missing])
+            if responses is None:
+                if self._fallback is not None:
+                    return self._fallback.msearch(index, queries)
+                return
+            self._store_results(keys, results, missing, responses)
+        return results
+
+    def _msearch(self, index: str, queries: list[dict]) -> list[dict] | None:
+        data = self._request(**self._msearch_request(index, queries))
+        return None if data is None else data["responses"]
+
+    def search_after(self, index: str, **kwargs) -> dict | None:
+        """
+        Page of documents following `after` sort values:
+        {"docs": [...], "sort": <sort values of the last one>, "pit": <pit id>}
+        `kwargs` - see `_search_after_args`. Point-in-time searches are not cached
+        """
+        kwargs = self._search_after_args(**kwargs)
+        load = functools.partial(self._search_after, index, **kwargs)
+        if kwargs["pit"]:
+            return load()
+        return self._cached(("search_after", index, kwargs), load)
+
+    def _search_after(self, index: str, *, pit: str | None, **kwargs) -> dict | None:
+        request = self._search_after_request(index, pit=pit, **kwargs)
+        return self._page_result(self._request(**request), pit)
+
+    def scan(
+        self,
+        index: str,
+        *,
+        fields: list[str] | None = None,
+        batch_size: int = 1000,
+        keep_alive: str = "1m",
+    ) -> Iterator[list[dict]] | None:
+        """
+        Pages of all documents of the index read with search_after from a
+        point in time, bypassing the cache. The first page is fetched before
+        returning, None if it fails. Without point in time support
+        the pages are read from the live index
+        """
+        if not (pit := self.open_pit(index, keep_alive)):
+            logger.warning("Point in time is not available, scanning %s live", index)
+        kwargs = self._scan_args(fields, batch_size, keep_alive)
+        page = self._search_after(index, after=None, pit=pit, **kwargs)
+        if page is None:
+            if pit:
+                self.close_pit(pit)
+            return
+        return self._scan(index, page, kwargs)
+
+    def _scan(self, index: str, page: dict, kwargs: dict) -> Iterator[list[dict]]:
+        pit = page["pit"]
+        try:
+            while True:
+                if page["docs"]:
+                    yield page["docs"]
+                if len(page["docs"]) < kwargs["limit"]:
+                    return
+                page = self._search_after(index, after=page["sort"], pit=pit, **kwargs)
+                if page is None:
+                    # Fail the response instead of ending a truncated export
+                    raise RuntimeError(f"Scan of {index} interrupted")
+                pit = page["pit"]
+        finally:
+            # Also runs when the consumer stops reading
+            if pit:
+                self.close_pit(pit)
+
+    def open_pit(self, index: str, keep_alive: str = "1m") -> str | None:
+        data = self._request(**self._open_pit_request(index, keep_alive))
+        return None if data is None else data["id"]
+
+    def close_pit(self, pit: str) -> None:
+        try:
+            es_request("DELETE", f"{self._url}/_pit", json={"id": pit})
+        except requests.RequestException as error:
+            logger.error(error)
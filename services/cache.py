@@ -0,0 +1,222 @@
+import json
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable
+
+import requests
+
+from .telemetry import CACHE_LOOKUPS, es_request, route
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+logger = logging.getLogger(__name__)
+
+
+class CacheBackend(ABC):
+    @abstractmethod
+    def get(self, key: str) -> bytes | None:
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        pass
+
+
+class LRUCache(CacheBackend):
+    """In-process cache bounded by number of entries and their total size"""
+
+    def __init__(
+        self, max_items: int = 10000, max_bytes: int = 64 * 1024 * 1024
+    ) -> None:
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.evictions = 0
+        self._entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            if (entry := self._entries.get(key)) is None:
+                return
+            expires, value = entry
+            if expires < time.monotonic():
+                self._remove(key)
+                return
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self.size += len(value)
+            while len(self._entries) > self.max_items or self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        _, value = self._entries.pop(key)
+        self.size -= len(value)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RedisCache(CacheBackend):
+    """Cache shared by all API processes, requires the `redis` package"""
+
+    def __init__(self, url: str) -> None:
+        if redis is None:
+            raise RuntimeError("Shared cache requires the redis package")
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> bytes | None:
+        try:
+            return self._client.get(key)
+        except redis.RedisError as error:
+            logger.error(error)
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        try:
+            self._client.set(key, value, px=int(ttl * 1000))
+        except redis.RedisError as error:
+            logger.error(error)
+
+
+class IndexGeneration:
+    """
+    Generation token the ETL writes to the `_meta` of the index mapping
+    when a run is finished. It is re-read at most once per `ttl` seconds
+    """
+
+    def __init__(self, url: str, index: str, ttl: float = 5) -> None:
+        self._url = url
+        self._index = index
+        self.ttl = ttl
+        self._token = ""
+        self._checked = float("-inf")
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> str:
+        return f"{self._index}/_mapping"
+
+    @staticmethod
+    def parse(data: dict) -> str:
+        # An alias resolves to its indices, the latest generation wins
+        return max(
+            (
+                str(mapping.get("mappings", {}).get("_meta", {}).get("generation", ""))
+                for mapping in data.values()
+                if isinstance(mapping, dict)
+            ),
+            default="",
+        )
+
+    def _fetch(self) -> str:
+        try:
+            response = es_request("GET", f"{self._url}/{self.path}", timeout=1)
+            return self.parse(response.json())
+        except (requests.RequestException, ValueError) as error:
+            logger.error(error)
+            return self._token
+
+    def stale(self) -> bool:
+        return time.monotonic() - self._checked >= self.ttl
+
+    def update(self, token: str) -> None:
+        self._token = token
+        self._checked = time.monotonic()
+
+    def get(self, fetch: bool = True) -> str:
+        """
+        Current token, re-read from ES once it is stale unless `fetch`
+        is off (async callers update it themselves)
+        """
+        if fetch and self.stale():
+            with self._lock:
+                if self.stale():
+                    self.update(self._fetch())
+        return self._token
+
+
+class ResponseCache:
+    """
+    Two-level cache of ES responses: in-process LRU in front of an optional
+    shared backend. Keys embed the index generation, so entries of previous
+    ETL runs are never served and age out of the LRU
+    """
+
+    def __init__(
+        self,
+        local: LRUCache,
+        shared: CacheBackend | None = None,
+        generation: IndexGeneration | None = None,
+        ttl: float = 60,
+    ) -> None:
+        self.local = local
+        self.shared = shared
+        self.generation = generation
+        self.ttl = ttl
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+        CACHE_LOOKUPS.inc(route=route.get(), result=counter)
+
+    def key(self, *parts: Any, fetch: bool = True) -> str:
+        generation = self.generation.get(fetch=fetch) if self.generation else ""
+        return json.dumps([generation, *parts], sort_keys=True, default=list)
+
+    def lookup(self, key: str, shared: bool = True) -> Any:
+        """Cached value or None"""
+        if (value := self.local.get(key)) is not None:
+            self._count("hits")
+            return json.loads(value)
+        if shared and self.shared and (value := self.shared.get(key)) is not None:
+            self._count("shared_hits")
+            self.local.set(key, value, self.ttl)
+            return json.loads(value)
+        self._count("misses")
+
+    def store(self, key: str, result: Any, shared: bool = True) -> None:
+        if result is None:
+            return
+        value = json.dumps(result).encode()
+        self.local.set(key, value, self.ttl)
+        if shared and self.shared:
+            self.shared.set(key, value, self.ttl)
+
+    def get_or_set(self, parts: tuple, load: Callable[[], Any]) -> Any:
+        """Cached value for `parts`, `load` result is cached unless it is None"""
+        key = self.key(*parts)
+        if (result := self.lookup(key)) is None:
+            result = load()
+            self.store(key, result)
+        return result
+
+    def stats(self, fetch: bool = True) -> dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "evictions": self.local.evictions,
+            "items": len(self.local),
+            "bytes": self.local.size,
+            "generation": self.generation.get(fetch=fetch) if self.generation else None,
+        }
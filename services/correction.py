@@ -0,0 +1,120 @@
+import functools
+import logging
+import os
+import re
+import threading
+import time
+
+from type_corrector import SymSpell, WordDictionary
+
+
+logger = logging.getLogger(__name__)
+
+
+class _Lease:
+    """Index with the number of queries reading it"""
+
+    __slots__ = ("index", "readers", "replaced")
+
+    def __init__(self, index: SymSpell) -> None:
+        self.index = index
+        self.readers = 0
+        self.replaced = False
+
+
+class QueryCorrector:
+    """
+    "Did you mean" for search queries: every word missing from the catalog
+    vocabulary is replaced with its closest frequent word. The vocabulary is
+    the dictionary file written by the ETL, it is indexed in the background
+    and re-read when the file changes. Corrected words are memoized in an LRU
+    """
+
+    WORD = re.compile(r"\w+")
+
+    def __init__(
+        self, file_path: str, cache_size: int = 10000, check_interval: float = 5
+    ) -> None:
+        self._file_path = file_path
+        self._check_interval = check_interval
+        self._checked = float("-inf")
+        self._mtime = None
+        self._lease = None
+        self._lock = threading.Lock()
+        # Guards the reader counts only, queries are corrected without it.
+        # A replaced dictionary is unmapped when its last reader is done
+        self._lease_lock = threading.Lock()
+        self._correct_word = functools.lru_cache(maxsize=cache_size)(self._correct_word)
+        self._check()
+
+    def _load(self) -> None:
+        try:
+            index = SymSpell(WordDictionary(self._file_path))
+        except (OSError, ValueError) as error:
+            logger.error("Query corrector is not loaded: %s", error)
+            return
+        with self._lease_lock:
+            previous, self._lease = self._lease, _Lease(index)
+            if previous is not None:
+                previous.replaced = True
+                unused = not previous.readers
+        # Words are memoized by index, those of the previous one are not hit again
+        self._correct_word.cache_clear()
+        if previous is not None and unused:
+            previous.index.counts.close()
+        logger.info("Query corrector is loaded with %s words", len(index.counts))
+
+    def _acquire(self) -> _Lease | None:
+        with self._lease_lock:
+            if (lease := self._lease) is not None:
+                lease.readers += 1
+            return lease
+
+    def _release(self, lease: _Lease) -> None:
+        with self._lease_lock:
+            lease.readers -= 1
+            unused = lease.replaced and not lease.readers
+        if unused:
+            lease.index.counts.close()
+
+    def _check(self) -> None:
+        """Start indexing the file once per modification, at most every interval"""
+        if time.monotonic() - self._checked < self._check_interval:
+            return
+        with self._lock:
+            self._checked = time.monotonic()
+            try:
+                mtime = os.stat(self._file_path).st_mtime_ns
+            except OSError:
+                return
+            if mtime == self._mtime:
+                return
+            self._mtime = mtime
+        threading.Thread(target=self._load, daemon=True).start()
+
+    def _correct_word(self, index: SymSpell, word: str) -> str:
+        if len(word) < 3 or word.isdigit():
+            return word
+        # Короткие слова правятся не больше чем на одну букву
+        return index.correction(word, max_distance=1 if len(word) < 5 else 2)
+
+    def correct(self, query: str) -> str | None:
+        """Corrected query, None if nothing is corrected or the index is not ready"""
+        self._check()
+        if (lease := self._acquire()) is None:
+            return
+        changed = False
+
+        def replace(match: re.Match) -> str:
+            nonlocal changed
+            word = match.group().lower()
+            if (corrected := self._correct_word(lease.index, word)) == word:
+                return match.group()
+            changed = True
+            return corrected
+
+        try:
+            corrected = self.WORD.sub(replace, query)
+        finally:
+            self._release(lease)
+        return corrected if changed else None
@@ -0,0 +1,33 @@
+import base64
+import binascii
+import json
+from dataclasses import asdict, dataclass
+
+
+@dataclass
+class Cursor:
+    """
+    Position in a sorted search: the query and filters it belongs to, sort values
+    of the last returned document and an optional point-in-time id
+    """
+
+    sort: str = "id"
+    sort_order: str = "asc"
+    search: str = ""
+    genre: str = ""
+    rating_from: float | None = None
+    rating_to: float | None = None
+    after: list | None = None
+    pit: str | None = None
+
+    def encode(self) -> str:
+        data = json.dumps(asdict(self), separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+    @classmethod
+    def decode(cls, token: str) -> "Cursor":
+        try:
+            data = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+            return cls(**data)
+        except (binascii.Error, UnicodeDecodeError, ValueError, TypeError) as error:
+            raise ValueError(f"Invalid cursor: {token}") from error
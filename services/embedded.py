@@ -0,0 +1,291 @@
+import itertools
+import logging
+import operator
+import os
+import threading
+import time
+from typing import Any, Callable, Iterable, Iterator
+
+from search_index import SearchIndex
+
+from .base import Repository
+
+
+logger = logging.getLogger(__name__)
+
+RANGE_OPERATORS = {
+    "gte": operator.ge,
+    "gt": operator.gt,
+    "lte": operator.le,
+    "lt": operator.lt,
+}
+
+
+class EmbeddedRepository(Repository):
+    """
+    Read-only search without Elasticsearch over the index file written by
+    the ETL: BM25 over memory-mapped posting lists, same methods as
+    RepositoryES. The file holds one index, `index` arguments are ignored.
+    The file is re-opened when it changes, at most every check interval
+    """
+
+    def __init__(self, file_path: str, check_interval: float = 5) -> None:
+        self._file_path = file_path
+        self._check_interval = check_interval
+        self._checked = float("-inf")
+        self._mtime = None
+        self._search_index = None
+        self._lock = threading.Lock()
+
+    @property
+    def search_index(self) -> SearchIndex | None:
+        self._check()
+        return self._search_index
+
+    def _check(self) -> None:
+        if time.monotonic() - self._checked < self._check_interval:
+            return
+        with self._lock:
+            self._checked = time.monotonic()
+            try:
+                mtime = os.stat(self._file_path).st_mtime_ns
+            except OSError as error:
+                if self._mtime is None:
+                    logger.error("Search index is not loaded: %s", error)
+                return
+            if mtime == self._mtime:
+                return
+            self._mtime = mtime
+            try:
+                search_index = SearchIndex(self._file_path)
+            except (OSError, ValueError) as error:
+                logger.error("Search index is not loaded: %s", error)
+                return
+            # Readers of the previous file keep it mapped until they finish
+            self._search_index = search_index
+        logger.info(
+            "Search index of generation %s with %s documents is loaded",
+            search_index.generation,
+            len(search_index),
+        )
+
+    @staticmethod
+    def _multi_match(query: dict) -> tuple[str, dict[str, float]]:
+        """Query text and field boosts of a multi_match query"""
+        match = query["multi_match"]
+        boosts = {}
+        for field in match["fields"]:
+            name, _, boost = field.partition("^")
+            boosts[name] = float(boost or 1)
+        return match["query"], boosts
+
+    @staticmethod
+    def _clause(clause: dict) -> tuple[str, Callable[[Any], bool]]:
+        """Stored field and test of a term or range filter clause"""
+        if "term" in clause:
+            ((field, value),) = clause["term"].items()
+            # genres.list: lowercase genres of the comma-joined field
+            return field.partition(".")[0], lambda stored: value in (
+                item.strip().lower() for item in str(stored or "").split(",")
+            )
+        ((field, bounds),) = clause["range"].items()
+        tests = [(RANGE_OPERATORS[name], bound) for name, bound in bounds.items()]
+        return field, lambda stored: stored is not None and all(
+            test(stored, bound) for test, bound in tests
+        )
+
+    def _filtered(
+        self, search_index: SearchIndex, numbers: Iterable[int], filters: list[dict]
+    ) -> Iterator[int]:
+        # Clauses are parsed before the numbers are read, so that an
+        # unsupported one fails the search right away
+        clauses = [self._clause(clause) for clause in filters]
+        fields = [field for field, _ in clauses]
+        return (
+            number
+            for number in numbers
+            if self._passes(search_index.doc(number, fields), clauses)
+        )
+
+    @staticmethod
+    def _passes(doc: dict, clauses: list[tuple[str, Callable[[Any], bool]]]) -> bool:
+        return all(test(doc.get(field)) for field, test in clauses)
+
+    def _numbers(
+        self,
+        search_index: SearchIndex,
+        sort_field: str | None,
+        sort_order: str,
+        query: dict[str, Any] | None,
+        after: list | None = None,
+    ) -> Iterable[int]:
+        """
+        Numbers of the matching documents in the order of the result,
+        following the `after` sort values if given. Filter clauses of a bool
+        query are checked against the stored fields of the matches
+        """
+        if query and "bool" in query:
+            must = query["bool"].get("must")
+            numbers = self._numbers(
+                search_index,
+                sort_field,
+                sort_order,
+                None if not must or "match_all" in must else must,
+                after,
+            )
+            return self._filtered(search_index, numbers, query["bool"]["filter"])
+        if not sort_field or sort_field == "_score":
+            if not query:
+                return range(len(search_index))
+            scores = search_index.score(*self._multi_match(query))
+            return sorted(scores, key=lambda number: (-scores[number], number))
+        order = search_index.order(sort_field, sort_order)
+        start = (
+            search_index.position(order, sort_field, sort_order, after) if after else 0
+        )
+        if not query:
+            return order[start:]
+        # Scores do not change the order, matching is enough
+        matched = search_index.match(*self._multi_match(query))
+        return search_index.ordered(matched, sort_field, sort_order, start)
+
+    @staticmethod
+    def _get(
+        search_index: SearchIndex, id: Any, fields: list[str] | None
+    ) -> dict | None:
+        if (number := search_index.find(id)) < 0:
+            return
+        return {"id": str(id), **search_index.doc(number, fields)}
+
+    def get(self, index: str, id: Any, fields: list[str] | None = None) -> dict | None:
+        if (search_index := self.search_index) is None:
+            return
+        return self._get(search_index, id, fields)
+
+    def get_many(
+        self, index: str, ids: list[Any], fields: list[str] | None = None
+    ) -> list[dict | None] | None:
+        if (search_index := self.search_index) is None:
+            return
+        return [self._get(search_index, id, fields) for id in ids]
+
+    def get_multi(
+        self,
+        index: str,
+        *,
+        fields: list[str] | None = None,
+        skip: int = 0,
+        limit: int = 100,
+        sort_field: str = "id",
+        sort_order: str = "asc",
+        query: dict[str, Any] | None = None,
+    ) -> list[dict] | None:
+        if (search_index := self.search_index) is None:
+            return
+        return self._get_multi(
+            search_index,
+            fields=fields,
+            skip=skip,
+            limit=limit,
+            sort_field=sort_field,
+            sort_order=sort_order,
+            query=query,
+        )
+
+    def _get_multi(
+        self,
+        search_index: SearchIndex,
+        *,
+        fields: list[str] | None = None,
+        skip: int = 0,
+        limit: int = 100,
+        sort_field: str = "id",
+        sort_order: str = "asc",
+        query: dict[str, Any] | None = None,
+    ) -> list[dict] | None:
+        try:
+            numbers = self._numbers(search_index, sort_field, sort_order, query)
+        except KeyError as error:
+            logger.error("Unsupported search: %s", error)
+            return
+        return [
+            search_index.doc(number, fields)
+            for number in itertools.islice(numbers, skip, skip + limit)
+        ]
+
+    def msearch(self, index: str, queries: list[dict]) -> list[dict] | None:
+        if (search_index := self.search_index) is None:
+            return
+        results = []
+        for kwargs in queries:
+            if (docs := self._get_multi(search_index, **kwargs)) is None:
+                return
+            results.append({"results": docs})
+        return results
+
+    def search_after(
+        self,
+        index: str,
+        *,
+        fields: list[str] | None = None,
+        limit: int = 100,
+        sort_field: str = "id",
+        sort_order: str = "asc",
+        query: dict[str, Any] | None = None,
+        after: list | None = None,
+        pit: str | None = None,
+        keep_alive: str = "1m",
+    ) -> dict | None:
+        """
+        Page following `after` sort values, ties are ordered by id like in
+        RepositoryES. The point in time is the generation of the index file
+        """
+        if (search_index := self.search_index) is None:
+            return
+        try:
+            numbers = self._numbers(search_index, sort_field, sort_order, query, after)
+        except KeyError as error:
+            logger.error("Unsupported search: %s", error)
+            return
+        numbers = list(itertools.islice(numbers, limit))
+        sort = None
+        if numbers:
+            last = search_index.doc(numbers[-1], (sort_field, "id"))
+            sort = [last["id"]]
+            if sort_field != "id":
+                sort.insert(0, last.get(sort_field))
+        return {
+            "docs": [search_index.doc(number, fields) for number in numbers],
+            "sort": sort,
+            "pit": search_index.generation if pit else None,
+        }
+
+    def scan(
+        self,
+        index: str,
+        *,
+        fields: list[str] | None = None,
+        batch_size: int = 1000,
+        keep_alive: str = "1m",
+    ) -> Iterator[list[dict]] | None:
+        """Pages of all documents by id, read from the file open at the call"""
+        if (search_index := self.search_index) is None:
+            return
+        return self._scan(search_index, fields, batch_size)
+
+    def _scan(
+        self, search_index: SearchIndex, fields: list[str] | None, batch_size: int
+    ) -> Iterator[list[dict]]:
+        for start in range(0, len(search_index), batch_size):
+            yield [
+                search_index.doc(number, fields)
+                for number in range(start, min(start + batch_size, len(search_index)))
+            ]
+
+    def open_pit(self, index: str, keep_alive: str = "1m") -> str | None:
+        if (search_index := self.search_index) is None:
+            return
+        return search_index.generation
+
+    def close_pit(self, pit: str) -> None:
+        pass
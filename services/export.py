@@ -0,0 +1,47 @@
+import json
+import zlib
+from typing import AsyncIterator, Iterator
+
+
+def ndjson(docs: list[dict]) -> bytes:
+    return "".join(json.dumps(doc) + "\n" for doc in docs).encode()
+
+
+class Encoder:
+    """
+    NDJSON chunks of document pages, optionally gzipped.
+    Every page is flushed, so a chunk goes out as soon as its page is read
+    """
+
+    def __init__(self, compress: bool = False) -> None:
+        # wbits=31 writes a gzip header and trailer around the deflate stream
+        self._compressor = zlib.compressobj(wbits=31) if compress else None
+
+    def encode(self, docs: list[dict]) -> bytes:
+        data = ndjson(docs)
+        if self._compressor is None:
+            return data
+        return self._compressor.compress(data) + self._compressor.flush(
+            zlib.Z_SYNC_FLUSH
+        )
+
+    def finish(self) -> bytes:
+        return self._compressor.flush() if self._compressor else b""
+
+
+def stream(pages: Iterator[list[dict]], compress: bool = False) -> Iterator[bytes]:
+    encoder = Encoder(compress)
+    for docs in pages:
+        yield encoder.encode(docs)
+    if tail := encoder.finish():
+        yield tail
+
+
+async def astream(
+    pages: AsyncIterator[list[dict]], compress: bool = False
+) -> AsyncIterator[bytes]:
+    encoder = Encoder(compress)
+    async for docs in pages:
+        yield encoder.encode(docs)
+    if tail := encoder.finish():
+        yield tail
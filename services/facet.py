@@ -0,0 +1,75 @@
+import logging
+import threading
+
+from facets import load_table
+from settings import CACHE_GENERATION_TTL, ES_INDEX_NAME, ES_URL, FACETS_FILE
+
+from .cache import IndexGeneration
+from .movie import cache
+
+
+logger = logging.getLogger(__name__)
+
+
+class Facets:
+    """
+    Genre counts and the imdb_rating histogram written by the ETL, served
+    from memory instead of aggregations on every request. Only the index
+    generation is read from ES, at most once per its ttl; when a new one
+    appears the file is re-read in the background
+    """
+
+    def __init__(self, file_path: str, generation: IndexGeneration | None = None):
+        self._file_path = file_path
+        self._generation = generation
+        self._table = None
+        self._requested = ""
+        self._lock = threading.Lock()
+        self._reload()
+
+    @property
+    def generation(self) -> IndexGeneration | None:
+        return self._generation
+
+    def _reload(self) -> None:
+        try:
+            table = load_table(self._file_path)
+        except (OSError, ValueError) as error:
+            logger.error("Facets are not loaded: %s", error)
+            return
+        self._table = table
+        logger.info("Facets of generation %s are loaded", table["generation"])
+
+    def check(self, token: str) -> None:
+        """Start a reload once per new generation token"""
+        loaded = self._table["generation"] if self._table else ""
+        if not token or token in (loaded, self._requested):
+            return
+        with self._lock:
+            if token == self._requested:
+                return
+            self._requested = token
+        threading.Thread(target=self._reload, daemon=True).start()
+
+    def get(self, fetch: bool = True) -> dict | None:
+        """
+        Facet table, None without one. Async callers refresh the generation
+        themselves and pass `fetch` off
+        """
+        if self._generation is not None:
+            self.check(self._generation.get(fetch=fetch))
+        return self._table
+
+
+facets = (
+    Facets(
+        FACETS_FILE,
+        generation=(
+            cache.generation
+            if cache
+            else IndexGeneration(ES_URL, ES_INDEX_NAME, ttl=CACHE_GENERATION_TTL)
+        ),
+    )
+    if FACETS_FILE
+    else None
+)
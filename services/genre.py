@@ -0,0 +1,61 @@
+from settings import ES_GENRES_INDEX_NAME, ES_URL
+
+from .base import RepositoryES
+from .movie import cache, flights
+
+
+GENRE_LIST_FIELDS = ("id", "name", "films_count")
+GENRE_DETAIL_FIELDS = (*GENRE_LIST_FIELDS, "films")
+
+
+def genres_params(page: int = 1, limit: int = 100) -> dict:
+    return {
+        "fields": GENRE_LIST_FIELDS,
+        "skip": (page - 1) * limit,
+        "limit": limit,
+        "sort_field": "name",
+        "sort_order": "asc",
+    }
+
+
+def genre_page(genre: dict, page: int = 1, limit: int = 50) -> dict:
+    """The genre with one page of its films, best rated first"""
+    skip = (page - 1) * limit
+    return {**genre, "films": genre["films"][skip : skip + limit]}
+
+
+class GenreRequests:
+    """
+    Arguments of the repository calls of the genres index and their
+    results, shared by the sync and the async genre repositories
+    """
+
+    def __init__(self, *args, index: str, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._index = index
+
+    def _get_args(self, id: str) -> dict:
+        return {"index": self._index, "id": id, "fields": GENRE_DETAIL_FIELDS}
+
+    @staticmethod
+    def _genre_result(genre: dict | None, page: int, limit: int) -> dict | None:
+        return None if genre is None else genre_page(genre, page, limit)
+
+    def _list_args(self, page: int = 1, limit: int = 100) -> dict:
+        return {"index": self._index, **genres_params(page, limit)}
+
+
+class GenreRepository(GenreRequests, RepositoryES):
+    """Genres with their films by rating, denormalized by the ETL"""
+
+    def get(self, id: str, page: int = 1, limit: int = 50) -> dict | None:
+        return self._genre_result(super().get(**self._get_args(id)), page, limit)
+
+    def get_multi(self, **kwargs) -> list[dict] | None:
+        """`kwargs` - see `_list_args`"""
+        return super().get_multi(**self._list_args(**kwargs))
+
+
+genre_service = GenreRepository(
+    url=ES_URL, index=ES_GENRES_INDEX_NAME, cache=cache, flights=flights
+)
@@ -1,9 +1,32 @@
 import logging
-from dataclasses import dataclass, fields
+from dataclasses import dataclass, fields, replace
+from typing import Any, Iterator
 
-from settings import ES_URL, ES_INDEX_NAME
+from settings import (
+    CACHE_ENABLED,
+    CACHE_GENERATION_TTL,
+    CACHE_MAX_BYTES,
+    CACHE_MAX_ITEMS,
+    CACHE_REDIS_URL,
+    CACHE_TTL,
+    CATALOG_WORDS_FILE,
+    COALESCE_ENABLED,
+    CORRECTION_CACHE_SIZE,
+    CORRECTION_ENABLED,
+    CORRECTION_FUZZINESS,
+    ES_INDEX_NAME,
+    ES_URL,
+    SEARCH_BACKEND,
+    SEARCH_FALLBACK_ENABLED,
+    SEARCH_INDEX_FILE,
+)
 
 from .base import RepositoryES
+from .cache import IndexGeneration, LRUCache, RedisCache, ResponseCache
+from .correction import QueryCorrector
+from .cursor import Cursor
+from .embedded import EmbeddedRepository
+from .singleflight import SingleFlight
 
 
 logger = logging.getLogger(__name__)
@@ -28,55 +51,308 @@ class MovieDetail:
     directors: list[dict]
 
 
-class MovieRepository(RepositoryES):
-    def __init__(self, *args, index: str, **kwargs) -> None:
+DETAIL_FIELDS = tuple(f.name for f in fields(MovieDetail))
+LIST_FIELDS = tuple(f.name for f in fields(MovieList))
+
+
+def movie_filters(
+    genre: str = "", rating_from: float | None = None, rating_to: float | None = None
+) -> list[dict]:
+    """
+    Filter clauses of the movie list: films of the genre (genres.list holds
+    the lowercase genres of the comma-joined string) with a rating in
+    [rating_from, rating_to), the buckets of the rating facet
+    """
+    filters = []
+    if genre:
+        filters.append({"term": {"genres.list": genre.strip().lower()}})
+    bounds = {}
+    if rating_from is not None:
+        bounds["gte"] = rating_from
+    if rating_to is not None:
+        bounds["lt"] = rating_to
+    if bounds:
+        filters.append({"range": {"imdb_rating": bounds}})
+    return filters
+
+
+def search_params(
+    page: int = 1,
+    limit: int = 50,
+    sort: str = "id",
+    sort_order: str = "asc",
+    search: str = "",
+    fuzziness: str = "auto",
+    genre: str = "",
+    rating_from: float | None = None,
+    rating_to: float | None = None,
+) -> dict[str, Any]:
+    """
+    page - страница запроса
+    limit - число документов на страницу
+    genre, rating_from, rating_to - фильтры, см. movie_filters
+    """
+    skip = (page - 1) * limit
+    if search:
+        search = {
+            "multi_match": {
+                "query": search,
+                "fuzziness": fuzziness,
+                "fields": [
+                    "title^5",
+                    "description^4",
+                    "genres^3",
+                    "actors_names^3",
+                    "writers_names^2",
+                    "directors_names",
+                ],
+            }
+        }
+    if filters := movie_filters(genre, rating_from, rating_to):
+        # Filter context: not scored, ES caches the clauses across queries
+        search = {"bool": {"must": search or {"match_all": {}}, "filter": filters}}
+    return {
+        "fields": LIST_FIELDS,
+        "skip": skip,
+        "limit": limit,
+        "sort_field": sort,
+        "sort_order": sort_order,
+        "query": search,
+    }
+
+
+def batch_result(ids: list[str], docs: list[dict | None]) -> dict:
+    return {
+        "results": docs,
+        "missing": [id_ for id_, doc in zip(ids, docs) if doc is None],
+    }
+
+
+def cursor_page(cursor: Cursor, limit: int, page: dict) -> dict:
+    """Response of a cursor request with the cursor of the next page"""
+    next_cursor = None
+    if limit and len(page["docs"]) == limit:
+        next_cursor = replace(cursor, after=page["sort"], pit=page["pit"]).encode()
+    return {"results": page["docs"], "next": next_cursor}
+
+
+def cursor_search_params(cursor: Cursor, limit: int) -> dict[str, Any]:
+    params = search_params(
+        limit=limit,
+        sort=cursor.sort,
+        sort_order=cursor.sort_order,
+        search=cursor.search,
+        genre=cursor.genre,
+        rating_from=cursor.rating_from,
+        rating_to=cursor.rating_to,
+    )
+    del params["skip"]
+    return {**params, "after": cursor.after, "pit": cursor.pit}
+
+
+def corrected_search(
+    corrector: QueryCorrector | None, search: str
+) -> tuple[str, str, str | None]:
+    """Query to send, its fuzziness and the "did you mean" hint"""
+    if corrector is None or not search:
+        return search, "auto", None
+    if corrected := corrector.correct(search):
+        return corrected, CORRECTION_FUZZINESS, corrected
+    return search, CORRECTION_FUZZINESS, None
+
+
+class MovieRequests:
+    """
+    Arguments of the repository calls of the movie index and their results,
+    shared by the sync and the async movie repositories, which only make
+    the calls
+    """
+
+    def __init__(
+        self, *args, index: str, corrector: QueryCorrector | None = None, **kwargs
+    ) -> None:
         super().__init__(*args, **kwargs)
         self._index = index
+        self._corrector = corrector
 
-    def get(self, id: str) -> dict | None:
-        return super().get(
-            index=self._index, id=id, fields=tuple(f.name for f in fields(MovieDetail))
-        )
+    def _get_args(self, id: str) -> dict:
+        return {"index": self._index, "id": id, "fields": DETAIL_FIELDS}
+
+    def _get_many_args(self, ids: list[str]) -> dict:
+        return {"index": self._index, "ids": ids, "fields": DETAIL_FIELDS}
 
-    def get_multi(
+    @staticmethod
+    def _get_many_result(ids: list[str], docs: list[dict | None] | None) -> dict | None:
+        """
+        Details of movies in the order of `ids`: {"results": [...], "missing": [...]},
+        missing movies are null in results
+        """
+        return None if docs is None else batch_result(ids, docs)
+
+    def _list_args(
         self,
         page: int = 1,
         limit: int = 50,
         sort: str = "id",
         sort_order: str = "asc",
         search: str = "",
-        **kwargs
-    ) -> list[dict] | None:
+        genre: str = "",
+        rating_from: float | None = None,
+        rating_to: float | None = None,
+        **kwargs,
+    ) -> dict:
+        """`kwargs` go to the search of the repository as they are"""
+        return {
+            "index": self._index,
+            **search_params(
+                page,
+                limit,
+                sort,
+                sort_order,
+                search,
+                genre=genre,
+                rating_from=rating_from,
+                rating_to=rating_to,
+            ),
+            **kwargs,
+        }
+
+    def _search_args(
+        self,
+        page: int = 1,
+        limit: int = 50,
+        sort: str = "id",
+        sort_order: str = "asc",
+        search: str = "",
+        genre: str = "",
+        rating_from: float | None = None,
+        rating_to: float | None = None,
+    ) -> tuple[dict, str | None]:
         """
-        page - страница запроса
-        limit - число документов на страницу
+        `_list_args` with the query corrected against the catalog vocabulary
+        first, and the "did you mean" hint. Corrected queries are sent with
+        a cheaper fuzziness
         """
-        skip = (page - 1) * limit
-        if search:
-            search = {
-                "multi_match": {
-                    "query": search,
-                    "fuzziness": "auto",
-                    "fields": [
-                        "title^5",
-                        "description^4",
-                        "genres^3",
-                        "actors_names^3",
-                        "writers_names^2",
-                        "directors_names",
-                    ],
-                }
-            }
-        return super().get_multi(
-            index=self._index,
-            fields=tuple(f.name for f in fields(MovieList)),
-            skip=skip,
-            limit=limit,
-            sort_field=sort,
-            sort_order=sort_order,
-            query=search,
-            **kwargs
+        search, fuzziness, did_you_mean = corrected_search(self._corrector, search)
+        params = search_params(
+            page,
+            limit,
+            sort,
+            sort_order,
+            search,
+            fuzziness,
+            genre=genre,
+            rating_from=rating_from,
+            rating_to=rating_to,
         )
+        return {"index": self._index, **params}, did_you_mean
+
+    def _msearch_args(self, queries: list[dict]) -> dict:
+        """
+        Several list queries in one ES request, each query takes the
+        `get_multi` parameters. Results follow the order of `queries`:
+        {"results": [...]} or {"error": ..., "status": ...} for a failed one
+        """
+        return {
+            "index": self._index,
+            "queries": [search_params(**query) for query in queries],
+        }
+
+    def _export_args(self, fields: list[str] | None, batch_size: int) -> dict:
+        """Pages of the whole catalog with `fields` (movie detail by default)"""
+        return {
+            "index": self._index,
+            "fields": fields or DETAIL_FIELDS,
+            "batch_size": batch_size,
+        }
+
+    def _page_args(self, cursor: Cursor, limit: int) -> dict:
+        """
+        Page following the cursor, the whole catalog can be walked without
+        the from/size result window. With `pit` the walk sees a snapshot of
+        the index taken by the first request
+        """
+        return {"index": self._index, **cursor_search_params(cursor, limit)}
+
+
+class MovieQueries(MovieRequests):
+    """Movie index methods over a repository with the RepositoryES methods"""
+
+    def get(self, id: str) -> dict | None:
+        return super().get(**self._get_args(id))
+
+    def get_many(self, ids: list[str]) -> dict | None:
+        docs = super().get_many(**self._get_many_args(ids))
+        return self._get_many_result(ids, docs)
+
+    def get_multi(self, **kwargs) -> list[dict] | None:
+        """`kwargs` - see `_list_args`"""
+        return super().get_multi(**self._list_args(**kwargs))
+
+    def search(self, **kwargs) -> tuple[list[dict] | None, str | None]:
+        """(movies, did_you_mean), `kwargs` - see `_search_args`"""
+        params, did_you_mean = self._search_args(**kwargs)
+        return super().get_multi(**params), did_you_mean
+
+    def msearch(self, queries: list[dict]) -> list[dict] | None:
+        return super().msearch(**self._msearch_args(queries))
+
+    def export(
+        self, fields: list[str] | None = None, batch_size: int = 1000
+    ) -> Iterator[list[dict]] | None:
+        return self.scan(**self._export_args(fields, batch_size))
+
+    def get_page(
+        self, cursor: Cursor, limit: int = 50, pit: bool = False
+    ) -> dict | None:
+        if pit and not cursor.pit:
+            if not (pit_id := self.open_pit(self._index)):
+                return
+            cursor = replace(cursor, pit=pit_id)
+        page = self.search_after(**self._page_args(cursor, limit))
+        if page is None:
+            return
+        result = cursor_page(cursor, limit, page)
+        if result["next"] is None and page["pit"]:
+            self.close_pit(page["pit"])
+        return result
+
+
+class MovieRepository(MovieQueries, RepositoryES):
+    """Movies in Elasticsearch"""
+
+
+class EmbeddedMovieRepository(MovieQueries, EmbeddedRepository):
+    """Movies in the search index file of the ETL, without Elasticsearch"""
 
 
-movie_service = MovieRepository(url=ES_URL, index=ES_INDEX_NAME)
+cache = (
+    ResponseCache(
+        local=LRUCache(max_items=CACHE_MAX_ITEMS, max_bytes=CACHE_MAX_BYTES),
+        shared=RedisCache(CACHE_REDIS_URL) if CACHE_REDIS_URL else None,
+        generation=IndexGeneration(ES_URL, ES_INDEX_NAME, ttl=CACHE_GENERATION_TTL),
+        ttl=CACHE_TTL,
+    )
+    if CACHE_ENABLED
+    else None
+)
+flights = SingleFlight() if COALESCE_ENABLED else None
+corrector = (
+    QueryCorrector(CATALOG_WORDS_FILE, cache_size=CORRECTION_CACHE_SIZE)
+    if CORRECTION_ENABLED
+    else None
+)
+fallback = EmbeddedRepository(SEARCH_INDEX_FILE) if SEARCH_FALLBACK_ENABLED else None
+if SEARCH_BACKEND == "embedded":
+    movie_service = EmbeddedMovieRepository(
+        SEARCH_INDEX_FILE, index=ES_INDEX_NAME, corrector=corrector
+    )
+else:
+    movie_service = MovieRepository(
+        url=ES_URL,
+        index=ES_INDEX_NAME,
+        cache=cache,
+        flights=flights,
+        corrector=corrector,
+        fallback=fallback,
+    )
@@ -0,0 +1,72 @@
+from settings import ES_PERSONS_INDEX_NAME, ES_URL
+
+from .base import RepositoryES
+from .movie import cache, flights
+
+
+ROLES = ("actor", "director", "writer")
+PERSON_LIST_FIELDS = ("id", "name", "roles")
+PERSON_DETAIL_FIELDS = (*PERSON_LIST_FIELDS, "films")
+
+
+def person_search_params(page: int = 1, limit: int = 50, search: str = "") -> dict:
+    """Persons by name relevance when searching, by id otherwise"""
+    query = None
+    if search:
+        query = {"match": {"name": {"query": search, "fuzziness": "auto"}}}
+    return {
+        "fields": PERSON_LIST_FIELDS,
+        "skip": (page - 1) * limit,
+        "limit": limit,
+        "sort_field": "" if search else "id",
+        "sort_order": "asc",
+        "query": query,
+    }
+
+
+def person_films(person: dict, role: str | None = None) -> list[dict]:
+    """Films of the person by rating, only those of `role` if it is set"""
+    if role is None:
+        return person["films"]
+    return [film for film in person["films"] if role in film["roles"]]
+
+
+class PersonRequests:
+    """
+    Arguments of the repository calls of the persons index, shared by the
+    sync and the async person repositories
+    """
+
+    def __init__(self, *args, index: str, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._index = index
+
+    def _get_args(self, id: str) -> dict:
+        return {"index": self._index, "id": id, "fields": PERSON_DETAIL_FIELDS}
+
+    def _search_args(self, page: int = 1, limit: int = 50, search: str = "") -> dict:
+        return {"index": self._index, **person_search_params(page, limit, search)}
+
+
+class PersonRepository(PersonRequests, RepositoryES):
+    """
+    Persons with their films and roles in them, denormalized by the ETL:
+    the films of a person are one document fetch
+    """
+
+    def get(self, id: str) -> dict | None:
+        return super().get(**self._get_args(id))
+
+    def films(self, id: str, role: str | None = None) -> list[dict] | None:
+        if (person := self.get(id)) is None:
+            return
+        return person_films(person, role)
+
+    def search(self, **kwargs) -> list[dict] | None:
+        """`kwargs` - see `_search_args`"""
+        return super().get_multi(**self._search_args(**kwargs))
+
+
+person_service = PersonRepository(
+    url=ES_URL, index=ES_PERSONS_INDEX_NAME, cache=cache, flights=flights
+)
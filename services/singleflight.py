@@ -0,0 +1,104 @@
+import asyncio
+import functools
+import threading
+from typing import Any, Awaitable, Callable
+
+
+class _Call:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Concurrent calls with the same key share one execution: the first
+    caller runs the function, the others wait for and get its result.
+    The result object is shared by all of them and must not be mutated
+    """
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.coalesced = 0
+        self.max_waiters = 0
+        self._calls: dict[str, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, func: Callable[[], Any]) -> Any:
+        with self._lock:
+            leader = key not in self._calls
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                call = self._calls[key]
+                call.waiters += 1
+                self.coalesced += 1
+                self.max_waiters = max(self.max_waiters, call.waiters)
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except Exception as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "max_waiters": self.max_waiters,
+                "in_flight": len(self._calls),
+            }
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines of one event loop"""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.coalesced = 0
+        self.max_waiters = 0
+        self._calls: dict[str, asyncio.Future] = {}
+        self._waiters: dict[str, int] = {}
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        if (task := self._calls.get(key)) is not None:
+            self._waiters[key] += 1
+            self.coalesced += 1
+            self.max_waiters = max(self.max_waiters, self._waiters[key])
+        else:
+            task = self._calls[key] = asyncio.ensure_future(func())
+            self._waiters[key] = 0
+            self.calls += 1
+            task.add_done_callback(functools.partial(self._finish, key))
+        # The call runs in its own task: a cancelled caller, the one that
+        # started it included, does not cancel it for the others
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Future) -> None:
+        del self._calls[key]
+        del self._waiters[key]
+        if not task.cancelled():
+            # Retrieve the exception so it is not reported when nobody waits
+            task.exception()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "max_waiters": self.max_waiters,
+            "in_flight": len(self._calls),
+        }
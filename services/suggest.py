@@ -0,0 +1,87 @@
+import logging
+import threading
+
+from settings import CACHE_GENERATION_TTL, ES_INDEX_NAME, ES_URL, SUGGEST_FILE
+from suggestions import SuggestDictionary
+
+from .cache import IndexGeneration
+from .movie import cache
+
+
+logger = logging.getLogger(__name__)
+
+
+class Suggester:
+    """
+    Search-as-you-type over the suggestion dictionary written by the ETL,
+    served from memory. When a new index generation appears the dictionary
+    is re-read in the background, requests use the old one until then
+    """
+
+    def __init__(self, file_path: str, generation: IndexGeneration | None = None):
+        self._file_path = file_path
+        self._generation = generation
+        self._dictionary = None
+        self._requested = ""
+        self._lock = threading.Lock()
+        self._reload()
+
+    @property
+    def generation(self) -> IndexGeneration | None:
+        return self._generation
+
+    @property
+    def dictionary(self) -> SuggestDictionary | None:
+        return self._dictionary
+
+    def _reload(self) -> None:
+        try:
+            dictionary = SuggestDictionary.load(self._file_path)
+        except Exception as error:
+            # A broken file leaves the suggestions off, not the API down
+            logger.error("Suggestions are not loaded: %s", error)
+            return
+        self._dictionary = dictionary
+        logger.info(
+            "%s suggestions of generation %s are loaded",
+            len(dictionary),
+            dictionary.generation,
+        )
+
+    def check(self, token: str) -> None:
+        """Start a reload once per new generation token"""
+        loaded = self._dictionary.generation if self._dictionary else ""
+        if not token or token in (loaded, self._requested):
+            return
+        with self._lock:
+            if token == self._requested:
+                return
+            self._requested = token
+        threading.Thread(target=self._reload, daemon=True).start()
+
+    def suggest(
+        self, prefix: str, limit: int = 10, fetch: bool = True
+    ) -> list[dict] | None:
+        """
+        Best completions of prefix, None without a dictionary. Async callers
+        refresh the generation themselves and pass `fetch` off
+        """
+        if self._generation is not None:
+            self.check(self._generation.get(fetch=fetch))
+        if (dictionary := self._dictionary) is None:
+            return
+        return dictionary.suggest(prefix, limit)
+
+
+suggester = (
+    Suggester(
+        SUGGEST_FILE,
+        generation=(
+            cache.generation
+            if cache
+            else IndexGeneration(ES_URL, ES_INDEX_NAME, ttl=CACHE_GENERATION_TTL)
+        ),
+    )
+    if SUGGEST_FILE
+    else None
+)
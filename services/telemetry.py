@@ -0,0 +1,93 @@
+import contextvars
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import REGISTRY, SIZE_BUCKETS, Tracer
+from settings import ES_MAX_CONNECTIONS, ES_TIMEOUT, TRACE_SAMPLE_RATE
+
+
+ES_LATENCY = REGISTRY.histogram(
+    "es_request_duration_seconds", "Elasticsearch call latency", ("operation",)
+)
+ES_RESPONSE_BYTES = REGISTRY.histogram(
+    "es_response_bytes",
+    "Elasticsearch response body size",
+    ("operation",),
+    SIZE_BUCKETS,
+)
+ES_ERRORS = REGISTRY.counter(
+    "es_errors_total",
+    "Elasticsearch calls failed in transport or with a 5xx status",
+    ("operation",),
+)
+CACHE_LOOKUPS = REGISTRY.counter(
+    "cache_lookups_total",
+    "Response cache lookups by result: hits, shared_hits, misses",
+    ("route", "result"),
+)
+HTTP_LATENCY = REGISTRY.histogram(
+    "http_request_duration_seconds", "API request latency", ("route", "status")
+)
+HTTP_RESPONSE_BYTES = REGISTRY.histogram(
+    "http_response_bytes",
+    "API response body size, streamed responses are not counted",
+    ("route",),
+    SIZE_BUCKETS,
+)
+
+# API route (endpoint name) of the request being served
+route: contextvars.ContextVar[str] = contextvars.ContextVar("route", default="")
+tracer = Tracer(TRACE_SAMPLE_RATE)
+
+# Keep-alive connections to ES shared by all threads of the sync API
+session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=ES_MAX_CONNECTIONS)
+session.mount("http://", _adapter)
+session.mount("https://", _adapter)
+
+
+def operation(path: str) -> str:
+    """Elasticsearch endpoint of a url or path: _search -> search, _doc -> get"""
+    parts = urlsplit(path).path.split("/")
+    name = next((part for part in reversed(parts) if part.startswith("_")), "")
+    return "get" if name == "_doc" else name.lstrip("_") or "other"
+
+
+def observe_es(name: str, seconds: float, size: int | None, failed: bool) -> None:
+    ES_LATENCY.observe(seconds, operation=name)
+    if size is not None:
+        ES_RESPONSE_BYTES.observe(size, operation=name)
+    if failed:
+        ES_ERRORS.inc(operation=name)
+
+
+def observe_request(name: str, status: int, seconds: float, size: int | None) -> None:
+    HTTP_LATENCY.observe(seconds, route=name, status=status)
+    if size is not None:
+        HTTP_RESPONSE_BYTES.observe(size, route=name)
+
+
+def es_request(method: str, url: str, **kwargs) -> requests.Response:
+    """
+    Call over the pooled session, with ES_TIMEOUT unless `timeout` is given,
+    recording latency, response size and errors of the call
+    """
+    kwargs.setdefault("timeout", ES_TIMEOUT)
+    name = operation(url)
+    start = time.perf_counter()
+    with tracer.span(f"es.{name}"):
+        try:
+            response = session.request(method, url, **kwargs)
+        except requests.RequestException:
+            observe_es(name, time.perf_counter() - start, None, True)
+            raise
+    observe_es(
+        name,
+        time.perf_counter() - start,
+        len(response.content),
+        response.status_code >= 500,
+    )
+    return response
@@ -9,3 +9,46 @@ SERVER_PORT = int(os.environ.get("SERVER_PORT", "8000"))
 
 ES_URL = os.environ.get("ES_URL", "http://localhost:9200")
 ES_INDEX_NAME = os.environ.get("ES_INDEX_NAME", "movies")
+
+CACHE_ENABLED = os.environ.get("CACHE_ENABLED", "true").lower() == "true"
+CACHE_TTL = float(os.environ.get("CACHE_TTL", "60"))
+CACHE_MAX_ITEMS = int(os.environ.get("CACHE_MAX_ITEMS", "10000"))
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_REDIS_URL = os.environ.get("CACHE_REDIS_URL", "")
+CACHE_GENERATION_TTL = float(os.environ.get("CACHE_GENERATION_TTL", "5"))
+
+COALESCE_ENABLED = os.environ.get("COALESCE_ENABLED", "true").lower() == "true"
+
+ES_MAX_CONNECTIONS = int(os.environ.get("ES_MAX_CONNECTIONS", "100"))
+ES_MAX_CONCURRENCY = int(os.environ.get("ES_MAX_CONCURRENCY", "64"))
+ES_TIMEOUT = float(os.environ.get("ES_TIMEOUT", "10"))
+
+BATCH_MAX_IDS = int(os.environ.get("BATCH_MAX_IDS", "100"))
+MSEARCH_MAX_QUERIES = int(os.environ.get("MSEARCH_MAX_QUERIES", "20"))
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "1000"))
+
+SUGGEST_FILE = os.environ.get("SUGGEST_FILE", "suggestions.tsv.gz")
+SUGGEST_MAX_LIMIT = int(os.environ.get("SUGGEST_MAX_LIMIT", "50"))
+
+CORRECTION_ENABLED = os.environ.get("CORRECTION_ENABLED", "false").lower() == "true"
+CATALOG_WORDS_FILE = os.environ.get("CATALOG_WORDS_FILE", "catalog_words.bin")
+CORRECTION_CACHE_SIZE = int(os.environ.get("CORRECTION_CACHE_SIZE", "10000"))
+# Corrected queries need less fuzzy matching from ES than the default AUTO (AUTO:3,6)
+CORRECTION_FUZZINESS = os.environ.get("CORRECTION_FUZZINESS", "AUTO:5,9")
+
+# elasticsearch or embedded - the BM25 index file written by the ETL (Flask server)
+SEARCH_BACKEND = os.environ.get("SEARCH_BACKEND", "elasticsearch")
+SEARCH_INDEX_FILE = os.environ.get("SEARCH_INDEX_FILE", "search_index.bin")
+SEARCH_FALLBACK_ENABLED = (
+    os.environ.get("SEARCH_FALLBACK_ENABLED", "false").lower() == "true"
+)
+
+# Genre counts and the imdb_rating histogram written by the ETL
+FACETS_FILE = os.environ.get("FACETS_FILE", "facets.json")
+
+# Share of API requests whose trace (ES calls and their timings) is logged
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0.01"))
+
+# Indexes of persons and genres with their films, written by the ETL
+ES_PERSONS_INDEX_NAME = os.environ.get("ES_PERSONS_INDEX_NAME", "persons")
+ES_GENRES_INDEX_NAME = os.environ.get("ES_GENRES_INDEX_NAME", "genres")
@@ -0,0 +1,130 @@
+# Словарь подсказок для поиска по мере ввода: названия фильмов и имена
+# актёров, режиссёров и сценаристов с весами. ETL пишет его в gzip-файл
+# (строки "key\tscore\ttype\tid\ttext", отсортированные по key),
+# API загружает его в prefix_tree.Trie.
+
+import gzip
+import os
+from array import array
+from typing import Iterable, NamedTuple
+
+from prefix_tree import Trie
+
+
+class Suggestion(NamedTuple):
+    text: str
+    type: str
+    id: str
+    score: float
+
+
+def normalize(text: str, prefix: bool = False) -> str:
+    """
+    Case and whitespace insensitive key. A prefix keeps one trailing space,
+    so "star " completes "star wars" but not "stardust"
+    """
+    key = " ".join(text.casefold().split())
+    if prefix and key and text[-1].isspace():
+        key += " "
+    return key
+
+
+def _field(text: str) -> str:
+    return " ".join(str(text).split())
+
+
+class StringTable:
+    """Strings stored as one str and offsets instead of an object per string"""
+
+    def __init__(self, strings: Iterable[str]) -> None:
+        strings = list(strings)
+        self._text = "".join(strings)
+        self._offsets = array("I", [0])
+        for string in strings:
+            self._offsets.append(self._offsets[-1] + len(string))
+
+    def __getitem__(self, index: int) -> str:
+        return self._text[self._offsets[index] : self._offsets[index + 1]]
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+
+class SuggestDictionary:
+    def __init__(
+        self, generation: str, keys: list[str], suggestions: list[Suggestion]
+    ) -> None:
+        """keys - sorted normalized texts of the suggestions"""
+        self.generation = generation
+        # One trie key per distinct text with the best score of its rows,
+        # rows of key k are [self._rows[k], self._rows[k + 1])
+        unique, scores, self._rows = [], [], array("I")
+        for number, (key, item) in enumerate(zip(keys, suggestions)):
+            if unique and key == unique[-1]:
+                scores[-1] = max(scores[-1], item.score)
+                continue
+            unique.append(key)
+            scores.append(item.score)
+            self._rows.append(number)
+        self._rows.append(len(suggestions))
+        self._trie = Trie.from_sorted(unique, scores)
+        self._scores = array("d", (item.score for item in suggestions))
+        self._texts = StringTable(item.text for item in suggestions)
+        self._ids = StringTable(item.id for item in suggestions)
+        self._type_names = sorted({item.type for item in suggestions})
+        numbers = {name: number for number, name in enumerate(self._type_names)}
+        self._types = array("H", (numbers[item.type] for item in suggestions))
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def suggest(self, prefix: str, limit: int = 10) -> list[dict]:
+        # Every row of the best `limit` rows belongs to one of the best
+        # `limit` keys, their rows are ranked together
+        rows = [
+            row
+            for key in self._trie.complete_ids(normalize(prefix, prefix=True), limit)
+            for row in range(self._rows[key], self._rows[key + 1])
+        ]
+        rows.sort(key=lambda row: -self._scores[row])
+        return [
+            {
+                "text": self._texts[row],
+                "type": self._type_names[self._types[row]],
+                "id": self._ids[row],
+                "score": self._scores[row],
+            }
+            for row in rows[:limit]
+        ]
+
+    @classmethod
+    def load(cls, file_path: str) -> "SuggestDictionary":
+        keys, suggestions = [], []
+        with gzip.open(file_path, "rt", encoding="utf-8") as file:
+            _, generation = file.readline().rstrip("\n").split("\t")
+            for line in file:
+                key, score, type, id, text = line.rstrip("\n").split("\t")
+                if keys and key < keys[-1]:
+                    raise ValueError(f"{file_path} is not sorted at {key!r}")
+                keys.append(key)
+                suggestions.append(Suggestion(text, type, id, float(score)))
+        return cls(generation, keys, suggestions)
+
+    @staticmethod
+    def write(
+        file_path: str, suggestions: Iterable[Suggestion], generation: str
+    ) -> int:
+        """Sorted dictionary file, replaced atomically. Returns the number of entries"""
+        rows = sorted(
+            (normalize(item.text), item) for item in suggestions if normalize(item.text)
+        )
+        tmp_path = f"{file_path}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as file:
+            file.write(f"generation\t{generation}\n")
+            for key, item in rows:
+                file.write(
+                    f"{key}\t{item.score:g}\t{item.type}\t"
+                    f"{_field(item.id)}\t{_field(item.text)}\n"
+                )
+        os.replace(tmp_path, file_path)
+        return len(rows)
@@ -0,0 +1,340 @@
+import collections
+import contextlib
+import gzip
+import json
+import sqlite3
+from dataclasses import dataclass
+
+import pytest
+from starlette.testclient import TestClient
+
+import asgi_server
+import server
+from benchmarks.catalog import make_catalog
+from benchmarks.fake_es import FakeES
+from etl_script import (
+    ESIndexManager,
+    ESLoader,
+    PipelinedETL,
+    SQLite2ESTransformer,
+    SQLiteExtractor,
+)
+from facets import FacetCounts
+from services.aio import AsyncMovieRepository
+from services.cache import IndexGeneration
+from services.facet import Facets
+from services.movie import DETAIL_FIELDS, MovieRepository
+from services.suggest import Suggester
+from settings import BATCH_MAX_IDS, MSEARCH_MAX_QUERIES, SUGGEST_MAX_LIMIT
+from suggestions import SuggestDictionary
+
+GENERATION = "1"
+
+
+@dataclass
+class Reply:
+    """Response of either test client, header names in lowercase"""
+
+    status: int
+    headers: dict
+    body: bytes
+
+    def json(self):
+        return json.loads(self.body)
+
+
+def lowercase(headers) -> dict:
+    return {name.lower(): value for name, value in headers.items()}
+
+
+class FlaskClient:
+    module = server
+
+    def __init__(self, client) -> None:
+        self._client = client
+
+    def request(self, method: str, url: str, **kwargs) -> Reply:
+        response = self._client.open(url, method=method, **kwargs)
+        body = response.get_data()
+        # Unlike httpx, the Flask client leaves the body as it was sent
+        if response.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        return Reply(response.status_code, lowercase(response.headers), body)
+
+
+class ASGIClient:
+    module = asgi_server
+
+    def __init__(self, client: TestClient) -> None:
+        self._client = client
+
+    def request(self, method: str, url: str, **kwargs) -> Reply:
+        # A raw body is `data` in the Flask client, `content` in httpx
+        if "data" in kwargs:
+            kwargs["content"] = kwargs.pop("data")
+        response = self._client.request(method, url, **kwargs)
+        return Reply(
+            response.status_code, lowercase(response.headers), response.content
+        )
+
+
+@pytest.fixture(scope="module")
+def data(tmp_path_factory):
+    """
+    ES with the movies of a synthetic catalog loaded by the ETL, and the
+    suggestion and facet files of the same run
+    """
+    path = tmp_path_factory.mktemp("api")
+    make_catalog(str(path / "db.sqlite"), films=30, persons=40, seed=1)
+    with FakeES() as es, contextlib.closing(
+        sqlite3.connect(path / "db.sqlite")
+    ) as connection:
+        extractor = SQLiteExtractor(connection=connection)
+        etl = PipelinedETL(
+            extractor,
+            SQLite2ESTransformer(facets=FacetCounts()),
+            ESLoader(
+                url=es.url,
+                index="movies",
+                dead_letter_file=str(path / "dead_letter.ndjson"),
+            ),
+        )
+        etl.do()
+        SuggestDictionary.write(
+            str(path / "suggestions.tsv.gz"), extractor.suggestions(), GENERATION
+        )
+        etl.transformer.facets.write(str(path / "facets.json"), GENERATION)
+        ESIndexManager(url=es.url, alias="movies").bump_generation(GENERATION)
+        yield es, path
+
+
+@pytest.fixture(params=["flask", "asgi"])
+def client(request, data, monkeypatch):
+    """Both API servers over the same ES and files"""
+    es, path = data
+    generation = IndexGeneration(es.url, "movies", ttl=60)
+    module = server if request.param == "flask" else asgi_server
+    # The export streams several pages of the catalog
+    monkeypatch.setattr(module, "EXPORT_BATCH_SIZE", 7)
+    monkeypatch.setattr(
+        module,
+        "suggester",
+        Suggester(str(path / "suggestions.tsv.gz"), generation=generation),
+    )
+    monkeypatch.setattr(
+        module, "facets", Facets(str(path / "facets.json"), generation=generation)
+    )
+    if module is server:
+        monkeypatch.setattr(
+            server, "movie_service", MovieRepository(url=es.url, index="movies")
+        )
+        yield FlaskClient(server.app.test_client())
+    else:
+        monkeypatch.setattr(
+            asgi_server,
+            "movie_service",
+            AsyncMovieRepository(url=es.url, index="movies"),
+        )
+        with TestClient(asgi_server.app) as test_client:
+            yield ASGIClient(test_client)
+
+
+@pytest.fixture(scope="module")
+def movies(data):
+    es, _ = data
+    return sorted(es.docs("movies").values(), key=lambda movie: movie["id"])
+
+
+def test_batch_returns_movies_in_order_of_ids(client, movies):
+    first, second = movies[0], movies[1]
+    reply = client.request(
+        "GET", f"/api/v1/movies/batch?ids={second['id']},unknown,{first['id']}"
+    )
+    assert reply.status == 200
+    result = reply.json()
+    assert [movie and movie["id"] for movie in result["results"]] == [
+        second["id"],
+        None,
+        first["id"],
+    ]
+    assert result["results"][0]["title"] == second["title"]
+    assert result["missing"] == ["unknown"]
+
+
+@pytest.mark.parametrize(
+    "query",
+    ["", "?ids=", "?ids=,", "?ids=" + ",".join(map(str, range(BATCH_MAX_IDS + 1)))],
+)
+def test_batch_rejects_invalid_ids(client, query):
+    assert client.request("GET", f"/api/v1/movies/batch{query}").status == 422
+
+
+def test_msearch_answers_queries_like_the_list(client, movies):
+    genre = movies[0]["genres"].split(",")[0]
+    queries = [
+        {"limit": 5, "sort": "imdb_rating", "sort_order": "desc"},
+        {"genre": genre, "sort": "title"},
+    ]
+    reply = client.request("POST", "/api/v1/movies/msearch", json={"queries": queries})
+    assert reply.status == 200
+    results = [result["results"] for result in reply.json()]
+    assert len(results[0]) == 5
+    assert (
+        results[0]
+        == client.request(
+            "GET", "/api/v1/movies?limit=5&sort=imdb_rating&sort_order=desc"
+        ).json()
+    )
+    assert movies[0]["id"] in {movie["id"] for movie in results[1]}
+    assert (
+        results[1]
+        == client.request("GET", f"/api/v1/movies?genre={genre}&sort=title").json()
+    )
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        None,
+        [],
+        {},
+        {"queries": []},
+        {"queries": {"limit": 1}},
+        {"queries": [1]},
+        {"queries": [{}] * (MSEARCH_MAX_QUERIES + 1)},
+        {"queries": [{}, {"sort": "unknown"}]},
+        {"queries": [{"limit": "many"}]},
+    ],
+)
+def test_msearch_rejects_invalid_body(client, body):
+    assert client.request("POST", "/api/v1/movies/msearch", json=body).status == 422
+
+
+def test_msearch_rejects_body_that_is_not_json(client):
+    reply = client.request(
+        "POST",
+        "/api/v1/movies/msearch",
+        data=b"queries",
+        headers={"Content-Type": "application/json"},
+    )
+    assert reply.status == 422
+
+
+def ndjson_lines(body: bytes) -> list[dict]:
+    assert body.endswith(b"\n")
+    return [json.loads(line) for line in body.splitlines()]
+
+
+def test_export_streams_every_movie(client, movies):
+    reply = client.request("GET", "/api/v1/movies/export")
+    assert reply.status == 200
+    assert reply.headers["content-type"].startswith("application/x-ndjson")
+    assert "content-encoding" not in reply.headers
+    exported = sorted(ndjson_lines(reply.body), key=lambda movie: movie["id"])
+    assert exported == [
+        {field: movie[field] for field in DETAIL_FIELDS if field in movie}
+        for movie in movies
+    ]
+
+
+def test_export_projects_fields(client, movies):
+    reply = client.request("GET", "/api/v1/movies/export?fields=id,imdb_rating")
+    assert reply.status == 200
+    exported = ndjson_lines(reply.body)
+    assert len(exported) == len(movies)
+    assert {tuple(movie) for movie in exported} <= {
+        ("id", "imdb_rating"),
+        ("id",),
+    }
+
+
+def test_export_gzips_stream(client):
+    plain = client.request("GET", "/api/v1/movies/export?fields=id,title")
+    reply = client.request("GET", "/api/v1/movies/export?fields=id,title&gzip=true")
+    assert reply.status == 200
+    assert reply.headers["content-encoding"] == "gzip"
+    assert reply.body == plain.body
+
+
+@pytest.mark.parametrize("fields", ["unknown", "id,unknown", "ID"])
+def test_export_rejects_unknown_fields(client, fields):
+    reply = client.request("GET", f"/api/v1/movies/export?fields={fields}")
+    assert reply.status == 422
+    assert json.loads(reply.body) == {"fields": list(DETAIL_FIELDS)}
+
+
+def test_suggest_completes_titles(client, movies):
+    movie = movies[0]
+    reply = client.request("GET", f"/api/v1/suggest?q={movie['title'][:-1]}&limit=50")
+    assert reply.status == 200
+    suggestions = reply.json()
+    found = {item["id"]: item for item in suggestions}
+    assert found[movie["id"]]["text"] == movie["title"]
+    assert found[movie["id"]]["type"] == "film"
+    scores = [item["score"] for item in suggestions]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_suggest_returns_at_most_limit(client, movies):
+    reply = client.request("GET", f"/api/v1/suggest?q={movies[0]['title'][0]}&limit=1")
+    assert reply.status == 200
+    assert len(reply.json()) == 1
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "",
+        "?q=",
+        "?q=%20%20",
+        "?q=star&limit=0",
+        "?q=star&limit=-1",
+        f"?q=star&limit={SUGGEST_MAX_LIMIT + 1}",
+        "?q=star&limit=many",
+    ],
+)
+def test_suggest_rejects_invalid_params(client, query):
+    assert client.request("GET", f"/api/v1/suggest{query}").status == 422
+
+
+def test_suggest_without_dictionary_is_not_found(client, data, monkeypatch, tmp_path):
+    es, _ = data
+    suggester = Suggester(
+        str(tmp_path / "missing.tsv.gz"),
+        generation=IndexGeneration(es.url, "movies", ttl=60),
+    )
+    monkeypatch.setattr(client.module, "suggester", suggester)
+    assert client.request("GET", "/api/v1/suggest?q=star").status == 404
+    monkeypatch.setattr(client.module, "suggester", None)
+    assert client.request("GET", "/api/v1/suggest?q=star").status == 404
+
+
+def test_facets_count_genres_and_ratings(client, movies):
+    reply = client.request("GET", "/api/v1/movies/facets")
+    assert reply.status == 200
+    table = reply.json()
+    assert table["generation"] == GENERATION
+    assert table["films"] == len(movies)
+    genres = collections.Counter(
+        genre.strip() for movie in movies for genre in set(movie["genres"].split(","))
+    )
+    assert {item["name"]: item["count"] for item in table["genres"]} == genres
+    ratings = table["imdb_rating"]
+    assert sum(bucket["count"] for bucket in ratings["buckets"]) == len(
+        [movie for movie in movies if movie["imdb_rating"] is not None]
+    )
+    assert ratings["missing"] == len(
+        [movie for movie in movies if movie["imdb_rating"] is None]
+    )
+
+
+def test_facets_without_file_are_not_found(client, data, monkeypatch, tmp_path):
+    es, _ = data
+    facets = Facets(
+        str(tmp_path / "missing.json"),
+        generation=IndexGeneration(es.url, "movies", ttl=60),
+    )
+    monkeypatch.setattr(client.module, "facets", facets)
+    assert client.request("GET", "/api/v1/movies/facets").status == 404
+    monkeypatch.setattr(client.module, "facets", None)
+    assert client.request("GET", "/api/v1/movies/facets").status == 404
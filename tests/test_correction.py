@@ -0,0 +1,101 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from services.correction import QueryCorrector
+from type_corrector import catalog_words, compile_dictionary
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    path = str(tmp_path / "db.sqlite")
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.executescript(
+            """
+            CREATE TABLE film_work (id TEXT, title TEXT, description TEXT);
+            CREATE TABLE person (id TEXT, full_name TEXT);
+            CREATE TABLE genre (id TEXT, name TEXT);
+            INSERT INTO film_work VALUES
+                ('1', 'Mary Poppins', 'A nanny visits a family'),
+                ('2', 'The Martian', 'An astronaut is stranded on Mars');
+            INSERT INTO person VALUES ('1', 'Mary Smith');
+            INSERT INTO genre VALUES ('1', 'Drama');
+            """
+        )
+    connection.close()
+    return path
+
+
+def loaded(file_path):
+    corrector = QueryCorrector(file_path, check_interval=0)
+    for _ in range(100):
+        if corrector._lease is not None:
+            return corrector
+        time.sleep(0.01)
+    raise AssertionError("the corrector is not loaded")
+
+
+def test_catalog_words_include_descriptions(catalog):
+    words = catalog_words(catalog)
+    assert words["astronaut"] == 1
+    assert words["mars"] == 1
+    assert words["mary"] == 2
+
+
+def test_description_words_are_not_corrected(catalog, tmp_path):
+    path = str(tmp_path / "catalog_words.bin")
+    compile_dictionary(catalog_words(catalog), path)
+    corrector = loaded(path)
+    assert corrector.correct("astronaut on mars") is None
+    assert corrector.correct("astronaot on mars") == "astronaut on mars"
+
+
+def test_replaced_dictionary_is_unmapped_after_its_readers(tmp_path):
+    path = str(tmp_path / "catalog_words.bin")
+    compile_dictionary({"matrix": 5, "galaxy": 3}, path)
+    corrector = loaded(path)
+    previous = corrector._acquire()
+    compile_dictionary({"matrix": 5, "galaxy": 3, "robot": 1}, path)
+    # mtime resolution of some file systems is coarse
+    corrector._mtime = None
+    corrector.correct("matrx")
+    for _ in range(100):
+        if corrector._lease is not previous:
+            break
+        time.sleep(0.01)
+    assert corrector._lease is not previous
+    # Still in use: a query reading it is not interrupted
+    assert previous.index.correction("galaxx", max_distance=2) == "galaxy"
+    corrector._release(previous)
+    with pytest.raises(ValueError):
+        previous.index.counts["matrix"]
+    assert corrector.correct("robbot") == "robot"
+
+
+def test_queries_are_corrected_concurrently_with_reloads(tmp_path):
+    path = str(tmp_path / "catalog_words.bin")
+    compile_dictionary({"matrix": 5, "galaxy": 3}, path)
+    corrector = loaded(path)
+    errors, stop = [], threading.Event()
+
+    def query():
+        while not stop.is_set():
+            try:
+                assert corrector.correct("matrx galaxx") == "matrix galaxy"
+            except Exception as error:
+                errors.append(error)
+
+    threads = [threading.Thread(target=query) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for number in range(10):
+        compile_dictionary({"matrix": 5, "galaxy": 3, f"word{number}": 1}, path)
+        corrector._mtime = None
+        time.sleep(0.02)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    assert errors == []
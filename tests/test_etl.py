@@ -0,0 +1,132 @@
+import contextlib
+import sqlite3
+
+import pytest
+
+from benchmarks.catalog import make_catalog
+from benchmarks.fake_es import FakeES
+from etl_script import (
+    ES_GENRES_SCHEMA_FILE,
+    ES_PERSONS_SCHEMA_FILE,
+    ESIndexManager,
+    ESLoader,
+    JsonFileStorage,
+    PipelinedETL,
+    SQLite2ESTransformer,
+    SQLiteExtractor,
+    State,
+)
+
+LATER = "2030-01-01 00:00:00.000000+00:00"
+
+
+@pytest.fixture
+def es():
+    with FakeES() as es:
+        yield es
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    path = str(tmp_path / "db.sqlite")
+    make_catalog(path, films=30, persons=40, seed=1)
+    with contextlib.closing(sqlite3.connect(path)) as connection:
+        yield connection
+
+
+def run_etl(connection, es, tmp_path, incremental=False):
+    etl = PipelinedETL(
+        SQLiteExtractor(connection=connection),
+        SQLite2ESTransformer(),
+        ESLoader(
+            url=es.url,
+            index="movies",
+            dead_letter_file=str(tmp_path / "dead_letter.ndjson"),
+        ),
+        State(JsonFileStorage(str(tmp_path / "state.json"))),
+        persons=ESIndexManager(
+            url=es.url,
+            alias="persons",
+            schema_file=ES_PERSONS_SCHEMA_FILE,
+        ),
+        genres=ESIndexManager(
+            url=es.url,
+            alias="genres",
+            schema_file=ES_GENRES_SCHEMA_FILE,
+        ),
+    )
+    etl.do(incremental=incremental)
+
+
+def test_incremental_run_applies_deletions(catalog, es, tmp_path):
+    run_etl(catalog, es, tmp_path)
+    movies = es.docs("movies")
+    assert len(movies) == 30
+
+    # An actor loses one of their films
+    film_id, person_id = catalog.execute(
+        """SELECT film_work_id, person_id FROM person_film_work
+        WHERE role == 'actor' AND person_id IN (
+            SELECT person_id FROM person_film_work GROUP BY person_id
+            HAVING COUNT(DISTINCT film_work_id) > 1
+        ) LIMIT 1;"""
+    ).fetchone()
+    # A film is deleted, its links stay behind
+    deleted_id, genre_id = catalog.execute(
+        """SELECT film_work_id, genre_id FROM genre_film_work
+        WHERE film_work_id != ? LIMIT 1;""",
+        (film_id,),
+    ).fetchone()
+    films_count = es.docs("genres")[genre_id]["films_count"]
+    # A person who only played in the deleted film
+    with catalog:
+        catalog.execute(
+            "INSERT INTO person VALUES ('lonely', 'Lonely Actor', NULL, ?, ?);",
+            (LATER, LATER),
+        )
+        catalog.execute(
+            """INSERT INTO person_film_work
+            VALUES ('lonely-link', ?, 'lonely', 'actor', ?);""",
+            (deleted_id, LATER),
+        )
+    run_etl(catalog, es, tmp_path, incremental=True)
+    assert "lonely" in es.docs("persons")
+
+    with catalog:
+        catalog.execute(
+            "DELETE FROM person_film_work WHERE film_work_id == ? AND person_id == ?;",
+            (film_id, person_id),
+        )
+        catalog.execute("DELETE FROM film_work WHERE id == ?;", (deleted_id,))
+    run_etl(catalog, es, tmp_path, incremental=True)
+
+    movies = es.docs("movies")
+    assert len(movies) == 29
+    assert deleted_id not in movies
+    assert person_id not in {actor["id"] for actor in movies[film_id]["actors"]}
+    person = es.docs("persons")[person_id]
+    assert film_id not in {film["id"] for film in person["films"]}
+    assert "lonely" not in es.docs("persons")
+    genre = es.docs("genres")[genre_id]
+    assert genre["films_count"] == films_count - 1
+    assert deleted_id not in {film["id"] for film in genre["films"]}
+    # Applied tombstones are dropped
+    assert catalog.execute("SELECT COUNT(*) FROM etl_deleted;").fetchone()[0] == 0
+
+
+def test_incremental_run_without_changes_loads_nothing(catalog, es, tmp_path):
+    run_etl(catalog, es, tmp_path)
+    es.indexes.clear()
+    run_etl(catalog, es, tmp_path, incremental=True)
+    assert es.docs("movies") == {}
+    assert es.docs("persons") == {}
+
+
+def test_rebuild_versions_do_not_collide(es):
+    indices = ESIndexManager(url=es.url, alias="movies", retention=1)
+    first, second = indices.create(), indices.create()
+    assert first != second
+    indices.publish(first)
+    indices.publish(second)
+    assert es.aliases["movies"] == second
+    assert set(es.indexes) == {second}
@@ -0,0 +1,85 @@
+import asyncio
+import socket
+
+import pytest
+
+from benchmarks.fake_es import FakeES
+from services.aio import AsyncRepositoryES
+from services.base import RepositoryES
+from services.cache import LRUCache, ResponseCache
+
+
+class Snapshot:
+    """Fallback repository recording the reads it answers"""
+
+    def __init__(self) -> None:
+        self.calls = []
+
+    def get(self, index, id, fields=None):
+        self.calls.append(("get", id))
+        return {"id": id, "title": "from the snapshot"}
+
+    def get_many(self, index, ids, fields=None):
+        self.calls.append(("get_many", ids))
+        return [{"id": id, "title": "from the snapshot"} for id in ids]
+
+
+@pytest.fixture
+def es():
+    with FakeES() as es:
+        es.add("movies", [{"id": "1", "title": "Star"}])
+        yield es
+
+
+@pytest.fixture
+def down_url():
+    """URL of a port nothing listens on"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}"
+
+
+def test_missing_document_does_not_fall_back(es):
+    snapshot = Snapshot()
+    repository = RepositoryES(es.url, fallback=snapshot)
+    assert repository.get("movies", "1") == {"id": "1", "title": "Star"}
+    assert repository.get("movies", "2") is None
+    assert repository.get_many("movies", ["2", "1"]) == [
+        None,
+        {"id": "1", "title": "Star"},
+    ]
+    assert snapshot.calls == []
+
+
+def test_missing_document_is_cached_as_missing(es):
+    cache = ResponseCache(LRUCache(max_items=100, max_bytes=1 << 20))
+    repository = RepositoryES(es.url, cache=cache, fallback=Snapshot())
+    assert repository.get("movies", "2") is None
+    es.stop()
+    assert repository.get("movies", "2") is None
+    assert repository.get_many("movies", ["2"]) == [None]
+
+
+def test_failed_call_falls_back(down_url):
+    snapshot = Snapshot()
+    repository = RepositoryES(down_url, fallback=snapshot)
+    assert repository.get("movies", "2") == {"id": "2", "title": "from the snapshot"}
+    assert snapshot.calls == [("get", "2")]
+
+
+def test_async_missing_document_does_not_fall_back(es, down_url):
+    async def main():
+        snapshot = Snapshot()
+        repository = AsyncRepositoryES(es.url, fallback=snapshot)
+        down = AsyncRepositoryES(down_url, fallback=snapshot)
+        try:
+            assert await repository.get("movies", "2") is None
+            assert await repository.get_many("movies", ["2"]) == [None]
+            assert snapshot.calls == []
+            assert (await down.get("movies", "2"))["title"] == "from the snapshot"
+        finally:
+            await repository.aclose()
+            await down.aclose()
+
+    asyncio.run(main())
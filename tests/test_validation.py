@@ -0,0 +1,44 @@
+import pytest
+
+from validation import (
+    ValidationError,
+    is_cursor_request,
+    movies_cursor_params,
+    movies_export_params,
+)
+
+
+@pytest.mark.parametrize(
+    "args, expected",
+    [
+        ({}, False),
+        ({"pit": "true"}, True),
+        ({"pit": "True"}, True),
+        ({"pit": "false"}, False),
+        ({"pit": "0"}, False),
+        ({"pit": ""}, False),
+        ({"cursor": ""}, True),
+        ({"cursor": "abc", "pit": "false"}, True),
+    ],
+)
+def test_is_cursor_request(args, expected):
+    assert is_cursor_request(args) is expected
+
+
+def test_cursor_params_parse_pit_flag():
+    assert movies_cursor_params({"pit": "true"})["pit"] is True
+    assert movies_cursor_params({"pit": "0"})["pit"] is False
+
+
+def test_cursor_params_reject_bad_cursor():
+    with pytest.raises(ValidationError):
+        movies_cursor_params({"cursor": "not a cursor"})
+
+
+def test_export_params():
+    assert movies_export_params({"fields": "id,title", "gzip": "true"}) == {
+        "fields": ["id", "title"],
+        "compress": True,
+    }
+    with pytest.raises(ValidationError):
+        movies_export_params({"fields": "id,secret"})
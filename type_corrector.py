@@ -10,20 +10,199 @@ MIT license: www.opensource.org/licenses/mit-license.php
 
 ################ Spelling Corrector
 
+import mmap
+import os
 import re
+import sqlite3
+import struct
+import zlib
+from array import array
 from collections import Counter
+from collections.abc import Mapping
 
 
 def words(text):
     return re.findall(r"\w+", text.lower())
 
 
-WORDS = Counter(words(open("big.txt").read()))
+################ Word Dictionary
+
+# Словарь частот компилируется заранее в бинарный файл и отображается в память
+# (mmap) при первом обращении: процесс не читает big.txt при старте, а страницы
+# файла общие для всех процессов, которые его открыли.
+# Формат (порядок байт машины): заголовок, частоты uint32[n], смещения слов
+# uint32[n + 1], хэш-таблица uint32[slots] (номер слова + 1, 0 - пусто) и
+# слова в UTF-8. Слова упорядочены по убыванию частоты.
+
+TEXT_FILE = "big.txt"
+DICTIONARY_FILE = os.environ.get("WORDS_FILE", "words.bin")
+
+
+class WordDictionary(Mapping):
+    "Read-only Counter of words over a memory-mapped file written by `compile_dictionary`."
+
+    MAGIC = b"WRD1"
+    HEADER = struct.Struct("=4sIIQ4x")  # magic, words, slots, total
+
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._size, slots, self._total = self.HEADER.unpack_from(self._mmap)
+        if magic != self.MAGIC:
+            raise ValueError(f"{path} is not a word dictionary")
+        view, start = memoryview(self._mmap), self.HEADER.size
+        sections = {}
+        for name, length in (
+            ("counts", self._size),
+            ("offsets", self._size + 1),
+            ("slots", slots),
+        ):
+            sections[name] = view[start : start + 4 * length].cast("I")
+            start += 4 * length
+        self._counts, self._offsets, self._slots = (
+            sections["counts"],
+            sections["offsets"],
+            sections["slots"],
+        )
+        self._text = view[start:]
+
+    def _find(self, word):
+        "Number of `word` in the dictionary, -1 if it is not there."
+        key = word.encode()
+        slots = self._slots
+        slot = zlib.crc32(key) % len(slots)
+        while number := slots[slot]:
+            number -= 1
+            if self._text[self._offsets[number] : self._offsets[number + 1]] == key:
+                return number
+            slot = (slot + 1) % len(slots)
+        return -1
+
+    def _word(self, number):
+        return bytes(
+            self._text[self._offsets[number] : self._offsets[number + 1]]
+        ).decode()
+
+    def __getitem__(self, word):
+        "Count of `word`, 0 for unknown words like in Counter."
+        number = self._find(word)
+        return self._counts[number] if number >= 0 else 0
+
+    def __contains__(self, word):
+        return isinstance(word, str) and self._find(word) >= 0
+
+    def __iter__(self):
+        return (self._word(number) for number in range(self._size))
+
+    def __len__(self):
+        return self._size
+
+    def total(self):
+        return self._total
+
+    def most_common(self, n=None):
+        n = self._size if n is None else min(n, self._size)
+        return [(self._word(number), self._counts[number]) for number in range(n)]
+
+    def close(self):
+        "Unmap the file, the dictionary cannot be read afterwards."
+        for view in (self._counts, self._offsets, self._slots, self._text):
+            view.release()
+        self._mmap.close()
+
+
+def compile_dictionary(counts, path):
+    "Write `counts` in the WordDictionary format, the file is replaced atomically."
+    ordered = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    encoded = [word.encode() for word, _ in ordered]
+    offsets = array("I", [0])
+    for key in encoded:
+        offsets.append(offsets[-1] + len(key))
+    # Хэш-таблица заполнена не больше чем наполовину
+    slots = array("I", bytes(4 * max(1, 2 * len(ordered))))
+    for number, key in enumerate(encoded):
+        slot = zlib.crc32(key) % len(slots)
+        while slots[slot]:
+            slot = (slot + 1) % len(slots)
+        slots[slot] = number + 1
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(
+            WordDictionary.HEADER.pack(
+                WordDictionary.MAGIC,
+                len(ordered),
+                len(slots),
+                sum(count for _, count in ordered),
+            )
+        )
+        array("I", (count for _, count in ordered)).tofile(file)
+        offsets.tofile(file)
+        slots.tofile(file)
+        file.write(b"".join(encoded))
+    os.replace(tmp_path, path)
+
+
+def catalog_words(db_name):
+    "Words of film titles and descriptions, person and genre names from the SQLite catalog."
+    counts = Counter()
+    with sqlite3.connect(f"file:{db_name}?mode=ro", uri=True) as connection:
+        # Все поля, по которым ищет API: слово любого из них не исправляется
+        for query in (
+            "SELECT title FROM film_work",
+            "SELECT description FROM film_work",
+            "SELECT full_name FROM person",
+            "SELECT name FROM genre",
+        ):
+            for (text,) in connection.execute(query):
+                counts.update(words(text or ""))
+    return counts
+
+
+class LazyWords(Mapping):
+    """
+    WORDS loaded on first use: the compiled dictionary if it exists,
+    otherwise counted from the text file
+    """
+
+    def __init__(self, dictionary_file, text_file):
+        self.dictionary_file = dictionary_file
+        self.text_file = text_file
+        self._words = None
+
+    def load(self):
+        if self._words is None:
+            if os.path.exists(self.dictionary_file):
+                self._words = WordDictionary(self.dictionary_file)
+            else:
+                with open(self.text_file) as file:
+                    self._words = Counter(words(file.read()))
+        return self._words
+
+    def __getitem__(self, word):
+        return self.load()[word]
+
+    def __contains__(self, word):
+        return word in self.load()
+
+    def __iter__(self):
+        return iter(self.load())
 
+    def __len__(self):
+        return len(self.load())
 
-def P(word, N=sum(WORDS.values())):
+    def total(self):
+        return self.load().total()
+
+    def most_common(self, n=None):
+        return self.load().most_common(n)
+
+
+WORDS = LazyWords(DICTIONARY_FILE, TEXT_FILE)
+
+
+def P(word, N=None):
     "Probability of `word`."
-    return WORDS[word] / N
+    return WORDS[word] / (N or WORDS.total())
 
 
 def correction(word):
@@ -57,6 +236,158 @@ def edits2(word):
     return (e2 for e1 in edits1(word) for e2 in edits1(e1))
 
 
+################ Symmetric Delete Corrector
+
+# Слова словаря и запрос сводятся к общим "удалениям": если расстояние между
+# ними не больше d, то у них есть общая строка, полученная удалением не более
+# d символов из каждого. Удаления словаря считаются один раз, а запрос
+# порождает O(n^d) строк вместо O((54n)^d) у edits2.
+
+
+def distance(a, b, limit):
+    "Damerau-Levenshtein distance between `a` and `b`, `limit + 1` if farther."
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    # Общие начало и конец не влияют на расстояние
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < len(a) - start and end < len(b) - start and a[-1 - end] == b[-1 - end]:
+        end += 1
+    a, b = a[start : len(a) - end], b[start : len(b) - end]
+    if not a or not b:
+        return min(len(a) + len(b), limit + 1)
+    # Lowrance-Wagner: a transposition may have edits between the swapped letters
+    far = len(a) + len(b)
+    rows = [[far] * (len(b) + 2)] + [
+        [far, i] + [far] * len(b) for i in range(len(a) + 1)
+    ]
+    rows[1] = [far] + list(range(len(b) + 1))
+    last_row = {}
+    for i in range(1, len(a) + 1):
+        # Клетки дальше `limit` от диагонали больше `limit`, они не считаются
+        low, high = max(1, i - limit), min(len(b), i + limit)
+        last_column = b.rfind(a[i - 1], 0, low - 1) + 1
+        row_min = i
+        for j in range(low, high + 1):
+            i1, j1 = last_row.get(b[j - 1], 0), last_column
+            cost = 1
+            if a[i - 1] == b[j - 1]:
+                cost, last_column = 0, j
+            value = min(
+                rows[i][j] + cost,
+                rows[i + 1][j] + 1,
+                rows[i][j + 1] + 1,
+                rows[i1][j1] + (i - i1 - 1) + 1 + (j - j1 - 1),
+            )
+            rows[i + 1][j + 1] = value
+            if value < row_min:
+                row_min = value
+        last_row[a[i - 1]] = i
+        # A transposition from an earlier row costs at least as much as
+        # reaching this row, so the row minimum never decreases
+        if row_min > limit:
+            return limit + 1
+    return min(rows[-1][-1], limit + 1)
+
+
+def deletes(word, depth):
+    "`word` and all strings `depth` or fewer deletions away from it."
+    result, frontier = {word}, {word}
+    for _ in range(depth):
+        frontier = {w[:i] + w[i + 1 :] for w in frontier for i in range(len(w))}
+        result |= frontier
+    return result
+
+
+class SymSpell:
+    "Symmetric delete index over a word counter, see https://github.com/wolfgarbe/SymSpell"
+
+    def __init__(self, counts, max_distance=2, prefix_length=7):
+        self.counts = counts
+        self.max_distance = max_distance
+        # Удаления считаются только для префикса, это ограничивает размер индекса
+        self.prefix_length = prefix_length
+        self.index = {}
+        for word in counts:
+            for key in deletes(word[:prefix_length], max_distance):
+                # Одно слово хранится строкой, несколько - списком
+                found = self.index.get(key)
+                if found is None:
+                    self.index[key] = word
+                elif isinstance(found, str):
+                    self.index[key] = [found, word]
+                else:
+                    found.append(word)
+
+    def candidates(self, word):
+        "Dictionary words within `max_distance` of `word`: {word: distance}."
+        if word in self.counts:
+            return {word: 0}
+        found = set()
+        for key in deletes(word[: self.prefix_length], self.max_distance):
+            words = self.index.get(key, ())
+            found.update((words,) if isinstance(words, str) else words)
+        return {
+            candidate: d
+            for candidate in found
+            if (d := distance(word, candidate, self.max_distance)) <= self.max_distance
+        }
+
+    def correction(self, word, max_distance=None):
+        "Most frequent word among the closest ones, like `correction`."
+        if word in self.counts:
+            return word
+        if max_distance is None or max_distance > self.max_distance:
+            max_distance = self.max_distance
+        best, best_distance, seen = word, max_distance + 1, set()
+        level = {word[: self.prefix_length]}
+        # Удаления запроса перебираются по уровням: слово на расстоянии d
+        # находится по ключу не более чем с d удалениями
+        for query_deletes in range(min(max_distance, len(word)) + 1):
+            if query_deletes > best_distance:
+                break
+            for key in level:
+                words = self.index.get(key, ())
+                for candidate in (words,) if isinstance(words, str) else words:
+                    if candidate in seen:
+                        continue
+                    limit = min(best_distance, max_distance)
+                    # Не меньше стольких правок нужно, чтобы свести оба слова к ключу
+                    deleted = min(len(candidate), self.prefix_length) - len(key)
+                    if max(query_deletes, deleted) > limit:
+                        continue
+                    seen.add(candidate)
+                    if abs(len(candidate) - len(word)) > limit:
+                        continue
+                    d = distance(word, candidate, limit)
+                    if d > limit:
+                        continue
+                    if (
+                        d < best_distance
+                        or self.counts[candidate] > self.counts[best]
+                        or (
+                            self.counts[candidate] == self.counts[best]
+                            and candidate < best
+                        )
+                    ):
+                        best, best_distance = candidate, d
+            level = {k[:i] + k[i + 1 :] for k in level for i in range(len(k))}
+        return best
+
+
+_symspell = None
+
+
+def fast_correction(word):
+    "`correction` answered from a SymSpell index built on first use."
+    global _symspell
+    if _symspell is None:
+        _symspell = SymSpell(WORDS)
+    return _symspell.correction(word)
+
+
 ################ Test Code
 
 
@@ -74,9 +405,13 @@ def unit_tests():
     assert Counter(words("This is a test. 123; A TEST this is.")) == (
         Counter({"123": 1, "a": 2, "is": 2, "test": 2, "this": 2})
     )
-    assert len(WORDS) == 32192
-    assert sum(WORDS.values()) == 1115504
-    assert WORDS.most_common(10) == [
+    # Числа ниже - слова big.txt, а скомпилированный словарь может
+    # содержать и слова каталога (--db)
+    with open(TEXT_FILE) as file:
+        text_words = Counter(words(file.read()))
+    assert len(text_words) == 32192
+    assert sum(text_words.values()) == 1115504
+    assert text_words.most_common(10) == [
         ("the", 79808),
         ("of", 40024),
         ("and", 38311),
@@ -88,17 +423,24 @@ def unit_tests():
         ("was", 11410),
         ("it", 10681),
     ]
-    assert WORDS["the"] == 79808
+    assert text_words["the"] == 79808
+    assert len(WORDS) >= len(text_words)
+    assert sum(WORDS.values()) == WORDS.total()
+    assert all(WORDS[word] >= count for word, count in text_words.items())
     assert P("quintessential") == 0
     assert 0.07 < P("the") < 0.08
+    for word in ("speling", "korrectud", "bycycle", "arrainged", "peotry", "word"):
+        assert fast_correction(word) == correction(word)
+    assert distance("peotryy", "poetry", 2) == 2
+    assert distance("abc", "xyzw", 2) == 3
     return "unit_tests pass"
 
 
-def spelltest(tests, verbose=False):
+def spelltest(tests, verbose=False, correction=correction):
     "Run correction(wrong) on all (right, wrong) pairs; report results."
     import time
 
-    start = time.clock()
+    start = time.perf_counter()
     good, unknown = 0, 0
     n = len(tests)
     for right, wrong in tests:
@@ -112,7 +454,7 @@ def spelltest(tests, verbose=False):
                         wrong, w, WORDS[w], right, WORDS[right]
                     )
                 )
-    dt = time.clock() - start
+    dt = time.perf_counter() - start
     print(
         "{:.0%} of {} correct ({:.0%} unknown) at {:.0f} words per second ".format(
             good / n, n, unknown / n, n / dt
@@ -130,6 +472,25 @@ def Testset(lines):
 
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Spelling corrector")
+    parser.add_argument(
+        "--build", metavar="FILE", help="compile the word dictionary into FILE"
+    )
+    parser.add_argument("--text", default=TEXT_FILE, help="text to count words in")
+    parser.add_argument("--db", help="SQLite catalog with titles and names to add")
+    args = parser.parse_args()
+    if args.build:
+        with open(args.text) as file:
+            counts = Counter(words(file.read()))
+        if args.db:
+            counts.update(catalog_words(args.db))
+        compile_dictionary(counts, args.build)
+        print(f"{len(counts)} words are written to {args.build}")
+        raise SystemExit
     print(unit_tests())
     spelltest(Testset(open("spell-testset1.txt")))
     spelltest(Testset(open("spell-testset2.txt")))
+    spelltest(Testset(open("spell-testset1.txt")), correction=fast_correction)
+    spelltest(Testset(open("spell-testset2.txt")), correction=fast_correction)
@@ -0,0 +1,202 @@
+import json
+import math
+from dataclasses import replace
+from typing import Any, Mapping
+
+from services.cursor import Cursor
+from services.movie import DETAIL_FIELDS
+from services.person import ROLES
+
+
+ERROR_INVALID_SORT_FIELD = json.dumps({"sort": ["id", "title", "imdb_rating"]})
+ERROR_INVALID_SORT_ORDER = json.dumps({"sort_order": ["asc", "desc"]})
+ERROR_INVALID_FIELD = "Invalid input"
+ERROR_INVALID_EXPORT_FIELD = json.dumps({"fields": list(DETAIL_FIELDS)})
+ERROR_INVALID_ROLE = json.dumps({"role": list(ROLES)})
+ERROR_INVALID_RATING_RANGE = json.dumps(
+    {"rating_from": "number", "rating_to": "number greater than rating_from"}
+)
+
+
+# Cursor fields holding the query, validated like the list parameters
+CURSOR_QUERY_FIELDS = (
+    "sort",
+    "sort_order",
+    "search",
+    "genre",
+    "rating_from",
+    "rating_to",
+)
+
+
+class ValidationError(Exception):
+    """Invalid request parameters, `body` is sent with 422 status"""
+
+    def __init__(self, body: str) -> None:
+        super().__init__(body)
+        self.body = body
+
+
+def _flag(args: Mapping[str, str], name: str) -> bool:
+    return args.get(name, "false").lower() == "true"
+
+
+def _rating(args: Mapping[str, str], name: str) -> float | None:
+    if (value := args.get(name)) in (None, ""):
+        return
+    try:
+        rating = float(value)
+    except (TypeError, ValueError):
+        raise ValidationError(ERROR_INVALID_RATING_RANGE)
+    if not math.isfinite(rating):
+        raise ValidationError(ERROR_INVALID_RATING_RANGE)
+    return rating
+
+
+def movie_filter_params(args: Mapping[str, str]) -> dict:
+    """Genre name and the [rating_from, rating_to) range of imdb_rating"""
+    rating_from, rating_to = _rating(args, "rating_from"), _rating(args, "rating_to")
+    if None not in (rating_from, rating_to) and rating_from >= rating_to:
+        raise ValidationError(ERROR_INVALID_RATING_RANGE)
+    genre = args.get("genre") or ""
+    if not isinstance(genre, str):
+        raise ValidationError(ERROR_INVALID_FIELD)
+    return {"genre": genre.strip(), "rating_from": rating_from, "rating_to": rating_to}
+
+
+def movies_list_params(args: Mapping[str, str]) -> dict:
+    try:
+        limit = int(args.get("limit", 50))
+        page = int(args.get("page", 1))
+    except (TypeError, ValueError):
+        raise ValidationError(ERROR_INVALID_FIELD)
+    if page < 1 or limit < 0:
+        raise ValidationError(ERROR_INVALID_FIELD)
+    sort = args.get("sort", "id")
+    if sort not in ("id", "title", "imdb_rating"):
+        raise ValidationError(ERROR_INVALID_SORT_FIELD)
+    sort_order = args.get("sort_order", "asc")
+    if sort_order not in ("asc", "desc"):
+        raise ValidationError(ERROR_INVALID_SORT_ORDER)
+    search = args.get("search", "")
+    if not isinstance(search, str):
+        raise ValidationError(ERROR_INVALID_FIELD)
+    return {
+        "page": page,
+        "limit": limit,
+        "sort": sort,
+        "sort_order": sort_order,
+        "search": search,
+        **movie_filter_params(args),
+    }
+
+
+def movies_cursor_params(args: Mapping[str, str]) -> dict:
+    """
+    Parameters of a cursor request: the first one starts from the query
+    parameters, the following ones continue the query stored in `cursor`
+    """
+    params = movies_list_params(args)
+    if token := args.get("cursor"):
+        try:
+            cursor = Cursor.decode(token)
+        except ValueError:
+            raise ValidationError(ERROR_INVALID_FIELD)
+        cursor = _checked_cursor(cursor)
+    else:
+        cursor = Cursor(
+            sort=params["sort"],
+            sort_order=params["sort_order"],
+            search=params["search"],
+            genre=params["genre"],
+            rating_from=params["rating_from"],
+            rating_to=params["rating_to"],
+        )
+    return {
+        "cursor": cursor,
+        "limit": params["limit"],
+        "pit": _flag(args, "pit"),
+    }
+
+
+def _checked_cursor(cursor: Cursor) -> Cursor:
+    """A decoded cursor may be hand-made: its query passes the list checks"""
+    query = {
+        name: value
+        for name in CURSOR_QUERY_FIELDS
+        if (value := getattr(cursor, name)) is not None
+    }
+    params = movies_list_params(query)
+    if not isinstance(cursor.after, (list, type(None))):
+        raise ValidationError(ERROR_INVALID_FIELD)
+    if not isinstance(cursor.pit, (str, type(None))):
+        raise ValidationError(ERROR_INVALID_FIELD)
+    return replace(cursor, **{name: params[name] for name in CURSOR_QUERY_FIELDS})
+
+
+def is_cursor_request(args: Mapping[str, str]) -> bool:
+    return "cursor" in args or _flag(args, "pit")
+
+
+def movies_batch_params(args: Mapping[str, str], max_ids: int) -> dict:
+    ids = [id_ for id_ in args.get("ids", "").split(",") if id_]
+    if not ids or len(ids) > max_ids:
+        raise ValidationError(ERROR_INVALID_FIELD)
+    return {"ids": ids}
+
+
+def movies_msearch_params(body: Any, max_queries: int) -> dict:
+    """
+    Body of a multi-search request: {"queries": [{<list parameters>}, ...]},
+    every query is validated like the parameters of the movies list
+    """
+    queries = body.get("queries") if isinstance(body, dict) else None
+    if not isinstance(queries, list) or not queries or len(queries) > max_queries:
+        raise ValidationError(ERROR_INVALID_FIELD)
+    if not all(isinstance(query, dict) for query in queries):
+        raise ValidationError(ERROR_INVALID_FIELD)
+    return {"queries": [movies_list_params(query) for query in queries]}
+
+
+def movies_export_params(args: Mapping[str, str]) -> dict:
+    """`fields` - comma separated projection of movie detail fields"""
+    fields = [field for field in args.get("fields", "").split(",") if field]
+    if not set(fields) <= set(DETAIL_FIELDS):
+        raise ValidationError(ERROR_INVALID_EXPORT_FIELD)
+    return {
+        "fields": fields or None,
+        "compress": _flag(args, "gzip"),
+    }
+
+
+def suggest_params(args: Mapping[str, str], max_limit: int) -> dict:
+    prefix = args.get("q", "")
+    try:
+        limit = int(args.get("limit", 10))
+    except ValueError:
+        raise ValidationError(ERROR_INVALID_FIELD)
+    if not prefix.strip() or not 0 < limit <= max_limit:
+        raise ValidationError(ERROR_INVALID_FIELD)
+    return {"prefix": prefix, "limit": limit}
+
+
+def page_params(args: Mapping[str, str], limit: int = 50) -> dict:
+    try:
+        limit = int(args.get("limit", limit))
+        page = int(args.get("page", 1))
+    except (TypeError, ValueError):
+        raise ValidationError(ERROR_INVALID_FIELD)
+    if page < 1 or limit < 0:
+        raise ValidationError(ERROR_INVALID_FIELD)
+    return {"page": page, "limit": limit}
+
+
+def persons_list_params(args: Mapping[str, str]) -> dict:
+    return {**page_params(args), "search": args.get("search", "")}
+
+
+def person_films_params(args: Mapping[str, str]) -> dict:
+    role = args.get("role") or None
+    if role is not None and role not in ROLES:
+        raise ValidationError(ERROR_INVALID_ROLE)
+    return {"role": role}